@@ -0,0 +1,53 @@
+"""
+Compares two benchmark result files written by run_benchmarks.py.
+
+Run for example with:
+poetry run python benchmarks/compare.py benchmarks/results/before.json benchmarks/results/after.json
+"""
+
+import sys
+import json
+
+def flatten_timings(results):
+    """Maps 'scenario.metric' to seconds for every timing in a result file."""
+    timings = {}
+    for scenario, values in results['scenarios'].items():
+        if 'seconds' in values:
+            timings[scenario] = values['seconds']
+        for name, value in values.items():
+            if isinstance(value, dict) and 'median_seconds' in value:
+                timings[f"{scenario}.{name}"] = value['median_seconds']
+    return timings
+
+def compare(before_path, after_path):
+    """
+    Prints the timings of both runs and the ratio after/before for every shared measurement.
+
+    Args:
+        before_path (str): Result file of the baseline run.
+        after_path (str): Result file of the run to compare.
+    """
+    with open(before_path, 'r', encoding="utf-8") as file:
+        before = json.load(file)
+    with open(after_path, 'r', encoding="utf-8") as file:
+        after = json.load(file)
+
+    for key in ('database', 'table', 'rows'):
+        if before['meta'][key] != after['meta'][key]:
+            print(f"warning: runs differ in {key}: {before['meta'][key]} vs {after['meta'][key]}")
+
+    before_timings = flatten_timings(before)
+    after_timings = flatten_timings(after)
+
+    print(f"{'measurement':<34}{'before [s]':>14}{'after [s]':>14}{'ratio':>10}")
+    for name in before_timings:
+        if name not in after_timings:
+            continue
+        ratio = after_timings[name] / before_timings[name] if before_timings[name] else float('nan')
+        print(f"{name:<34}{before_timings[name]:>14.4f}{after_timings[name]:>14.4f}{ratio:>10.2f}")
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: compare.py BEFORE.json AFTER.json")
+        sys.exit(1)
+    compare(sys.argv[1], sys.argv[2])
@@ -0,0 +1,150 @@
+# pylint: disable=line-too-long
+"""
+Synthetic, Eurostat-shaped data for the benchmarks.
+
+The generator reads a table definition from src/wifor_db/tables and produces a long frame
+with exactly the columns of that table, in the shape data_import.py produces after the melt:
+one row per combination of dimension codes, region and year, plus a value column.
+
+Dimension codes are taken from the Eurostat code lists of the LFS datasets, region codes
+from the NUTS 2021 table in src/geo_data. The frame is the cartesian product of the code
+lists, with as many regions and years as needed to reach the requested number of rows,
+so the same (table, rows, seed) always gives the same frame.
+"""
+
+import os
+import json
+import math
+import numpy as np
+import pandas as pd
+import shapely
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLES_DIR = os.path.join(BASE_DIR, 'src', 'wifor_db', 'tables')
+NUTS_PATH = os.path.join(BASE_DIR, 'src', 'geo_data', 'ref-nuts-2021', 'NUTS_AT_2021.csv')
+
+# Code lists of the LFS dimensions, abridged from the Eurostat dictionaries
+DIMENSION_CODES = {
+    'freq': ['A'],
+    'unit': ['THS_PER'],
+    'sex': ['F', 'M', 'T'],
+    'age': ['Y15-24', 'Y15-64', 'Y15-74', 'Y20-64', 'Y25-54', 'Y55-64', 'Y_GE15', 'Y_GE25'],
+    'nace_r2': ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O',
+                'P', 'Q', 'R', 'S', 'T', 'U', 'NRP', 'TOTAL'],
+    'isco08': ['OC0', 'OC1', 'OC2', 'OC3', 'OC4', 'OC5', 'OC6', 'OC7', 'OC8', 'OC9', 'NRP', 'TOTAL'],
+    'citizen': ['EU27_2020_FOR', 'EXT_EU27_2020', 'FOR', 'NAT', 'NRP', 'TOTAL'],
+    'duration': ['M_LT1', 'M1-2', 'M3-5', 'M6-11', 'M12-17', 'M18-23', 'M_GE24', 'NRP', 'TOTAL'],
+    'isced11': ['ED0-2', 'ED3_4', 'ED5-8', 'NRP', 'TOTAL'],
+    'mgstatus': ['FOR_EU27_2020', 'FOR_EXT_EU27_2020', 'NAT', 'TOTAL'],
+}
+
+FIRST_YEAR = 2023
+
+def load_table_json(table):
+    """Reads the JSON definition of a table, e.g. 'lfsa_egan'."""
+    with open(os.path.join(TABLES_DIR, f"{table.lower()}.json"), 'r', encoding="utf-8") as file:
+        return json.load(file)
+
+def nuts_codes():
+    """Returns the NUTS 2021 table shipped in src/geo_data, ordered by region code."""
+    nuts = pd.read_csv(NUTS_PATH, keep_default_na=False, na_values=[''])
+    return nuts.sort_values('NUTS_ID').reset_index(drop=True)
+
+def regions_frame():
+    """
+    Builds a frame for the REGIONS table from the NUTS 2021 table.
+
+    Returns:
+        pandas.DataFrame: One row per NUTS region with the REGIONS columns. The geometries
+        are boxes of 0.9 degrees laid out on a grid, one per region.
+    """
+    nuts = nuts_codes()
+    cells = np.arange(len(nuts))
+    west, south = cells % 360 - 180.0, (cells // 360) % 170 - 85.0
+    return pd.DataFrame({'nuts_id': nuts['NUTS_ID'],
+                         'levl_code': nuts['NUTS_ID'].str.len() - 2,
+                         'cntr_code': nuts['CNTR_CODE'],
+                         'name_latin': nuts['NAME_LATN'],
+                         'nuts_name': nuts['NUTS_NAME'],
+                         'mount_type': pd.to_numeric(nuts['MOUNT_TYPE'], errors='coerce'),
+                         'urban_type': pd.to_numeric(nuts['URBN_TYPE'], errors='coerce'),
+                         'coast_type': pd.to_numeric(nuts['COAST_TYPE'], errors='coerce'),
+                         'fid': nuts['NUTS_ID'],
+                         'geometry': shapely.box(west, south, west + 0.9, south + 0.9)})
+
+def _region_codes(count):
+    """Real NUTS codes first, then synthetic ZZ codes if more regions are needed."""
+    codes = nuts_codes()['NUTS_ID'].tolist()
+    if count > len(codes):
+        codes += [f"ZZ{number:05d}" for number in range(count - len(codes))]
+    return codes[:count]
+
+def generate_frame(table, rows, seed=42, max_years=34):
+    """
+    Generates a long frame with the columns of a table.
+
+    Args:
+        table (str): Name of the table JSON, e.g. 'lfsa_egan'.
+        rows (int): Number of rows to generate.
+        seed (int): Seed of the random values.
+        max_years (int): Years used before more regions are added.
+
+    Returns:
+        pandas.DataFrame: Frame with the table's columns and exactly rows rows.
+    """
+    rows = int(rows)
+    definition = load_table_json(table)
+    columns = definition['columns']
+    value_columns = [column['name'] for column in columns if column['type'] == 'Float']
+    dimensions = [column['name'] for column in columns
+                  if column['type'].startswith('String') and column['name'] != 'nuts_id']
+
+    code_lists = {name: DIMENSION_CODES.get(name, [f"{name.upper()}{i}" for i in range(5)]) for name in dimensions}
+    combinations = math.prod(len(codes) for codes in code_lists.values())
+
+    # Regions and years grow until the cartesian product holds the requested rows
+    cells = math.ceil(rows / combinations)
+    years = min(max_years, cells)
+    code_lists['nuts_id'] = _region_codes(math.ceil(cells / years))
+    code_lists['year'] = pd.to_datetime([str(FIRST_YEAR - offset) for offset in range(years)], format='%Y')
+
+    # Mixed radix decomposition of the row number, the last dimension varies fastest
+    order = ['nuts_id', 'year'] + dimensions
+    frame = {}
+    index = np.arange(rows, dtype=np.int64)
+    for name in reversed(order):
+        codes = code_lists[name]
+        positions = index % len(codes)
+        index = index // len(codes)
+        if name == 'year':
+            frame[name] = codes[positions]
+        else:
+            frame[name] = pd.Categorical.from_codes(positions, categories=list(codes))
+
+    rng = np.random.default_rng(seed)
+    for name in value_columns:
+        frame[name] = np.round(rng.gamma(2.0, 50.0, rows), 1)
+    if any(column['name'] == 'flags' for column in columns):
+        # Mostly unflagged cells, the rest provisional (64), low reliability (512) or both
+        frame['flags'] = rng.choice(np.array([0, 64, 512, 576], dtype=np.int16), rows, p=[0.85, 0.08, 0.05, 0.02])
+
+    return pd.DataFrame(frame)[[column['name'] for column in columns]]
+
+def change_cells(frame, share, seed=43):
+    """
+    Returns a copy of frame where a share of the value cells is changed, as in a Eurostat revision.
+
+    Args:
+        frame (pandas.DataFrame): Frame from generate_frame.
+        share (float): Share of rows whose values change, between 0 and 1.
+        seed (int): Seed of the row selection and the new values.
+
+    Returns:
+        tuple: The changed frame and a boolean mask of the changed rows.
+    """
+    rng = np.random.default_rng(seed)
+    changed = frame.copy()
+    mask = rng.random(len(frame)) < share
+    for name in frame.columns[frame.dtypes == np.float64]:
+        changed.loc[mask, name] = np.round(changed.loc[mask, name] * rng.uniform(0.9, 1.1, mask.sum()), 1)
+    return changed, mask
@@ -2,17 +2,17 @@
 
 import eurostat
 import pandas as pd
+from wifor_db.eurostat_toc import TocStore
 
-toc = eurostat.get_toc()
-toc[0]
-toc[12:15]
+# Inhaltsverzeichnis, lokal gespeichert und nur neu geladen wenn älter als ein Tag
+toc_store = TocStore()
 
 # Liste aller verfügbaren Datensätze
-toc_df = eurostat.get_toc_df()
+toc_df = toc_store.frame()
 toc_df
 
-# Liste durchsuchen nach Keyword
-f = eurostat.subset_toc_df(toc_df, "employment")
+# Liste durchsuchen nach Keywords (Volltextsuche, nach Relevanz sortiert, mit Datum der letzten Aktualisierung)
+f = toc_store.search("employment")
 
 # Import Dataset as pandas dataframe zum Thema employment (beliebig erweiterbar)
 ###### WICHTIG: Beim Hinzufügen neuer Links, diese immer hinten einfügen!!!! ####
@@ -4,3 +4,5 @@ interacting with the regions data in the database.
 """
 
 __version__ = '1.0.0'
+
+from .geo_export import to_geo
@@ -0,0 +1,155 @@
+# pylint: disable=line-too-long
+"""
+Region adjacency of the NUTS 2021 regions, derived from the boundary lines.
+
+NUTS_RG_BN_01M_2021.csv lists for every boundary segment (NUTS_BN_CODE) the regions on
+either side of it, at every level: a segment between two NUTS 3 regions appears with both
+NUTS 3 regions and with their NUTS 2, NUTS 1 and country codes. Two regions of a level are
+neighbours if they share a segment, so the adjacency of a level follows from grouping the
+mapping by segment, without any polygon operations.
+
+Coastlines and the outer borders of the NUTS area are segments with a region on one side
+only, so they never make two regions neighbours and every adjacency is one over land.
+Whether a segment crosses a country border follows from the mapping.
+
+Matrices are symmetric scipy.sparse CSR matrices over the regions of the level in code order
+(see RegionAdjacency.regions) and are cached as .npz in the geo cache (GEO_CACHE_DIR).
+
+Example:
+    adjacency = load_adjacency(3)
+    adjacency.neighbours("DE212")
+    cross_border = load_adjacency(2, cross_border=True).to_frame()
+"""
+
+# Standard library imports
+import os
+import json
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Local application imports
+from geo_data.geo_export import REF_DIR, region_keys, geo_cache_dir
+
+BOUNDARY_MAPPING_PATH = os.path.join(REF_DIR, 'NUTS_RG_BN_01M_2021.csv')
+
+_adjacencies = {}
+
+class RegionAdjacency:
+    """Sparse adjacency matrix of the regions of one NUTS level with label lookups."""
+
+    def __init__(self, level, regions, matrix):
+        self.level = level
+        self.regions = pd.Index(regions, name='nuts_id')
+        self.matrix = sparse.csr_matrix(matrix)
+        self._codes = self.regions.to_numpy()
+        self._positions = {code: position for position, code in enumerate(self.regions)}
+
+    def __repr__(self):
+        return f"<RegionAdjacency NUTS {self.level} ({len(self.regions)} regions, {self.matrix.nnz // 2} borders)>"
+
+    def position(self, nuts_id):
+        """Row of a region in the matrix."""
+        if nuts_id not in self._positions:
+            raise KeyError(f"{nuts_id} is not a NUTS {self.level} region")
+        return self._positions[nuts_id]
+
+    def neighbours(self, nuts_id):
+        """Codes of the neighbours of a region, read from its row of the CSR matrix."""
+        position = self.position(nuts_id)
+        indices = self.matrix.indices[self.matrix.indptr[position]:self.matrix.indptr[position + 1]]
+        return self._codes[indices].tolist()
+
+    def are_neighbours(self, nuts_id, other):
+        """True if the two regions share a boundary segment."""
+        return other in self._positions and self.position(other) in self.matrix.indices[
+            self.matrix.indptr[self.position(nuts_id)]:self.matrix.indptr[self.position(nuts_id) + 1]]
+
+    def degree(self):
+        """Number of neighbours per region."""
+        return pd.Series(np.diff(self.matrix.indptr), index=self.regions, name='neighbours')
+
+    def to_frame(self):
+        """Edge list with one row per neighbouring pair (nuts_id < neighbour_id)."""
+        upper = sparse.triu(self.matrix, k=1).tocoo()
+        return pd.DataFrame({'nuts_id': self.regions[upper.row], 'neighbour_id': self.regions[upper.col]})
+
+def _boundary_mapping():
+    """Segment to region mapping with the level of every region."""
+    mapping = pd.read_csv(BOUNDARY_MAPPING_PATH, dtype={'NUTS_CODE': str, 'NUTS_BN_CODE': np.int64}, keep_default_na=False)
+    mapping['level'] = mapping['NUTS_CODE'].str.len() - 2
+    return mapping
+
+def build_adjacency(level, cross_border=None):
+    """
+    Derives the adjacency matrix of a NUTS level from the boundary segment mapping.
+
+    Args:
+        level (int): NUTS level 0 to 3.
+        cross_border (bool, optional): True keeps only pairs in different countries, False only
+            pairs in the same country, None keeps both.
+
+    Returns:
+        RegionAdjacency: The adjacency of the level.
+    """
+    regions = region_keys()[region_keys().str.len() == level + 2]
+    mapping = _boundary_mapping()
+    mapping = mapping[mapping['level'] == level]
+
+    # Segments with a region on both sides, as (first side, second side) pairs
+    mapping = mapping.sort_values(['NUTS_BN_CODE', 'NUTS_CODE'])
+    segments = mapping['NUTS_BN_CODE'].to_numpy()
+    codes = pd.Categorical(mapping['NUTS_CODE'], categories=regions).codes
+    shared = np.flatnonzero(segments[1:] == segments[:-1])
+    first, second = codes[shared], codes[shared + 1]
+
+    # Segments inside a region of this level are no borders at this level
+    keep = first != second
+    if cross_border is not None:
+        countries = regions.str[:2].to_numpy()
+        keep &= (countries[first] != countries[second]) == cross_border
+    first, second = first[keep], second[keep]
+
+    matrix = sparse.coo_matrix((np.ones(2 * len(first), dtype=np.int8),
+                                (np.concatenate([first, second]), np.concatenate([second, first]))),
+                               shape=(len(regions), len(regions))).tocsr()
+    # Regions sharing several segments are still one neighbour
+    matrix.data[:] = 1
+    return RegionAdjacency(level, regions, matrix)
+
+def _cache_path(level, cross_border):
+    suffix = {None: 'any', True: 'cross', False: 'domestic'}[cross_border]
+    return os.path.join(geo_cache_dir(), 'adjacency', f"nuts_{level}_{suffix}")
+
+def load_adjacency(level, cross_border=None):
+    """
+    Adjacency of a NUTS level, read from the geo cache or built and cached on first use.
+
+    Args:
+        level (int): NUTS level 0 to 3.
+        cross_border (bool, optional): Filter on pairs across country borders, see build_adjacency.
+
+    Returns:
+        RegionAdjacency: The adjacency of the level.
+    """
+    key = (level, cross_border)
+    if key in _adjacencies:
+        return _adjacencies[key]
+
+    path = _cache_path(level, cross_border)
+    if os.path.exists(path + '.npz') and os.path.exists(path + '.json'):
+        with open(path + '.json', 'r', encoding="utf-8") as file:
+            regions = json.load(file)['regions']
+        adjacency = RegionAdjacency(level, regions, sparse.load_npz(path + '.npz'))
+    else:
+        adjacency = build_adjacency(level, cross_border)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        sparse.save_npz(path + '.npz', adjacency.matrix)
+        with open(path + '.json', 'w', encoding="utf-8") as file:
+            json.dump({'level': level, 'cross_border': cross_border,
+                       'regions': adjacency.regions.tolist()}, file)
+
+    _adjacencies[key] = adjacency
+    return adjacency
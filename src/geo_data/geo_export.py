@@ -0,0 +1,222 @@
+# pylint: disable=line-too-long
+"""
+Choropleth-ready export of fact tables and frames onto the NUTS 2021 region geometries.
+
+The geometry side is prepared once per (level, crs, simplify) and cached: the region polygons
+are read from the NUTS_RG file, reprojected, simplified and stored as GeoParquet in the geo
+cache (GEO_CACHE_DIR, defaults to BASE_DIR/geo_cache) together with every geometry already
+serialized as GeoJSON text. Regions are identified by an integer region key, the position of
+the region in the sorted NUTS 2021 code list (see region_keys), so joining values onto the
+geometries is a vectorized position lookup instead of a string merge.
+
+GeoJSON output is streamed feature by feature from the cached geometry text, FlatGeobuf is
+written through GDAL. With the cache in place, a NUTS 3 map of about 1 100 regions is written
+in milliseconds.
+
+Example:
+    with TABLE_CONNECTOR() as tc:
+        egan = tc.open_table("lfsa_egan")
+        to_geo(egan, level=0, crs=3035, simplify=1000, path="egan.geojson",
+               filters={'sex': 'T', 'age': 'Y15-64', 'citizen': 'TOTAL'})
+
+    rates = to_geo(frame, level=2)   # GeoDataFrame
+"""
+
+# Standard library imports
+import os
+import json
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Local application imports
+from wifor_db import _env_cache
+
+REF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ref-nuts-2021')
+NUTS_CODES_PATH = os.path.join(REF_DIR, 'NUTS_AT_2021.csv')
+# Same source as the REGIONS table in data_import.py
+REGIONS_SOURCE = os.path.join(REF_DIR, 'NUTS_RG_01M_2021_4326.geojson')
+
+# Columns of the fact tables that are not exported
+VERSION_COLUMNS = ['id', 'version_number', 'effective_date', 'expiry_date']
+
+_region_keys = None
+_geometry_sets = {}
+
+def region_keys():
+    """
+    Sorted NUTS 2021 codes of all levels. The position of a code is its integer region key.
+
+    Returns:
+        pandas.Index: The region codes.
+    """
+    global _region_keys  # pylint: disable=global-statement
+    if _region_keys is None:
+        codes = pd.read_csv(NUTS_CODES_PATH, usecols=['NUTS_ID'], keep_default_na=False)['NUTS_ID']
+        _region_keys = pd.Index(np.sort(codes.unique()), name='nuts_id')
+    return _region_keys
+
+def to_region_key(nuts_ids):
+    """Integer region keys of NUTS codes, -1 for codes that are not NUTS 2021 regions."""
+    return pd.Categorical(nuts_ids, categories=region_keys()).codes.astype(np.int32)
+
+def geo_cache_dir():
+    return _env_cache.get('GEO_CACHE_DIR') or os.path.join(_env_cache['BASE_DIR'], 'geo_cache')
+
+def _cache_path(level, crs, simplify):
+    return os.path.join(geo_cache_dir(), 'geometries', f"nuts_{level}_{crs}_{simplify or 0}.parquet")
+
+def _read_regions(level, source=None):
+    """Reads the region polygons of a level from the NUTS_RG file."""
+    source = source or _env_cache.get('NUTS_RG_PATH') or REGIONS_SOURCE
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"NUTS region polygons not found at {source}, set NUTS_RG_PATH")
+    regions = gpd.read_file(source, columns=['NUTS_ID', 'LEVL_CODE'])
+    regions = regions[regions['LEVL_CODE'] == level]
+    return gpd.GeoDataFrame({'nuts_id': regions['NUTS_ID'].to_numpy()}, geometry=regions.geometry.to_numpy(), crs=regions.crs)
+
+def build_geometry_set(level, crs=4326, simplify=None, source=None):
+    """
+    Prepares the geometries of a NUTS level and writes them to the geo cache.
+
+    Args:
+        level (int): NUTS level 0 to 3.
+        crs (int): EPSG code of the output, e.g. 4326 or 3035.
+        simplify (float, optional): Simplification tolerance in units of crs. Shared borders
+            stay shared, as the regions are simplified together as a coverage.
+        source (str, optional): NUTS_RG file, defaults to NUTS_RG_PATH or REGIONS_SOURCE.
+
+    Returns:
+        geopandas.GeoDataFrame: nuts_id, region_key, geojson and the geometry, ordered by region key.
+    """
+    regions = _read_regions(level, source).to_crs(epsg=crs)
+    if simplify:
+        regions['geometry'] = shapely.coverage_simplify(regions.geometry.to_numpy(), simplify)
+
+    regions['region_key'] = to_region_key(regions['nuts_id'])
+    regions = regions[regions['region_key'] >= 0].sort_values('region_key').reset_index(drop=True)
+    # GeoJSON text of every geometry, so exports only concatenate strings
+    regions['geojson'] = shapely.to_geojson(regions.geometry.to_numpy())
+
+    path = _cache_path(level, crs, simplify)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    regions[['nuts_id', 'region_key', 'geojson', 'geometry']].to_parquet(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return regions
+
+def geometry_set(level, crs=4326, simplify=None, source=None):
+    """
+    Cached geometries of a NUTS level, built on first use.
+
+    Returns:
+        geopandas.GeoDataFrame: nuts_id, region_key, geojson and the geometry, ordered by region key.
+    """
+    key = (level, crs, simplify)
+    if key not in _geometry_sets:
+        path = _cache_path(level, crs, simplify)
+        _geometry_sets[key] = gpd.read_parquet(path) if os.path.exists(path) else build_geometry_set(level, crs, simplify, source)
+    return _geometry_sets[key]
+
+def values_frame(table_or_frame, columns=None, filters=None):
+    """
+    Frame of a TABLE_CONNECTOR table (current rows) or a frame, without the versioning columns,
+    ready for join_geometries.
+
+    Args:
+        table_or_frame: Table class created by TABLE_CONNECTOR.open_table or a DataFrame with nuts_id.
+        columns (list): Columns to keep, nuts_id is always kept. Defaults to all columns.
+        filters (dict): Filters of read_frame, only used for tables.
+
+    Returns:
+        pandas.DataFrame: The values without versioning and geometry columns.
+    """
+    # nuts_id is the join key, it is read even if only value columns are asked for
+    if columns is not None:
+        columns = list(dict.fromkeys(['nuts_id'] + list(columns)))
+    if isinstance(table_or_frame, pd.DataFrame):
+        data = table_or_frame
+    else:
+        data = table_or_frame.read_frame(columns=columns, filters=filters)
+    data = data.drop(columns=[column for column in VERSION_COLUMNS if column in data.columns])
+    if isinstance(data, gpd.GeoDataFrame):
+        data = pd.DataFrame(data.drop(columns=data.geometry.name))
+    if columns is not None:
+        data = data[columns]
+    return data
+
+def join_geometries(data, geometries):
+    """
+    Joins values onto geometries by region key. Rows of other levels or unknown regions are dropped.
+
+    Returns:
+        tuple: The joined rows of data and the positions of their geometries in geometries.
+    """
+    # Region key -> row of the geometry set, -1 where the level has no such region
+    lookup = np.full(len(region_keys()), -1, dtype=np.int64)
+    lookup[geometries['region_key'].to_numpy()] = np.arange(len(geometries))
+
+    keys = to_region_key(data['nuts_id'])
+    positions = np.where(keys >= 0, lookup[keys], -1)
+    matched = positions >= 0
+    return data[matched].reset_index(drop=True), positions[matched]
+
+def iter_geojson(data, geometries, positions, chunk_features=1000):
+    """
+    Yields a GeoJSON FeatureCollection as text chunks.
+
+    Args:
+        data (pandas.DataFrame): Properties of the features.
+        geometries (geopandas.GeoDataFrame): Geometry set with the geojson column.
+        positions (numpy.ndarray): Row in geometries for every row of data.
+        chunk_features (int): Features per yielded chunk.
+
+    Yields:
+        str: Parts of the GeoJSON document.
+    """
+    geometry_text = geometries['geojson'].to_numpy()
+    yield '{"type": "FeatureCollection", "crs": ' + json.dumps({'type': 'name', 'properties': {'name': geometries.crs.to_string()}}) + ', "features": [\n'
+    for start in range(0, len(data), chunk_features):
+        chunk = data.iloc[start:start + chunk_features]
+        properties = chunk.to_json(orient='records', lines=True, date_format='iso').splitlines()
+        features = [f'{{"type": "Feature", "properties": {props}, "geometry": {geometry}}}'
+                    for props, geometry in zip(properties, geometry_text[positions[start:start + chunk_features]])]
+        yield (',\n' if start else '') + ',\n'.join(features)
+    yield '\n]}\n'
+
+def to_geo(table_or_frame, level, crs=4326, simplify=None, path=None, driver=None, columns=None, filters=None):
+    """
+    Joins a fact table or frame onto the cached region geometries of a NUTS level.
+
+    Args:
+        table_or_frame: TABLE_CONNECTOR table class or frame with a 'nuts_id' column.
+        level (int): NUTS level 0 to 3. Rows of other levels are left out.
+        crs (int): EPSG code of the output.
+        simplify (float, optional): Simplification tolerance in units of crs.
+        path (str, optional): Output file. Without a path a GeoDataFrame is returned.
+        driver (str, optional): 'GeoJSON' or 'FlatGeobuf', defaults by file extension.
+        columns (list, optional): Columns to export, defaults to all but the versioning columns.
+        filters (dict, optional): Filters passed to read_frame for tables.
+
+    Returns:
+        geopandas.GeoDataFrame or str: The joined frame, or the path of the written file.
+    """
+    geometries = geometry_set(level, crs, simplify)
+    data, positions = join_geometries(values_frame(table_or_frame, columns, filters), geometries)
+
+    if path is None:
+        return gpd.GeoDataFrame(data, geometry=geometries.geometry.to_numpy()[positions], crs=geometries.crs)
+
+    driver = driver or ('FlatGeobuf' if path.endswith('.fgb') else 'GeoJSON')
+    if driver == 'GeoJSON':
+        with open(path, 'w', encoding="utf-8") as file:
+            for part in iter_geojson(data, geometries, positions):
+                file.write(part)
+    elif driver == 'FlatGeobuf':
+        frame = gpd.GeoDataFrame(data, geometry=geometries.geometry.to_numpy()[positions], crs=geometries.crs)
+        frame.to_file(path, driver='FlatGeobuf')
+    else:
+        raise ValueError(f"Unsupported driver: {driver}")
+    return path
@@ -0,0 +1,104 @@
+# pylint: disable=line-too-long
+"""
+Nearest-region lookups on the NUTS 2021 label points.
+
+The NUTS_LB_2021_3035 layers hold one label point per region and level in the metric
+ETRS89-LAEA projection (EPSG:3035). RegionPointIndex builds a scipy cKDTree over the points
+of a level, so locations (e.g. geocoded firms or job ads) can be snapped to the nearest
+regions in batches, with distances in metres. This approximates the region of a location by
+its closest label point and is meant for cases where exact polygon tests are unnecessary.
+
+Example:
+    index = region_index(3)
+    codes, distances = index.nearest([[13.40, 52.52], [11.58, 48.14]])          # lon/lat
+    candidates = index.within_radius(points, 25000)                              # 25 km
+"""
+
+# Standard library imports
+import os
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+# Local application imports
+from geo_data.geo_export import REF_DIR
+
+METRIC_CRS = 3035
+
+_indexes = {}
+
+def _to_metric(points, crs):
+    """Coordinates of points as (n, 2) array in EPSG:3035."""
+    if isinstance(points, (gpd.GeoSeries, gpd.GeoDataFrame)):
+        points = points.to_crs(epsg=METRIC_CRS)
+        return np.column_stack([points.geometry.x, points.geometry.y])
+
+    coordinates = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if crs != METRIC_CRS:
+        transformer = Transformer.from_crs(crs, METRIC_CRS, always_xy=True)
+        coordinates = np.column_stack(transformer.transform(coordinates[:, 0], coordinates[:, 1]))
+    return coordinates
+
+class RegionPointIndex:
+    """KD-tree over the label points of the regions of one NUTS level."""
+
+    def __init__(self, level):
+        self.level = level
+        points = gpd.read_file(os.path.join(REF_DIR, f"NUTS_LB_2021_{METRIC_CRS}_LEVL_{level}.geojson"), columns=['NUTS_ID'])
+        self.regions = points['NUTS_ID'].to_numpy()
+        self.tree = cKDTree(np.column_stack([points.geometry.x, points.geometry.y]))
+
+    def __repr__(self):
+        return f"<RegionPointIndex NUTS {self.level} ({len(self.regions)} regions)>"
+
+    def nearest(self, points, k=1, crs=4326, max_distance=np.inf):
+        """
+        Nearest regions of a batch of points.
+
+        Args:
+            points: (n, 2) coordinates in crs (x/lon first), or a GeoSeries/GeoDataFrame of points.
+            k (int): Number of regions per point.
+            crs (int): EPSG code of plain coordinates, defaults to lon/lat.
+            max_distance (float): Regions further away than this (in metres) are not returned.
+
+        Returns:
+            tuple: Region codes and distances in metres, shaped (n,) for k=1 and (n, k) otherwise.
+                Missing neighbours have code None and distance inf.
+        """
+        distances, positions = self.tree.query(_to_metric(points, crs), k=k, distance_upper_bound=max_distance)
+        found = positions < len(self.regions)
+        codes = np.where(found, self.regions[np.where(found, positions, 0)], None)
+        return codes, distances
+
+    def within_radius(self, points, radius, crs=4326):
+        """
+        All regions whose label point lies within radius of each point.
+
+        Args:
+            points: (n, 2) coordinates in crs (x/lon first), or a GeoSeries/GeoDataFrame of points.
+            radius (float): Radius in metres.
+            crs (int): EPSG code of plain coordinates, defaults to lon/lat.
+
+        Returns:
+            pandas.DataFrame: One row per (point, region) pair with the position of the point,
+                'nuts_id' and 'distance' in metres, ordered by point and distance.
+        """
+        coordinates = _to_metric(points, crs)
+        matches = self.tree.query_ball_point(coordinates, radius)
+        counts = np.fromiter((len(match) for match in matches), dtype=np.intp, count=len(matches))
+        point = np.repeat(np.arange(len(coordinates)), counts)
+        positions = np.fromiter((position for match in matches for position in match), dtype=np.intp, count=counts.sum())
+
+        distance = np.hypot(*(coordinates[point] - self.tree.data[positions]).T)
+        frame = pd.DataFrame({'point': point, 'nuts_id': self.regions[positions], 'distance': distance})
+        return frame.sort_values(['point', 'distance'], kind='stable').reset_index(drop=True)
+
+def region_index(level):
+    """KD-tree index of a NUTS level, built once per process."""
+    if level not in _indexes:
+        _indexes[level] = RegionPointIndex(level)
+    return _indexes[level]
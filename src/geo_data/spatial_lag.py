@@ -0,0 +1,176 @@
+# pylint: disable=line-too-long
+"""
+Spatial lag and neighbourhood aggregation over the NUTS region adjacency.
+
+All operators work on a (region x series) matrix: the rows are the regions of an adjacency
+(see geo_data.adjacency), the columns every combination of the other dimensions, e.g. all
+years, sexes and NACE sections at once. A spatial lag is then one sparse matrix product
+W @ X for the whole dataset instead of a Python loop over regions.
+
+Inputs are long frames with a 'nuts_id' column (one value column, the other columns are the
+series dimensions) or labelled arrays with a 'nuts_id' dimension (LabelledArray from to_array,
+Cube from the cube store). The result has the same form as the input. Rows of regions of
+other levels are left out, missing values are skipped: averages are taken over the
+neighbours with a value, and stay missing if no neighbour has one.
+
+Example:
+    adjacency = load_adjacency(3)
+    lagged = spatial_lag(frame, adjacency, value_column='employed')
+    second_ring = neighbour_sum(frame, adjacency, k=2, value_column='employed')
+"""
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Local application imports
+from wifor_db.labelled_array import LabelledArray, frame_positions, NON_DIMENSIONS
+
+def weights_matrix(adjacency, style='row'):
+    """
+    Spatial weights of an adjacency.
+
+    Args:
+        adjacency (RegionAdjacency): Adjacency of a NUTS level.
+        style (str): 'row' for row-standardized weights (rows sum to 1), 'binary' for 0/1 weights.
+
+    Returns:
+        scipy.sparse.csr_matrix: Weights, regions without neighbours have an empty row.
+    """
+    weights = adjacency.matrix.astype(np.float64)
+    if style == 'binary':
+        return weights
+    if style != 'row':
+        raise ValueError(f"Unsupported weights style: {style}")
+    degree = np.asarray(weights.sum(axis=1)).ravel()
+    scale = np.divide(1.0, degree, out=np.zeros_like(degree), where=degree > 0)
+    return sparse.diags(scale) @ weights
+
+def order_matrix(adjacency, k, cumulative=True):
+    """
+    Neighbours up to (or exactly at) k steps along the adjacency, without the region itself.
+
+    Args:
+        adjacency (RegionAdjacency): Adjacency of a NUTS level.
+        k (int): Order, 1 are the direct neighbours.
+        cumulative (bool): True for all orders 1..k, False for exactly order k.
+
+    Returns:
+        scipy.sparse.csr_matrix: 0/1 matrix of the k-order neighbours.
+    """
+    step = adjacency.matrix.astype(bool).tocsr()
+    identity = sparse.identity(step.shape[0], dtype=bool, format='csr')
+    reached = identity
+    previous = identity
+    for _ in range(k):
+        previous = reached
+        reached = (reached + reached @ step).astype(bool)
+    result = reached.astype(np.int8) - (identity if cumulative else previous).astype(np.int8)
+    result.eliminate_zeros()
+    return result.astype(np.float64).tocsr()
+
+def _frame_to_matrix(data, regions, value_column):
+    """Pivots a long frame to a (region x series) matrix, NaN where a cell is missing."""
+    series_dims = [column for column in data.columns if column not in ('nuts_id', value_column) and column not in NON_DIMENSIONS]
+    rows = pd.Categorical(data['nuts_id'], categories=regions).codes
+    data = data[rows >= 0]
+    rows = rows[rows >= 0]
+
+    # Integer codes per dimension combined into one series number per row
+    factorized = [pd.factorize(data[dim], use_na_sentinel=False) for dim in series_dims]
+    sizes = [len(labels) for _, labels in factorized] or [1]
+    codes = [dim_codes for dim_codes, _ in factorized] or [np.zeros(len(data), dtype=np.intp)]
+    series_numbers, columns = np.unique(np.ravel_multi_index(codes, sizes), return_inverse=True)
+    positions = np.unravel_index(series_numbers, sizes)
+    series = pd.DataFrame({dim: labels[position] for dim, (_, labels), position in zip(series_dims, factorized, positions)},
+                          index=pd.RangeIndex(len(series_numbers)))
+
+    matrix = np.full((len(regions), len(series)), np.nan)
+    matrix[rows, columns] = data[value_column].to_numpy(dtype=np.float64, na_value=np.nan)
+    return matrix, series, series_dims
+
+def _matrix_to_frame(matrix, regions, series, series_dims, value_column):
+    """Long frame of a (region x series) matrix without the missing cells."""
+    rows, columns = np.nonzero(~np.isnan(matrix))
+    frame = pd.DataFrame({'nuts_id': np.asarray(regions)[rows]})
+    for dim in series_dims:
+        frame[dim] = series[dim].to_numpy()[columns]
+    frame[value_column] = matrix[rows, columns]
+    return frame
+
+def _array_to_matrix(array, regions):
+    """Moves the nuts_id axis of a labelled array to the front and aligns it to regions."""
+    axis = array.dims.index('nuts_id')
+    values = np.moveaxis(np.asarray(array.values, dtype=np.float64), axis, 0)
+    rows = pd.Categorical(array.coords['nuts_id'], categories=regions).codes
+    matrix = np.full((len(regions),) + values.shape[1:], np.nan)
+    matrix[rows[rows >= 0]] = values[rows >= 0]
+    return matrix.reshape(len(regions), -1), values.shape[1:]
+
+def _apply(data, adjacency, value_column, operator):
+    """Runs operator on the (region x series) matrix of data and returns the result in the form of data."""
+    regions = adjacency.regions
+    if isinstance(data, pd.DataFrame):
+        matrix, series, series_dims = _frame_to_matrix(data, regions, value_column)
+        return _matrix_to_frame(operator(matrix), regions, series, series_dims, value_column)
+
+    matrix, series_shape = _array_to_matrix(data, regions)
+    other_dims = [dim for dim in data.dims if dim != 'nuts_id']
+    values = operator(matrix).reshape((len(regions),) + series_shape)
+    coords = dict(data.coords, nuts_id=list(regions))
+    return LabelledArray(['nuts_id'] + other_dims, coords, values)
+
+def _weighted_average(weights, matrix):
+    """Weighted average over the non-missing neighbours, NaN if all neighbours are missing."""
+    present = ~np.isnan(matrix)
+    total = weights @ np.where(present, matrix, 0.0)
+    weight = weights @ present.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(weight > 0, total / weight, np.nan)
+
+def _weighted_sum(weights, matrix):
+    """Weighted sum over the non-missing neighbours, NaN if all neighbours are missing."""
+    present = ~np.isnan(matrix)
+    total = weights @ np.where(present, matrix, 0.0)
+    return np.where(weights @ present.astype(np.float64) > 0, total, np.nan)
+
+def spatial_lag(data, adjacency, value_column='value', style='row'):
+    """
+    Spatial lag W @ x of every series.
+
+    Args:
+        data: Long frame with 'nuts_id' and value_column, or labelled array with a 'nuts_id' dimension.
+        adjacency (RegionAdjacency): Adjacency of the level of the regions.
+        value_column (str): Value column of a long frame.
+        style (str): 'row' (average of the neighbours) or 'binary' (sum of the neighbours).
+
+    Returns:
+        Same form as data with the lagged values.
+    """
+    weights = weights_matrix(adjacency, style)
+    if style == 'row':
+        return _apply(data, adjacency, value_column, lambda matrix: _weighted_average(weights, matrix))
+    return _apply(data, adjacency, value_column, lambda matrix: _weighted_sum(weights, matrix))
+
+def neighbourhood_average(data, adjacency, value_column='value', include_self=False):
+    """
+    Average over the neighbours of every region, optionally including the region itself.
+
+    Returns:
+        Same form as data with the averages.
+    """
+    weights = adjacency.matrix.astype(np.float64)
+    if include_self:
+        weights = weights + sparse.identity(weights.shape[0], format='csr')
+    return _apply(data, adjacency, value_column, lambda matrix: _weighted_average(weights, matrix))
+
+def neighbour_sum(data, adjacency, value_column='value', k=1, cumulative=True):
+    """
+    Sum over the neighbours up to order k (or exactly order k), without the region itself.
+
+    Returns:
+        Same form as data with the sums.
+    """
+    weights = order_matrix(adjacency, k, cumulative)
+    return _apply(data, adjacency, value_column, lambda matrix: _weighted_sum(weights, matrix))
@@ -15,3 +15,4 @@ get_env()
 __all__ = ['_env_cache']
 
 from .sql_handler import TABLE_CONNECTOR
+from .async_handler import AsyncTableConnector
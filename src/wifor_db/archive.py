@@ -0,0 +1,190 @@
+# pylint: disable=line-too-long
+"""
+Compaction of expired row versions into Parquet archives.
+
+Every revision loaded through the versioning of TABLE_CONNECTOR expires the previous version
+of a row, and the expired versions stay in the table. compact_table moves the versions that
+expired more than retention_days ago out of the table into zstd compressed Parquet files:
+
+    <ARCHIVE_DIR>/<TABLE>/expiry_year=<year>/part-<first id>-<last id>.parquet
+
+ARCHIVE_DIR defaults to BASE_DIR/archive. The rows are moved in batches of batch_rows in id
+order: each batch is written to its files first and then deleted from the table in one
+transaction, so a failed run leaves every row in the table, the archive or both, never in
+neither. Rerunning the compaction after a failure is safe.
+
+read_frame(as_of=...) reads the archived versions valid on the date together with the table
+(only the partitions that expired on or after the date are opened) and drops rows found in
+both by id, so as-of reads return the same data before and after a compaction. history
+reads the archived versions of its keys from every partition in the same way.
+
+Run for example with:
+poetry run wifor-db compact lfsa_egan --retention-days 730
+"""
+
+# Standard library imports
+import os
+import glob
+from datetime import date, datetime, timedelta
+
+# Third-party imports
+import pandas as pd
+from sqlalchemy import select, delete
+
+# Local application imports
+from wifor_db import _env_cache
+from wifor_db import duckdb_backend
+from wifor_db.eurostat_flags import flag_mask
+from wifor_db.generations import bump_generation
+from wifor_db.spatial import geometry_columns, sync_spatial_index
+
+DEFAULT_RETENTION_DAYS = 365
+BATCH_ROWS = 50000
+PARTITION_PREFIX = 'expiry_year='
+
+def archive_dir():
+    return _env_cache.get('ARCHIVE_DIR') or os.path.join(_env_cache['BASE_DIR'], 'archive')
+
+def table_archive_dir(cls, directory=None):
+    """Directory of the archive partitions of a table."""
+    return os.path.join(directory or archive_dir(), cls.__tablename__)
+
+def _archive_columns(cls):
+    return ['id'] + list(cls.__column_names__) + ['version_number', 'effective_date', 'expiry_date']
+
+def _read_statement(session, statement):
+    if duckdb_backend.is_duckdb(session):
+        return duckdb_backend.read_frame(session, statement)
+    result = session.execute(statement)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+def _write_batch(batch, table_dir, compression):
+    """Writes one batch into the partitions of its expiry years, returns the written paths."""
+    paths = []
+    expiry_years = pd.to_datetime(batch['expiry_date']).dt.year
+    for year, part in batch.groupby(expiry_years):
+        partition = os.path.join(table_dir, f"{PARTITION_PREFIX}{year}")
+        os.makedirs(partition, exist_ok=True)
+        # Named after the id range, so a rerun of the same batch replaces the file
+        path = os.path.join(partition, f"part-{part['id'].min():012d}-{part['id'].max():012d}.parquet")
+        part.to_parquet(path + '.tmp', index=False, compression=compression)
+        os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+def compact_table(connector, cls, retention_days=DEFAULT_RETENTION_DAYS, batch_rows=BATCH_ROWS,
+                  directory=None, compression='zstd'):
+    """
+    Moves the row versions of a table that expired before the retention window into the archive.
+
+    Args:
+        connector (TABLE_CONNECTOR): Open connector.
+        cls: Mapped table class created by open_table.
+        retention_days (int): Expired versions stay in the table for this many days.
+        batch_rows (int): Rows written and deleted per transaction.
+        directory (str, optional): Archive directory, defaults to ARCHIVE_DIR.
+        compression (str): Parquet compression codec.
+
+    Returns:
+        int: Number of archived rows.
+    """
+    session = connector.session
+    table_name = cls.__tablename__
+    table_dir = table_archive_dir(cls, directory)
+    cutoff = date.today() - timedelta(days=retention_days)
+    expired = cls.expiry_date < cutoff
+    columns = [getattr(cls, column) for column in _archive_columns(cls)]
+
+    archived = 0
+    while True:
+        with connector.metrics.stage("archive_read", table_name) as stage:
+            batch = _read_statement(session, select(*columns).where(expired).order_by(cls.id).limit(batch_rows))
+            stage.rows = len(batch)
+        if batch.empty:
+            break
+
+        with connector.metrics.stage("archive_write", table_name, rows=len(batch)):
+            paths = _write_batch(batch, table_dir, compression)
+        with connector.metrics.stage("archive_delete", table_name, rows=len(batch)):
+            first_id, last_id = int(batch['id'].min()), int(batch['id'].max())
+            session.execute(delete(cls.__table__).where(expired, cls.id.between(first_id, last_id)))
+            bump_generation(session, table_name)
+            session.commit()
+
+        archived += len(batch)
+        connector.log.info("archived %s rows of %s (ids %s to %s) to %s", len(batch), table_name, first_id, last_id, ', '.join(paths))
+
+    if archived and geometry_columns(cls.__table__):
+        sync_spatial_index(session, cls.__table__)
+    connector.log.info("compaction of %s: %s rows expired before %s archived", table_name, archived, cutoff)
+    return archived
+
+def _partition_paths(cls, directory=None, first_year=None):
+    """Parquet files of the archive of a table, of the partitions from first_year on if given."""
+    table_dir = table_archive_dir(cls, directory)
+    return [path for partition in sorted(glob.glob(os.path.join(table_dir, f"{PARTITION_PREFIX}*")))
+            if first_year is None or int(os.path.basename(partition)[len(PARTITION_PREFIX):]) >= first_year
+            for path in sorted(glob.glob(os.path.join(partition, '*.parquet')))]
+
+def read_archived(cls, as_of, filters=None, exclude_flags=None, directory=None):
+    """
+    Reads the archived row versions of a table valid on a date.
+
+    Args:
+        cls: Mapped table class created by open_table.
+        as_of (datetime.date): Date the versions are valid on.
+        filters (dict, optional): Column name to value or list of values, as in read_frame.
+        exclude_flags (str, optional): Eurostat flag letters, as in read_frame.
+        directory (str, optional): Archive directory, defaults to ARCHIVE_DIR.
+
+    Returns:
+        pandas.DataFrame or None: Archived rows with all columns including id, None if no
+        archive partition can hold versions valid on as_of.
+    """
+    if isinstance(as_of, datetime):
+        as_of = as_of.date()
+    # Versions valid on as_of expired on or after it
+    paths = _partition_paths(cls, directory, first_year=as_of.year)
+    if not paths:
+        return None
+
+    # Validity and filters are applied while reading, so only the matching rows of every file are loaded
+    parquet_filters = [('effective_date', '<=', as_of), ('expiry_date', '>=', as_of)]
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            parquet_filters.append((column, 'in', list(value)))
+        else:
+            parquet_filters.append((column, '==', value))
+    archived = pd.concat([pd.read_parquet(path, filters=parquet_filters) for path in paths], ignore_index=True)
+    if exclude_flags:
+        # The flags are a bitmask, which the Parquet filters cannot test
+        archived = archived[(archived['flags'] & flag_mask(exclude_flags)) == 0]
+    return archived.reset_index(drop=True)
+
+def read_archived_history(cls, keys, directory=None):
+    """
+    Reads all archived row versions of identifier values of a table.
+
+    Args:
+        cls: Mapped table class created by open_table.
+        keys (list): Values of the unique identifier column.
+        directory (str, optional): Archive directory, defaults to ARCHIVE_DIR.
+
+    Returns:
+        pandas.DataFrame or None: Archived rows with all columns including id, None if the
+        table has no archive.
+    """
+    paths = _partition_paths(cls, directory)
+    if not paths:
+        return None
+    identifier = cls.__unique_identifier__
+    # Only the rows of the keys are read from every file
+    archived = pd.concat([pd.read_parquet(path, filters=[(identifier, 'in', list(keys))]) for path in paths], ignore_index=True)
+    return archived.reset_index(drop=True)
+
+def merge_archived(frame, archived, columns):
+    """Appends archived rows to a frame read with an id column, without rows present in both."""
+    # Empty parts would turn the column types of the other part into object
+    parts = [part for part in (frame, archived[list(frame.columns)]) if not part.empty] or [frame]
+    combined = pd.concat(parts, ignore_index=True)
+    return combined.drop_duplicates('id').reset_index(drop=True)[list(columns)]
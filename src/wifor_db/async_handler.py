@@ -0,0 +1,212 @@
+# pylint: disable=line-too-long
+"""
+Asynchronous counterpart of TABLE_CONNECTOR built on SQLAlchemy's asyncio extension.
+
+Tables are opened from the same JSON definitions as in TABLE_CONNECTOR, so the mapped
+classes are identical; only the methods attached to them are coroutines. Every read runs
+on its own session from the connector's session factory, which allows several queries to
+be awaited concurrently with gather_frames.
+
+The async driver is derived from CURRENT_DB: aiosqlite for sqlite, asyncpg for postgres
+and aiomysql for mysql. aiosqlite and asyncpg come with the async extra
+(pip install wifor-platform[async]), aiomysql has to be installed separately. DuckDB has no
+async driver, use TABLE_CONNECTOR for it.
+
+The JSON definitions are mapped and new rows versioned by a TABLE_CONNECTOR the async
+connector wraps without opening it. The bulk-load mode and parallel_load work on synchronous
+connections, the async connector has neither; run full loads with TABLE_CONNECTOR.
+
+Example:
+    async with AsyncTableConnector() as tc:
+        lfsa_egan = tc.open_table("lfsa_egan")
+        frames = await tc.gather_frames({
+            "de": (lfsa_egan, {"nuts_id": "DE"}),
+            "at": (lfsa_egan, {"nuts_id": "AT"}),
+        })
+"""
+
+# Standard library imports
+import asyncio
+
+# Third-party imports
+import pandas as pd
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Local application imports
+from wifor_db import open_log, close_log
+from wifor_db import spatial
+from wifor_db import archive
+from wifor_db.import_metrics import ImportMetrics
+from wifor_db.generations import generations, bump_generation
+from wifor_db.sql_handler import TABLE_CONNECTOR, get_db_url_from_env, build_frame_query
+
+# Async drivers replacing the synchronous drivers of get_db_url_from_env, keyed by backend
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+def get_async_db_url_from_env(db_url=None):
+    """
+    Builds the async database URL for a database URL or the database selected with CURRENT_DB.
+
+    Args:
+        db_url (str, optional): Database URL with a synchronous or async driver, e.g. sqlite:///wifor.db.
+            Defaults to the URL of CURRENT_DB.
+
+    Returns:
+        sqlalchemy.engine.URL: Database URL using the async driver of the backend.
+
+    Raises:
+        ValueError: If there is no async driver for the backend.
+    """
+    db_url = make_url(db_url or get_db_url_from_env())
+    backend = db_url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database type: {backend}")
+    return db_url.set(drivername=ASYNC_DRIVERS[backend])
+
+#############################################################################################
+##################################Class Definition###########################################
+#############################################################################################
+
+class AsyncTableConnector:
+    def __init__(self, max_concurrency=10, metrics=None, db_url=None):
+        self.log = open_log("ASYNC_CONNECTOR_LOG")
+        self.metrics = metrics if metrics is not None else ImportMetrics("ASYNC_CONNECTOR")
+        # Database of CURRENT_DB unless another URL is given, synchronous drivers are swapped for async ones
+        self.db_url = db_url
+        # Maps the JSON definitions and versions new rows, never opened, so it has no engine of its own
+        self.tables = TABLE_CONNECTOR(metrics=self.metrics)
+        self.engine = None
+        self.session = None
+        self.session_factory = None
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+
+    async def __aenter__(self):
+        self.log.info("OPEN ASYNC CONNECTOR LOG")
+        self.engine = create_async_engine(get_async_db_url_from_env(self.db_url))
+        self.metrics.attach_engine(self.engine.sync_engine)
+        async with self.engine.begin() as connection:
+            await connection.run_sync(generations.create, checkfirst=True)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.session = self.session_factory()
+        self.tables.register_before_flush_event(self.session.sync_session)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.log.info("async session created")
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.session:
+            await self.session.close()
+            self.log.info("async session closed")
+        if self.engine:
+            self.metrics.detach_engine(self.engine.sync_engine)
+            await self.engine.dispose()
+        # Closes the log of the wrapped connector, it holds no session or engine
+        self.tables.__exit__(exc_type, exc_value, traceback)
+        if self.log:
+            self.log.info("CLOSE ASYNC CONNECTOR LOG")
+            close_log(self.log)
+
+    def open_table(self, class_name, table_name=None):
+        dynamic_class = self.tables.build_table_class(class_name, table_name)
+
+        self.add_class_methods(dynamic_class)
+
+        return dynamic_class
+
+#############################################################################################
+    async def read_frame(self, cls, columns=None, filters=None, exclude_flags=None, as_of=None):
+        """
+        Reads the current rows of a table, or the rows valid on a date, into a DataFrame on a dedicated session.
+
+        Args:
+            cls: Mapped table class returned by open_table.
+            columns (list, optional): Column names to return. Defaults to all schema columns.
+            filters (dict, optional): Column name to value, or to a list of values.
+            exclude_flags (str, optional): Eurostat flag letters whose rows are left out.
+            as_of (datetime.date, optional): Read the row versions valid on this date,
+                including the archived ones (see archive.compact_table).
+
+        Returns:
+            pandas.DataFrame: The selected rows.
+        """
+        # The archive is read from files, off the event loop
+        archived = None if as_of is None else await asyncio.to_thread(archive.read_archived, cls, as_of, filters, exclude_flags)
+        columns = columns or cls.__column_names__
+        query_columns = columns if archived is None else list(dict.fromkeys(['id'] + list(columns)))
+
+        statement = build_frame_query(cls, query_columns, filters, exclude_flags, as_of)
+        async with self.semaphore:
+            async with self.session_factory() as session:
+                result = await session.execute(statement)
+                frame = pd.DataFrame(result.all(), columns=list(result.keys()))
+        return frame if archived is None else archive.merge_archived(frame, archived, columns)
+
+    async def gather_frames(self, queries):
+        """
+        Runs several read_frame queries concurrently.
+
+        Args:
+            queries (dict or list): Query specs of the form (cls, filters) or (cls, filters, columns),
+                either keyed by name or as a list.
+
+        Returns:
+            dict or list: DataFrames keyed like the input, or in input order for a list.
+        """
+        keys = list(queries) if isinstance(queries, dict) else None
+        specs = list(queries.values()) if keys is not None else list(queries)
+
+        frames = await asyncio.gather(*(
+            self.read_frame(spec[0], spec[2] if len(spec) > 2 else None, spec[1])
+            for spec in specs
+        ))
+
+        if keys is None:
+            return list(frames)
+        return dict(zip(keys, frames))
+
+#############################################################################################
+    def add_class_methods(self, cls):
+        connector = self
+
+        @classmethod
+        async def init_table(cls):
+            async with connector.engine.begin() as connection:
+                await connection.run_sync(cls.metadata.create_all, tables=[cls.__table__])
+
+        cls.init_table = init_table
+
+        @classmethod
+        async def add_data(cls, data):
+            table_name = cls.__tablename__
+            has_geometry = bool(spatial.geometry_columns(cls.__table__))
+            with connector.metrics.stage("to_dict", table_name, rows=len(data)):
+                frame = data[cls.__column_names__]
+                if has_geometry:
+                    frame = spatial.to_wkb_frame(frame, cls.__table__, connector.engine.dialect.name)
+                records = frame.to_dict(orient='records')
+
+            with connector.metrics.stage("insert", table_name, rows=len(records)):
+                await connector.session.run_sync(lambda sync_session: sync_session.bulk_insert_mappings(cls, records))
+                await connector.session.run_sync(bump_generation, table_name)
+            with connector.metrics.stage("commit", table_name):
+                await connector.session.commit()
+            if has_geometry:
+                with connector.metrics.stage("spatial_index", table_name):
+                    await connector.session.run_sync(lambda sync_session: spatial.sync_spatial_index(sync_session, cls.__table__))
+
+        cls.add_data = add_data
+
+        @classmethod
+        async def read_frame(cls, columns=None, filters=None, exclude_flags=None, as_of=None):
+            return await connector.read_frame(cls, columns, filters, exclude_flags, as_of)
+
+        cls.read_frame = read_frame
+
+#############################################################################################
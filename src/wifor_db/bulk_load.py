@@ -0,0 +1,197 @@
+# pylint: disable=line-too-long
+"""
+Bulk-load mode of TABLE_CONNECTOR for full imports.
+
+Inside the mode the database does as little work per inserted row as possible:
+    indexes:      the secondary indexes of the tables (columns with "index": true and the GIST
+                  index of geometry columns) are dropped and rebuilt once at the end.
+    constraints:  foreign keys are dropped (PostgreSQL) or not checked (SQLite, MySQL) and
+                  added again at the end.
+    settings:     SQLite runs in WAL mode with synchronous=OFF and a 256 MB page cache,
+                  PostgreSQL with synchronous_commit=off, without autovacuum on the tables and
+                  with empty tables switched to UNLOGGED until the load is done.
+On exit, also after errors, the indexes and constraints are rebuilt, the settings restored and
+the tables analyzed, so the planner has statistics for the new data.
+
+The settings apply to every connection checked out of the connector's engine during the mode;
+the pooled connections are closed on exit, so later connections start with the defaults again.
+With synchronous=OFF / synchronous_commit=off a crash can lose the last commits of the load,
+but never corrupt the database: rerun the load in that case.
+
+Example:
+    with TABLE_CONNECTOR() as tc:
+        table = tc.open_table("lfsa_egan")
+        table.init_table()
+        with tc.bulk_load_mode(tables=[table]):
+            for chunk in chunks:
+                table.add_data(chunk)
+"""
+
+# Standard library imports
+from contextlib import contextmanager
+
+# Third-party imports
+from sqlalchemy import event, inspect, text, select, exists
+
+# Local application imports
+from wifor_db.spatial import geometry_columns, spatial_index_statement
+
+# Statements run on every connection checked out during the mode, by dialect
+FAST_SETTINGS = {
+    'sqlite': ["PRAGMA synchronous = OFF", "PRAGMA cache_size = -262144", "PRAGMA temp_store = MEMORY", "PRAGMA foreign_keys = OFF"],
+    'postgresql': ["SET synchronous_commit TO off"],
+    'mysql': ["SET foreign_key_checks = 0", "SET unique_checks = 0"],
+}
+
+def _analyze_statement(dialect_name, table_name):
+    if dialect_name == 'mysql':
+        return f"ANALYZE TABLE `{table_name}`"
+    return f'ANALYZE "{table_name}"'
+
+def _resolve_tables(connector, tables):
+    """Table objects of table classes or JSON names, without mapping opened tables a second time."""
+    if not tables:
+        return list(connector.Base.metadata.sorted_tables)
+    resolved = []
+    for table in tables:
+        if isinstance(table, str):
+            table_name = connector.load_class_json(connector, table)['table_name']
+            if table_name not in connector.Base.metadata.tables:
+                connector.open_table(table)
+            resolved.append(connector.Base.metadata.tables[table_name])
+        else:
+            resolved.append(table.__table__)
+    return resolved
+
+def _apply_settings(statements):
+    """Checkout listener running the fast-load settings on a connection."""
+    def apply(dbapi_connection, connection_record, connection_proxy):  # pylint: disable=unused-argument
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    return apply
+
+class _TableState:
+    """What was switched off for one table and has to be restored."""
+
+    def __init__(self, table):
+        self.table = table
+        self.indexes = []
+        self.spatial_columns = []
+        self.foreign_keys = []
+        self.unlogged = False
+
+def _prepare_table(connection, table, log):
+    """Drops the indexes and constraints of a table and applies the per-table settings."""
+    state = _TableState(table)
+    dialect_name = connection.dialect.name
+    inspector = inspect(connection)
+    live_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+
+    for index in table.indexes:
+        if index.name in live_indexes:
+            index.drop(connection)
+            state.indexes.append(index)
+            live_indexes.discard(index.name)
+
+    if dialect_name == 'postgresql':
+        for column in geometry_columns(table):
+            if f"ix_{table.name}_{column.name}_gist" in live_indexes:
+                connection.execute(text(f'DROP INDEX "ix_{table.name}_{column.name}_gist"'))
+                state.spatial_columns.append(column.name)
+
+        for foreign_key in inspector.get_foreign_keys(table.name):
+            connection.execute(text(f'ALTER TABLE "{table.name}" DROP CONSTRAINT "{foreign_key["name"]}"'))
+            state.foreign_keys.append(foreign_key)
+
+        connection.execute(text(f'ALTER TABLE "{table.name}" SET (autovacuum_enabled = false)'))
+        # Rewriting a filled table as UNLOGGED would cost more than it saves
+        if not connection.execute(select(exists().select_from(table))).scalar():
+            connection.execute(text(f'ALTER TABLE "{table.name}" SET UNLOGGED'))
+            state.unlogged = True
+
+    log.info("bulk load mode for %s: dropped %s indexes, %s foreign keys, unlogged=%s",
+             table.name, len(state.indexes) + len(state.spatial_columns), len(state.foreign_keys), state.unlogged)
+    return state
+
+def _restore_table(connection, state, log):
+    """Rebuilds the indexes and constraints of a table, restores its settings and analyzes it."""
+    table = state.table
+    dialect_name = connection.dialect.name
+
+    for index in state.indexes:
+        index.create(connection, checkfirst=True)
+    for column_name in state.spatial_columns:
+        connection.execute(text(spatial_index_statement(dialect_name, table.name, column_name)))
+
+    if dialect_name == 'postgresql':
+        if state.unlogged:
+            connection.execute(text(f'ALTER TABLE "{table.name}" SET LOGGED'))
+        connection.execute(text(f'ALTER TABLE "{table.name}" RESET (autovacuum_enabled)'))
+        for foreign_key in state.foreign_keys:
+            columns = ', '.join(f'"{column}"' for column in foreign_key['constrained_columns'])
+            referred = ', '.join(f'"{column}"' for column in foreign_key['referred_columns'])
+            connection.execute(text(f'ALTER TABLE "{table.name}" ADD CONSTRAINT "{foreign_key["name"]}" '
+                                    f'FOREIGN KEY ({columns}) REFERENCES "{foreign_key["referred_table"]}" ({referred})'))
+
+    connection.execute(text(_analyze_statement(dialect_name, table.name)))
+    log.info("bulk load mode for %s: rebuilt %s indexes and analyzed", table.name, len(state.indexes) + len(state.spatial_columns))
+
+@contextmanager
+def bulk_load_mode(connector, tables=None):
+    """
+    Runs the enclosed loads with indexes, constraints and durability settings relaxed.
+
+    Args:
+        connector (TABLE_CONNECTOR): Open connector whose engine and session do the load.
+        tables (list, optional): Table classes or names of table JSONs to load into,
+            defaults to all tables opened on the connector.
+
+    Yields:
+        TABLE_CONNECTOR: The connector.
+    """
+    engine = connector.engine
+    dialect_name = engine.dialect.name
+    table_objects = _resolve_tables(connector, tables)
+
+    # Earlier work of the session must not end up in the transactions below
+    connector.session.commit()
+
+    journal_mode = None
+    if dialect_name == 'sqlite':
+        with engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+            connection.exec_driver_sql("PRAGMA journal_mode = WAL")
+
+    listener = _apply_settings(FAST_SETTINGS.get(dialect_name, []))
+    event.listen(engine, 'checkout', listener)
+    # Pooled connections get the settings on their next checkout
+    engine.dispose()
+
+    states = []
+    try:
+        with connector.metrics.stage("bulk_load_prepare"):
+            with engine.begin() as connection:
+                for table in table_objects:
+                    if inspect(connection).has_table(table.name):
+                        states.append(_prepare_table(connection, table, connector.log))
+        yield connector
+    except BaseException:
+        # After a failed load the session needs a rollback, a commit would raise and hide the error
+        connector.session.rollback()
+        raise
+    else:
+        connector.session.commit()
+    finally:
+        try:
+            event.remove(engine, 'checkout', listener)
+            engine.dispose()
+        finally:
+            with connector.metrics.stage("bulk_load_finish"):
+                with engine.begin() as connection:
+                    for state in states:
+                        _restore_table(connection, state, connector.log)
+                if journal_mode is not None and journal_mode.lower() != 'wal':
+                    with engine.connect() as connection:
+                        connection.exec_driver_sql(f"PRAGMA journal_mode = {journal_mode}")
@@ -0,0 +1,92 @@
+"""
+Command line entry point of wifor_db.
+
+Run for example with:
+poetry run wifor-db compile-schemas
+poetry run wifor-db indicators unemployment_rate --force
+poetry run wifor-db compact lfsa_egan --retention-days 730
+poetry run wifor-db toc-search employment nace --limit 10
+poetry run wifor-db codelists lfsa_egan --lang de
+"""
+
+import os
+import glob
+import argparse
+
+from wifor_db import TABLE_CONNECTOR, _env_cache
+from wifor_db.model_compiler import compile_schemas, DEFAULT_OUTPUT
+from wifor_db.indicators import IndicatorEngine
+from wifor_db.archive import compact_table, DEFAULT_RETENTION_DAYS, BATCH_ROWS
+from wifor_db.eurostat_toc import TocStore
+from wifor_db.eurostat_codelists import CodeListStore, dataset_dimensions
+
+def main(argv=None):
+    """Parses the command line and runs the selected command."""
+    parser = argparse.ArgumentParser(prog="wifor-db", description="Tools for the wifor_platform database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compile_parser = commands.add_parser("compile-schemas", help="compile the table JSON schemas into a models module")
+    compile_parser.add_argument("--class-dir", help="directory of the table JSONs, defaults to CLASS_DIR")
+    compile_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="path of the generated module")
+
+    indicator_parser = commands.add_parser("indicators", help="compute the derived indicators whose inputs changed")
+    indicator_parser.add_argument("names", nargs="*", help="indicators to compute, defaults to all")
+    indicator_parser.add_argument("--indicator-dir", help="directory of the indicator JSONs, defaults to INDICATOR_DIR")
+    indicator_parser.add_argument("--force", action="store_true", help="compute even if the stored result is current")
+
+    compact_parser = commands.add_parser("compact", help="move expired row versions into the Parquet archive")
+    compact_parser.add_argument("tables", nargs="*", help="table JSONs to compact, defaults to all in CLASS_DIR")
+    compact_parser.add_argument("--retention-days", type=int, default=DEFAULT_RETENTION_DAYS, help="days expired versions stay in the table")
+    compact_parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="rows moved per transaction")
+    compact_parser.add_argument("--archive-dir", help="archive directory, defaults to ARCHIVE_DIR")
+
+    toc_parser = commands.add_parser("toc-search", help="search the cached Eurostat table of contents")
+    toc_parser.add_argument("words", nargs="+", help="words the code or title must contain")
+    toc_parser.add_argument("--limit", type=int, default=20, help="maximum number of hits")
+    toc_parser.add_argument("--any", action="store_true", help="match any instead of all words")
+    toc_parser.add_argument("--lang", default="en", help="language of the titles")
+    toc_parser.add_argument("--refresh", action="store_true", help="download the table of contents even if the cache is current")
+
+    codelist_parser = commands.add_parser("codelists", help="download the Eurostat code lists of the dimensions of tables")
+    codelist_parser.add_argument("tables", nargs="+", help="table JSONs, named after their Eurostat dataset")
+    codelist_parser.add_argument("--lang", default="en", help="language of the labels")
+    codelist_parser.add_argument("--force", action="store_true", help="download cached code lists again")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compile-schemas":
+        tables = compile_schemas(args.class_dir, args.output)
+        print(f"compiled {len(tables)} schemas to {args.output}")
+
+    elif args.command == "indicators":
+        with TABLE_CONNECTOR() as tc:
+            computed = IndicatorEngine(tc, args.indicator_dir).compute_all(args.names or None, args.force)
+        for name, was_computed in computed.items():
+            print(f"{name}: {'computed' if was_computed else 'current'}")
+
+    elif args.command == "compact":
+        names = args.tables or [os.path.splitext(os.path.basename(path))[0]
+                                for path in sorted(glob.glob(os.path.join(_env_cache['CLASS_DIR'], '*.json')))]
+        with TABLE_CONNECTOR() as tc:
+            for name in names:
+                table = tc.open_table(name)
+                table.init_table()
+                archived = compact_table(tc, table, args.retention_days, args.batch_rows, args.archive_dir)
+                print(f"{name}: {archived} rows archived")
+
+    elif args.command == "toc-search":
+        toc = TocStore(args.lang)
+        toc.refresh(force=args.refresh)
+        hits = toc.search(" ".join(args.words), args.limit, 'any' if args.any else 'all')
+        for hit in hits.itertuples():
+            print(f"{hit.code:<20} {str(hit.last_update)[:10]:<10}  {hit.title}")
+
+    elif args.command == "codelists":
+        codelists = CodeListStore()
+        with TABLE_CONNECTOR() as tc:
+            for name in args.tables:
+                fetched = codelists.fetch(name, dataset_dimensions(tc.open_table(name)), args.lang, args.force)
+                print(f"{name}: {', '.join(fetched) or 'all cached'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# pylint: disable=line-too-long
+"""
+Local store of dense, memory-mapped cubes of the Eurostat datasets.
+
+A cube holds one dataset as an N-dimensional array over its dimensions, e.g.
+(nuts_id x nace_r2 x sex x age x year), with NaN for missing observations. Every dataset is
+kept in its own directory below the store root:
+    meta.json:   dimension order, code list of every dimension, value column.
+    values.npy:  float64 array of the values.
+    flags.npy:   int16 array of the Eurostat flags bitmask, if the dataset has flags.
+
+The arrays are standard .npy files opened with mmap_mode='r', so slicing reads only the
+touched pages, and processes opening the same cube share them through the page cache.
+Cubes are written once after an import into a temporary directory and moved into place,
+so readers never see a half-written cube.
+
+Example:
+    store = CubeStore()
+    store.write_frame("lfsa_egan2", data, value_column="employed")
+    cube = store.open("lfsa_egan2")
+    de_total = cube.sel(nuts_id="DE", sex="T", nace_r2=["A", "B", "C"])
+"""
+
+# Standard library imports
+import os
+import json
+import shutil
+import tempfile
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from wifor_db import _env_cache
+from wifor_db.labelled_array import LabelledArray, NON_DIMENSIONS, frame_positions, table_dimensions
+
+class Cube:
+    """Labelled view on a (memory-mapped) array. Selections keep the labels of the remaining dimensions."""
+
+    def __init__(self, name, dims, coords, values, flags=None):
+        self.name = name
+        self.dims = list(dims)
+        self.coords = {dim: list(coords[dim]) for dim in self.dims}
+        self.values = values
+        self.flags = flags
+        self._positions = {dim: {label: position for position, label in enumerate(labels)} for dim, labels in self.coords.items()}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __repr__(self):
+        sizes = ', '.join(f"{dim}: {len(self.coords[dim])}" for dim in self.dims)
+        return f"<Cube {self.name} ({sizes})>"
+
+    def _indexer(self, dim, labels):
+        """Position, slice or position array of labels along a dimension."""
+        positions = self._positions[dim]
+        if isinstance(labels, slice):
+            start = positions[labels.start] if labels.start is not None else None
+            stop = positions[labels.stop] + 1 if labels.stop is not None else None
+            return slice(start, stop)
+        if not isinstance(labels, (list, tuple, np.ndarray, pd.Index)):
+            return positions[labels]
+
+        selected = np.array([positions[label] for label in labels], dtype=np.intp)
+        # Ascending, gap-free positions are a slice, which keeps the result a view
+        if len(selected) and np.all(np.diff(selected) == 1):
+            return slice(int(selected[0]), int(selected[-1]) + 1)
+        return selected
+
+    def sel(self, **labels):
+        """
+        Selects by labels. A single label drops the dimension, a list of labels or a slice of
+        labels (inclusive) keeps it.
+
+        Selections made of single labels, slices and consecutive label lists are views on the
+        memory map without a copy; other label lists copy the selected part.
+
+        Args:
+            **labels: Dimension name to a label, a list of labels or a slice of labels.
+
+        Returns:
+            Cube: Cube of the selection.
+        """
+        values = self.values
+        flags = self.flags
+        dims = []
+        coords = {}
+        axis = 0
+        for dim in self.dims:
+            if dim not in labels:
+                dims.append(dim)
+                coords[dim] = self.coords[dim]
+                axis += 1
+                continue
+
+            indexer = self._indexer(dim, labels[dim])
+            if isinstance(indexer, (int, np.integer)):
+                values = values[(slice(None),) * axis + (indexer,)]
+                flags = flags[(slice(None),) * axis + (indexer,)] if flags is not None else None
+                continue
+
+            if isinstance(indexer, slice):
+                values = values[(slice(None),) * axis + (indexer,)]
+                flags = flags[(slice(None),) * axis + (indexer,)] if flags is not None else None
+                coords[dim] = self.coords[dim][indexer]
+            else:
+                values = np.take(values, indexer, axis=axis)
+                flags = np.take(flags, indexer, axis=axis) if flags is not None else None
+                coords[dim] = [self.coords[dim][position] for position in indexer]
+            dims.append(dim)
+            axis += 1
+
+        return Cube(self.name, dims, coords, values, flags)
+
+    def to_array(self):
+        """Returns the values as LabelledArray for arithmetic with other datasets, still backed by the memory map."""
+        return LabelledArray(self.dims, self.coords, self.values)
+
+    def to_frame(self, value_column='value', dropna=True):
+        """
+        Converts the cube back to a long frame.
+
+        Args:
+            value_column (str): Name of the value column.
+            dropna (bool): Leave out missing cells.
+
+        Returns:
+            pandas.DataFrame: One row per cell with the dimension labels.
+        """
+        index = pd.MultiIndex.from_product([self.coords[dim] for dim in self.dims], names=self.dims)
+        frame = pd.DataFrame({value_column: np.asarray(self.values).ravel()}, index=index)
+        if self.flags is not None:
+            frame['flags'] = np.asarray(self.flags).ravel()
+        if dropna:
+            frame = frame[frame[value_column].notna()]
+        return frame.reset_index()
+
+class CubeStore:
+    """Directory of memory-mapped cubes, one subdirectory per dataset."""
+
+    def __init__(self, root=None):
+        self.root = root or _env_cache.get('CUBE_DIR') or os.path.join(_env_cache['BASE_DIR'], 'cubes')
+
+    def path(self, name):
+        return os.path.join(self.root, name.lower())
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.path(name), 'meta.json'))
+
+    def write_frame(self, name, data, value_column, dims=None):
+        """
+        Writes a long frame as cube, replacing an existing cube of the same name.
+
+        Args:
+            name (str): Name of the cube, usually the dataset code.
+            data (pandas.DataFrame): Long frame with the dimension columns and value_column.
+            value_column (str): Column holding the values.
+            dims (list, optional): Dimension columns in cube order. Defaults to all columns except
+                the value, flags and versioning columns, in frame order.
+
+        Returns:
+            Cube: The written cube, opened from disk.
+        """
+        dims = dims or [column for column in data.columns if column != value_column and column not in NON_DIMENSIONS]
+
+        coords, positions = frame_positions(data, dims)
+        shape = tuple(len(coords[dim]) for dim in dims)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{name.lower()}_", dir=self.root)
+        try:
+            values = np.lib.format.open_memmap(os.path.join(tmp_dir, 'values.npy'), mode='w+', dtype=np.float64, shape=shape)
+            values[...] = np.nan
+            values[tuple(positions)] = data[value_column].to_numpy(dtype=np.float64, na_value=np.nan)
+            values.flush()
+            del values
+
+            has_flags = 'flags' in data.columns
+            if has_flags:
+                flags = np.lib.format.open_memmap(os.path.join(tmp_dir, 'flags.npy'), mode='w+', dtype=np.int16, shape=shape)
+                flags[...] = 0
+                flags[tuple(positions)] = data['flags'].to_numpy(dtype=np.int16)
+                flags.flush()
+                del flags
+
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding="utf-8") as file:
+                json.dump({'name': name, 'dims': dims, 'coords': coords, 'value_column': value_column,
+                           'flags': has_flags}, file)
+
+            # Swap the finished cube in place of the old one
+            target = self.path(name)
+            if os.path.exists(target):
+                old_dir = tempfile.mkdtemp(prefix=f".{name.lower()}_old_", dir=self.root)
+                os.replace(target, os.path.join(old_dir, 'cube'))
+                os.replace(tmp_dir, target)
+                shutil.rmtree(old_dir, ignore_errors=True)
+            else:
+                os.replace(tmp_dir, target)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        return self.open(name)
+
+    def write_table(self, table, dims=None, value_column=None, filters=None):
+        """
+        Writes the current rows of a TABLE_CONNECTOR table as cube named after the table.
+
+        Args:
+            table: Mapped table class returned by open_table.
+            dims (list, optional): Dimension columns. Defaults to all non-float schema columns.
+            value_column (str, optional): Value column. Defaults to the first float column.
+            filters (dict, optional): Filters passed to read_frame.
+
+        Returns:
+            Cube: The written cube.
+        """
+        schema_dims, value_column = table_dimensions(table, value_column)
+        dims = dims or schema_dims
+        columns = dims + [value_column] + (['flags'] if 'flags' in table.__column_names__ else [])
+        return self.write_frame(table.__tablename__, table.read_frame(columns=columns, filters=filters), value_column, dims)
+
+    def open(self, name):
+        """
+        Opens a cube read-only as memory map.
+
+        Args:
+            name (str): Name of the cube.
+
+        Returns:
+            Cube: The cube, backed by the files of the store.
+        """
+        path = self.path(name)
+        if not self.exists(name):
+            raise FileNotFoundError(f"No cube {name} in {self.root}")
+        with open(os.path.join(path, 'meta.json'), 'r', encoding="utf-8") as file:
+            meta = json.load(file)
+
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        flags = np.load(os.path.join(path, 'flags.npy'), mmap_mode='r') if meta['flags'] else None
+        return Cube(meta['name'], meta['dims'], meta['coords'], values, flags)
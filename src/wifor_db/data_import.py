@@ -1,156 +1,171 @@
 """
-This script saves data  to a SQL database. 
+This script saves data  to a SQL database.
 
 Run for example with:
 poetry run python src/wifor_db/data_import.py
+
+The Eurostat datasets are streamed from the bulk download in chunks (see eurostat_bulk),
+so memory use is bounded by the chunk size instead of the size of the dataset.
+
+Stage timings, row counts and round trips of the run are written to import_metrics.json
+in the log directory, and to wifor_import.prom in PROMETHEUS_TEXTFILE_DIR if that is set.
+
+If CUBE_DIR is set, every dataset is also written to the memory-mapped cube store.
+
+The code lists of the dimensions of every dataset are cached for label joins (see
+eurostat_codelists), so reports can label read frames without network access.
+
+Every table is loaded in bulk-load mode (see bulk_load): its indexes are rebuilt and the
+table is analyzed once after the load instead of being maintained row by row.
+
+Every written chunk is checkpointed (see import_checkpoints) and the bulk files are kept in
+IMPORT_CACHE_DIR (defaults to BASE_DIR/import_cache) until their dataset is complete. After a
+failure, rerun with --resume to skip the completed datasets and chunks:
+poetry run python src/wifor_db/data_import.py --resume
 """
 
-import pandas as pd
+import os
+import argparse
 import geopandas as gpd
-import eurostat
-from wifor_db import TABLE_CONNECTOR
-
-geo_df = gpd.read_file('../geo_data/ref-nuts-2021/NUTS_RG_01M_2021_4326.geojson')
-geo_df.rename(columns={'NUTS_ID': 'nuts_id'
-                       , 'LEVL_CODE': 'levl_code'
-                       , 'CNTR_CODE': 'cntr_code'
-                       , 'NAME_LATN': 'name_latin'
-                       , 'NUTS_NAME': 'nuts_name'
-                       , 'MOUNT_TYPE': 'mount_type'
-                       , 'URBN_TYPE': 'urban_type'
-                       , 'COAST_TYPE': 'coast_type'
-                       , 'FID': 'fid'
-                       }
-                , inplace=True)
-
-with TABLE_CONNECTOR() as tc:
-    regions = tc.open_table("REGIONS")
-    regions.init_table()
-    regions.add_data(geo_df)
-
-# Employment by sex, age and economic activity (from 2008 onwards, NACE Rev. 2) - 1 000
-# https://ec.europa.eu/eurostat/web/products-datasets/product?code=lfsq_egan2
-
-data1 = eurostat.get_data_df("lfsa_egan2", False) # Zeit, Land, Geschlecht, Alter, NACE 2
-
-data1.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data1 = data1.melt(id_vars=['freq', 'unit', 'sex', 'age', 'nace_r2', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='employed')
-data1['year'] = pd.to_datetime(data1['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_egan2 = tc.open_table("lfsa_egan2")
-    lfsa_egan2.init_table()
-    lfsa_egan2.add_data(data1)
-
-# Employment rates by sex, age and citizenship (%)
-# https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_ergan
-
-data2 = eurostat.get_data_df("lfsa_egan", False) # Zeit, Land, Geschlecht, Nationalität, Alter
-
-data2.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data2 = data2.melt(id_vars=['freq', 'unit', 'sex', 'age', 'citizen', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='employed')
-data2['year'] = pd.to_datetime(data2['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_egan = tc.open_table("lfsa_egan")
-    lfsa_egan.init_table()
-    lfsa_egan.add_data(data2)
-
-# Employment by sex, age, occupation and economic activity (from 2008 onwards, NACE Rev. 2) (1 000)
-# https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_eisn2
-
-data3 = eurostat.get_data_df("lfsa_eisn2", False) # Zeit, Land, ISCO1, NACE2, Geschlecht, Alter
-
-data3.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data3 = data3.melt(id_vars=['freq', 'age', 'sex', 'nace_r2', 'isco08', 'unit', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='employed')
-data3['year'] = pd.to_datetime(data3['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_eisn2 = tc.open_table("lfsa_eisn2")
-    lfsa_eisn2.init_table()
-    lfsa_eisn2.add_data(data3)
-
-# Employed persons by detailed occupation (ISCO-08 two digit level)
-# https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_egai2d
-
-data4 = eurostat.get_data_df("lfsa_egai2d", False) # Zeit, Land, ISCO2, Geschlecht
-
-data4.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data4 = data4.melt(id_vars=['freq', 'isco08', 'age', 'sex', 'unit', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='employed')
-data4['year'] = pd.to_datetime(data4['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_egai2d = tc.open_table("lfsa_egai2d")
-    lfsa_egai2d.init_table()
-    lfsa_egai2d.add_data(data4)
-
-# Unemployment by sex, age and duration of unemployment (1 000)
-# https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_ugad
-
-data5 = eurostat.get_data_df("lfsa_ugad", False) # Zeit, Land, Geschlecht, Dauer Alo, Alter
-
-data5.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data5 = data5.melt(id_vars=['freq', 'unit', 'sex', 'age', 'duration', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='unemployed')
-data5['year'] = pd.to_datetime(data5['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_ugad = tc.open_table("lfsa_ugad")
-    lfsa_ugad.init_table()
-    lfsa_ugad.add_data(data5)
-
-# Previous occupations of the unemployed, by sex (1 000)
-# https://ec.europa.eu/eurostat/web/products-datasets/product?code=lfsa_ugpis
-
-data6 = eurostat.get_data_df("lfsa_ugpis", False) # Zeit, Land, Geschlecht, ISCO1 Alo
-
-data6.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data6 = data6.melt(id_vars=['freq', 'unit', 'sex', 'isco08', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='unemployed')
-data6['year'] = pd.to_datetime(data6['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_ugpis = tc.open_table("lfsa_ugpis")
-    lfsa_ugpis.init_table()
-    lfsa_ugpis.add_data(data6)
-
-# Employment by sex, age, economic activity and NUTS 2 regions (NACE Rev. 2) (1 000)
-# https://ec.europa.eu/eurostat/web/products-datasets/-/LFST_R_LFE2EN2
-
-data7 = eurostat.get_data_df("lfst_r_lfe2en2", False) # Region NUTS2, Zeit, NACE2, Alter, Geschlecht
-data7.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data7 = data7.melt(id_vars=['freq', 'nace_r2', 'age', 'sex', 'unit', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='employed')
-data7['year'] = pd.to_datetime(data7['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfst_r_lfe2en2 = tc.open_table("lfst_r_lfe2en2")
-    lfst_r_lfe2en2.init_table()
-    lfst_r_lfe2en2.add_data(data7)
-
-# Employment by sex, age, migration status, occupation and educational attainment level
-# https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_egaisedm
-
-data8 = eurostat.get_data_df("lfsa_egaisedm") # Beschäftigung nach Geschlecht, Alter, Migrationsstatus, Beruf und Bildungsabschluss
-
-data8.rename(columns={'geo\\TIME_PERIOD': 'nuts_id'}, inplace=True)
-data8 = data8.melt(id_vars=['freq', 'isced11', 'isco08', 'mgstatus', 'age', 'sex', 'unit', 'nuts_id'], 
-                  var_name='year', 
-                  value_name='employed')
-data8['year'] = pd.to_datetime(data8['year'], format='%Y')
-
-with TABLE_CONNECTOR() as tc:
-    lfsa_egaisedm = tc.open_table("lfsa_egaisedm")
-    lfsa_egaisedm.init_table()
-    lfsa_egaisedm.add_data(data8)
+from wifor_db import TABLE_CONNECTOR, _env_cache
+from wifor_db.import_metrics import ImportMetrics
+from wifor_db.import_checkpoints import ImportCheckpoints
+from wifor_db.eurostat_bulk import stream_dataset, download_bulk_file
+from wifor_db.cube_store import CubeStore
+from wifor_db.eurostat_codelists import CodeListStore, dataset_dimensions
+
+REGIONS_PATH = '../geo_data/ref-nuts-2021/NUTS_RG_01M_2021_4326.geojson'
+
+# Eurostat datasets as (code, value column), the dimension columns come from the bulk file
+DATASETS = [
+    # Employment by sex, age and economic activity (from 2008 onwards, NACE Rev. 2) - 1 000
+    # https://ec.europa.eu/eurostat/web/products-datasets/product?code=lfsq_egan2
+    # Zeit, Land, Geschlecht, Alter, NACE 2
+    ("lfsa_egan2", 'employed'),
+
+    # Employment rates by sex, age and citizenship (%)
+    # https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_ergan
+    # Zeit, Land, Geschlecht, Nationalität, Alter
+    ("lfsa_egan", 'employed'),
+
+    # Employment by sex, age, occupation and economic activity (from 2008 onwards, NACE Rev. 2) (1 000)
+    # https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_eisn2
+    # Zeit, Land, ISCO1, NACE2, Geschlecht, Alter
+    ("lfsa_eisn2", 'employed'),
+
+    # Employed persons by detailed occupation (ISCO-08 two digit level)
+    # https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_egai2d
+    # Zeit, Land, ISCO2, Geschlecht
+    ("lfsa_egai2d", 'employed'),
+
+    # Unemployment by sex, age and duration of unemployment (1 000)
+    # https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_ugad
+    # Zeit, Land, Geschlecht, Dauer Alo, Alter
+    ("lfsa_ugad", 'unemployed'),
+
+    # Previous occupations of the unemployed, by sex (1 000)
+    # https://ec.europa.eu/eurostat/web/products-datasets/product?code=lfsa_ugpis
+    # Zeit, Land, Geschlecht, ISCO1 Alo
+    ("lfsa_ugpis", 'unemployed'),
+
+    # Employment by sex, age, economic activity and NUTS 2 regions (NACE Rev. 2) (1 000)
+    # https://ec.europa.eu/eurostat/web/products-datasets/-/LFST_R_LFE2EN2
+    # Region NUTS2, Zeit, NACE2, Alter, Geschlecht
+    ("lfst_r_lfe2en2", 'employed'),
+
+    # Employment by sex, age, migration status, occupation and educational attainment level
+    # https://ec.europa.eu/eurostat/web/products-datasets/-/lfsa_egaisedm
+    # Beschäftigung nach Geschlecht, Alter, Migrationsstatus, Beruf und Bildungsabschluss
+    ("lfsa_egaisedm", 'employed'),
+]
+
+def import_cache_dir():
+    return _env_cache.get('IMPORT_CACHE_DIR') or os.path.join(_env_cache['BASE_DIR'], 'import_cache')
+
+def load_regions(metrics, resume=False):
+    """Reads the NUTS regions and saves them to the REGIONS table."""
+    with TABLE_CONNECTOR(metrics) as tc:
+        if resume and ImportCheckpoints(tc).is_done("REGIONS"):
+            tc.log.info("REGIONS: complete, skipped")
+            return
+
+    with metrics.stage("read_file", "REGIONS", bytes_read=os.path.getsize(REGIONS_PATH)) as stage:
+        geo_df = gpd.read_file(REGIONS_PATH)
+        stage.rows = len(geo_df)
+
+    geo_df.rename(columns={'NUTS_ID': 'nuts_id'
+                           , 'LEVL_CODE': 'levl_code'
+                           , 'CNTR_CODE': 'cntr_code'
+                           , 'NAME_LATN': 'name_latin'
+                           , 'NUTS_NAME': 'nuts_name'
+                           , 'MOUNT_TYPE': 'mount_type'
+                           , 'URBN_TYPE': 'urban_type'
+                           , 'COAST_TYPE': 'coast_type'
+                           , 'FID': 'fid'
+                           }
+                    , inplace=True)
+
+    with TABLE_CONNECTOR(metrics) as tc:
+        regions = tc.open_table("REGIONS")
+        # evolve adds the geometry column to REGIONS tables created before it existed
+        regions.init_table(evolve=True)
+        with tc.bulk_load_mode(tables=[regions]):
+            ImportCheckpoints(tc).load_chunks(regions, "REGIONS", [geo_df], resume)
+
+def load_dataset(code, value_name, metrics, resume=False):
+    """
+    Streams a Eurostat dataset with its observation flags in long format chunks
+    and saves each chunk to its table, with the flags as bitmask column.
+
+    Args:
+        code (str): Eurostat dataset code, also the name of the table JSON.
+        value_name (str): Name of the value column.
+        metrics (ImportMetrics): Collector for the stage timings of the run.
+        resume (bool): Skip the dataset if it is complete, and the chunks written by an earlier run.
+    """
+    with TABLE_CONNECTOR(metrics) as tc:
+        checkpoints = ImportCheckpoints(tc)
+        if resume and checkpoints.is_done(code):
+            tc.log.info("%s: complete, skipped", code)
+            return
+
+        table = tc.open_table(code)
+        table.init_table(evolve=True)
+
+        with metrics.stage("download", code):
+            path = download_bulk_file(code, import_cache_dir())
+        with tc.bulk_load_mode(tables=[table]):
+            checkpoints.load_chunks(table, code, stream_dataset(code, value_name, path=path, metrics=metrics), resume, complete=False)
+        os.remove(path)
+
+        if _env_cache.get('CUBE_DIR'):
+            with metrics.stage("cube", code):
+                CubeStore().write_table(table, value_column=value_name)
+
+        with metrics.stage("codelists", code):
+            CodeListStore().fetch(code, dataset_dimensions(table))
+
+        # Only now the dataset is complete, a failure above is resumed from the written chunks
+        checkpoints.mark_done(code)
+
+def write_metrics(metrics):
+    """Writes the JSON summary and, if configured, the Prometheus textfile of the run."""
+    metrics.write_json(os.path.join(_env_cache['LOG_DIR'], "import_metrics.json"))
+
+    textfile_dir = _env_cache.get('PROMETHEUS_TEXTFILE_DIR')
+    if textfile_dir:
+        metrics.write_prometheus(os.path.join(textfile_dir, "wifor_import.prom"))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Imports the NUTS regions and the Eurostat datasets.")
+    parser.add_argument("--resume", action="store_true", help="skip the datasets and chunks completed by an earlier run")
+    args = parser.parse_args()
+
+    run_metrics = ImportMetrics("data_import")
+    try:
+        load_regions(run_metrics, args.resume)
+
+        for dataset_code, value_column in DATASETS:
+            load_dataset(dataset_code, value_column, run_metrics, args.resume)
+    finally:
+        write_metrics(run_metrics)
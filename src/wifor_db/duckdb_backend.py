@@ -0,0 +1,192 @@
+# pylint: disable=line-too-long
+"""
+DuckDB as database of TABLE_CONNECTOR, selected with CURRENT_DB=duckdb.
+
+DuckDB is a single-file, serverless column store, which suits the scans and group-bys over
+the LFS fact tables on laptops and in batch jobs. The tables are created from the same JSON
+definitions through duckdb_engine (pip install duckdb duckdb-engine); DUCKDB_DB_PATH holds the
+database URL, e.g. duckdb:////data/wifor.duckdb.
+
+Writes and reads bypass the row-by-row paths of SQLAlchemy:
+    insert_frame:  the frame is handed to DuckDB as Arrow table (zero-copy for numeric columns)
+                   and inserted with one INSERT ... SELECT.
+    read_frame:    the select statement runs on the DuckDB connection and the result is fetched
+                   as a whole into a DataFrame.
+
+Parquet files written with export_parquet can be queried in place: attach_parquet creates a
+view over read_parquet() and maps it with the JSON definition of the exported table, e.g. for
+archived or exported datasets that are not loaded into the database.
+
+Schema evolution reads the live columns and indexes with live_columns and live_indexes, as the
+reflection of duckdb_engine goes through pg_catalog tables DuckDB does not have.
+
+Example:
+    with TABLE_CONNECTOR() as tc:
+        egan = tc.open_table("lfsa_egan")
+        export_parquet(tc, egan, "exports/lfsa_egan.parquet")
+        archived = attach_parquet(tc, "lfsa_egan", "exports/lfsa_egan.parquet")
+        archived.read_frame(filters={'sex': 'T'})
+"""
+
+# Standard library imports
+import os
+import re
+import uuid
+
+# Third-party imports
+from sqlalchemy import text, Float
+from sqlalchemy import types as sqltypes
+from sqlalchemy.ext.compiler import compiles
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+DIALECT_NAME = 'duckdb'
+
+# SQLAlchemy types of the DuckDB type names in information_schema, DECIMAL and TIMESTAMP are parsed
+STORED_TYPES = {'TINYINT': sqltypes.SmallInteger, 'SMALLINT': sqltypes.SmallInteger, 'INTEGER': sqltypes.Integer,
+                'BIGINT': sqltypes.BigInteger, 'FLOAT': sqltypes.REAL, 'DOUBLE': sqltypes.Float,
+                'VARCHAR': sqltypes.Text, 'BOOLEAN': sqltypes.Boolean, 'DATE': sqltypes.Date,
+                'BLOB': sqltypes.LargeBinary, 'JSON': sqltypes.JSON}
+
+@compiles(Float, 'duckdb')
+def _compile_double(type_, compiler, **kw):  # pylint: disable=unused-argument
+    # FLOAT is single precision in DuckDB, the other databases store Float as double
+    return "DOUBLE"
+
+def is_duckdb(session_or_engine):
+    """True if a session or engine is bound to DuckDB."""
+    bind = session_or_engine.get_bind() if hasattr(session_or_engine, 'get_bind') else session_or_engine
+    return bind.dialect.name == DIALECT_NAME
+
+def _driver_connection(session):
+    """DuckDB connection behind the session's current transaction."""
+    return session.connection().connection.driver_connection
+
+def _literal_sql(session, statement):
+    """SQL of a statement with the parameters rendered inline, as run on the DuckDB connection."""
+    return str(statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True}))
+
+def insert_frame(session, cls, data):
+    """
+    Inserts a frame into a table with one INSERT ... SELECT over the registered Arrow table.
+
+    id comes from the table's sequence, version_number and effective_date are set as in the
+    column defaults of the table classes. The caller commits.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session bound to DuckDB.
+        cls: Mapped table class created by open_table.
+        data (pandas.DataFrame): Frame with the schema columns.
+    """
+    columns = list(cls.__column_names__)
+    frame = data[columns]
+    source = pa.Table.from_pandas(frame, preserve_index=False) if pa is not None else frame
+
+    view = f"frame_{uuid.uuid4().hex}"
+    connection = _driver_connection(session)
+    connection.register(view, source)
+    try:
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        connection.execute(f'INSERT INTO "{cls.__tablename__}" ({column_list}, version_number, effective_date) '
+                           f'SELECT {column_list}, 1, current_date FROM "{view}"')
+    finally:
+        connection.unregister(view)
+
+def read_frame(session, statement):
+    """Runs a select statement on the DuckDB connection and fetches the result as a DataFrame."""
+    return _driver_connection(session).execute(_literal_sql(session, statement)).df()
+
+def export_parquet(connector, cls, path, filters=None, compression='zstd'):
+    """
+    Writes the current rows of a table with all its columns to a Parquet file.
+
+    On DuckDB the file is written by COPY inside the database, on other databases from
+    read_frame with pandas. The file keeps the id and versioning columns, so a view attached
+    to it can be read with the table class of the same JSON definition.
+
+    Args:
+        connector (TABLE_CONNECTOR): Open connector.
+        cls: Mapped table class created by open_table.
+        path (str): Output file.
+        filters (dict, optional): Filters passed to read_frame.
+        compression (str): Parquet compression codec.
+
+    Returns:
+        str: The path of the written file.
+    """
+    # pylint: disable=import-outside-toplevel
+    from wifor_db.sql_handler import build_frame_query
+
+    columns = ['id'] + list(cls.__column_names__) + ['version_number', 'effective_date', 'expiry_date']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if is_duckdb(connector.session):
+        statement = build_frame_query(cls, columns, filters)
+        _driver_connection(connector.session).execute(
+            f"COPY ({_literal_sql(connector.session, statement)}) TO '{path}' (FORMAT PARQUET, COMPRESSION {compression})")
+    else:
+        cls.read_frame(columns=columns, filters=filters).to_parquet(path, index=False, compression=compression)
+    return path
+
+def attach_parquet(connector, class_name, path, view_name=None):
+    """
+    Makes Parquet files written by export_parquet queryable in place.
+
+    Creates a view over read_parquet() and maps it with the JSON definition of class_name, so
+    read_frame, to_array and the other read methods work on the files without loading them.
+
+    Args:
+        connector (TABLE_CONNECTOR): Open connector on DuckDB.
+        class_name (str): Name of the table JSON the files were exported from.
+        path (str): Parquet file or glob pattern, e.g. exports/lfsa_egan/*.parquet.
+        view_name (str, optional): Name of the view, defaults to <table name>_PARQUET.
+
+    Returns:
+        Mapped class of the view.
+    """
+    if not is_duckdb(connector.session):
+        raise ValueError("Parquet files can only be attached on CURRENT_DB=duckdb")
+    view_name = view_name or f"{connector.load_class_json(connector, class_name)['table_name']}_PARQUET"
+    # On the session's connection, whose reads would not see a view created in another transaction
+    connector.session.execute(text(f"CREATE OR REPLACE VIEW \"{view_name}\" AS SELECT * FROM read_parquet('{path}')"))
+    connector.session.commit()
+    return connector.open_table(class_name, table_name=view_name)
+
+def _sqlalchemy_type(type_name):
+    """SQLAlchemy type of a DuckDB type name as reported by information_schema, e.g. DECIMAL(8,3)."""
+    match = re.fullmatch(r"DECIMAL\((\d+),(\d+)\)", type_name)
+    if match:
+        return sqltypes.Numeric(int(match.group(1)), int(match.group(2)))
+    if type_name.startswith('TIMESTAMP'):
+        return sqltypes.DateTime()
+    return STORED_TYPES.get(type_name, sqltypes.NullType)()
+
+def live_columns(connection, table_name):
+    """
+    Columns of a table with their types, read from information_schema. duckdb_engine reflects
+    through pg_catalog, which DuckDB only partly emulates (there is no pg_collation).
+
+    Returns:
+        dict: Column dicts with 'name' and 'type' by column name, as Inspector.get_columns.
+    """
+    result = connection.execute(text("SELECT column_name, data_type FROM information_schema.columns "
+                                      "WHERE table_name = :table_name ORDER BY ordinal_position"),
+                                {'table_name': table_name})
+    return {name: {'name': name, 'type': _sqlalchemy_type(data_type)} for name, data_type in result}
+
+def live_indexes(connection, table_name):
+    """Names of the indexes of a table, duckdb_engine does not reflect them."""
+    result = connection.execute(text("SELECT index_name FROM duckdb_indexes() WHERE table_name = :table_name"),
+                                {'table_name': table_name})
+    return {name for (name,) in result}
+
+def stored_type(connection, column_type):
+    """
+    Type a column of column_type has in DuckDB, in the terms of live_columns. DuckDB drops
+    lengths (VARCHAR(255) is VARCHAR) and gives NUMERIC a default precision, so JSON types are
+    compared with the live table as stored.
+    """
+    type_string = column_type.compile(dialect=connection.dialect)
+    return _sqlalchemy_type(connection.execute(text(f"SELECT typeof(CAST(NULL AS {type_string}))")).scalar())
@@ -0,0 +1,184 @@
+# pylint: disable=line-too-long
+"""
+Streaming reader for the Eurostat bulk downloads.
+
+eurostat.get_data_df builds the whole wide dataset in memory before it can be melted. This
+module reads the gzip compressed bulk file of the Eurostat dissemination API incrementally
+instead: the response is decompressed while it is read, parsed in chunks of rows, and every
+chunk is turned into long format right away. Each yielded frame holds the dimension columns
+('geo' renamed to 'nuts_id'), 'year', the value column and the 'flags' bitmask (see
+eurostat_flags), so it can be passed to add_data as is and memory stays bounded by the
+chunk size.
+
+Two formats are supported:
+    tsv:       one row per dimension combination and one column per period, cells like '12.3 p'.
+    sdmx-csv:  already long, one row per observation with OBS_VALUE and OBS_FLAG.
+
+Only annual datasets are supported, as the period is parsed into the DateTime 'year' column.
+
+Example:
+    for chunk in stream_dataset("lfsa_egan", value_name="employed"):
+        lfsa_egan.add_data(chunk)
+"""
+
+# Standard library imports
+import os
+import gzip
+import shutil
+import urllib.request
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from wifor_db.eurostat_flags import split_value_flags, flags_to_bitmask
+
+BULK_URL = "https://ec.europa.eu/eurostat/api/dissemination/sdmx/2.1/data/{code}?format={format}&compressed=true"
+URL_FORMATS = {'tsv': 'TSV', 'sdmx-csv': 'SDMX-CSV'}
+
+class CountingReader:
+    """File-like wrapper counting the bytes read from the wrapped (compressed) stream."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def close(self):
+        self.raw.close()
+
+def open_bulk_file(code=None, source_format='tsv', path=None, timeout=300):
+    """
+    Opens the compressed bulk file of a dataset, from the Eurostat API or from disk.
+
+    Args:
+        code (str): Eurostat dataset code, e.g. 'lfsa_egan'.
+        source_format (str): 'tsv' or 'sdmx-csv'.
+        path (str, optional): Local .gz file to read instead of downloading.
+        timeout (int): Timeout of the download in seconds.
+
+    Returns:
+        CountingReader: Reader of the compressed bytes.
+    """
+    if path is not None:
+        return CountingReader(open(path, 'rb'))  # pylint: disable=consider-using-with
+    if source_format not in URL_FORMATS:
+        raise ValueError(f"Unsupported bulk format: {source_format}")
+    url = BULK_URL.format(code=code, format=URL_FORMATS[source_format])
+    return CountingReader(urllib.request.urlopen(url, timeout=timeout))  # pylint: disable=consider-using-with
+
+def download_bulk_file(code, directory, source_format='tsv', timeout=300):
+    """
+    Downloads the compressed bulk file of a dataset once, so reruns read it from disk.
+
+    Args:
+        code (str): Eurostat dataset code, e.g. 'lfsa_egan'.
+        directory (str): Directory of the downloaded files.
+        source_format (str): 'tsv' or 'sdmx-csv'.
+        timeout (int): Timeout of the download in seconds.
+
+    Returns:
+        str: Path of the .gz file, for stream_dataset(path=...).
+    """
+    path = os.path.join(directory, f"{code}.{source_format}.gz")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        reader = open_bulk_file(code, source_format, timeout=timeout)
+        try:
+            # Written under a temporary name, so an interrupted download is not taken as complete
+            with open(path + '.tmp', 'wb') as file:
+                shutil.copyfileobj(reader, file, length=1024 * 1024)
+        finally:
+            reader.close()
+        os.replace(path + '.tmp', path)
+    return path
+
+def _tsv_chunk_to_long(chunk, value_name, drop_missing):
+    """Turns a chunk of wide TSV rows into long format."""
+    key_column = chunk.columns[0]
+    dimensions = ['nuts_id' if name == 'geo' else name for name in key_column.split('\\')[0].split(',')]
+    keys = chunk[key_column].str.split(',', expand=True)
+    keys.columns = dimensions
+
+    years = [str(column).strip() for column in chunk.columns[1:]]
+    rows = len(chunk)
+
+    # Column-major order puts the year outermost, as in DataFrame.melt
+    values, flags = split_value_flags(pd.Series(chunk.iloc[:, 1:].to_numpy().ravel(order='F')))
+    long = keys.iloc[np.tile(np.arange(rows), len(years))].reset_index(drop=True)
+    long['year'] = pd.to_datetime(np.repeat(years, rows), format='%Y')
+    long[value_name] = values
+    long['flags'] = flags
+
+    if drop_missing:
+        long = long[~(np.isnan(values) & (flags == 0))].reset_index(drop=True)
+    return long
+
+def _sdmx_chunk_to_long(chunk, value_name, drop_missing):
+    """Renames the columns of an SDMX-CSV chunk and converts value and flags."""
+    long = chunk.drop(columns=[column for column in ('DATAFLOW', 'LAST UPDATE') if column in chunk.columns])
+    long = long.rename(columns={'geo': 'nuts_id', 'TIME_PERIOD': 'year', 'OBS_VALUE': value_name})
+    long['year'] = pd.to_datetime(long['year'].str.strip(), format='%Y')
+    long[value_name] = pd.to_numeric(long[value_name], errors='coerce')
+    flags = long.pop('OBS_FLAG') if 'OBS_FLAG' in long.columns else pd.Series([None] * len(long))
+    long['flags'] = flags_to_bitmask(flags.replace('', None))
+
+    if drop_missing:
+        long = long[long[value_name].notna() | (long['flags'] != 0)].reset_index(drop=True)
+    return long
+
+def stream_dataset(code=None, value_name='value', source_format='tsv', chunk_rows=50000,
+                   path=None, drop_missing=False, metrics=None):
+    """
+    Reads a Eurostat bulk file chunk by chunk and yields long frames.
+
+    Args:
+        code (str): Eurostat dataset code, e.g. 'lfsa_egan'.
+        value_name (str): Name of the value column, e.g. 'employed'.
+        source_format (str): 'tsv' or 'sdmx-csv'.
+        chunk_rows (int): Rows of the bulk file per chunk. A TSV row expands to one row per year.
+        path (str, optional): Local .gz file to read instead of downloading.
+        drop_missing (bool): Leave out observations without value and flags.
+        metrics (ImportMetrics, optional): Collector for the 'parse' stage, with rows and compressed bytes read.
+
+    Yields:
+        pandas.DataFrame: Long frame with the dimension columns, 'year', value_name and 'flags'.
+    """
+    reader = open_bulk_file(code, source_format, path)
+    dataset = code or path
+    separator = '\t' if source_format == 'tsv' else ','
+    convert = _tsv_chunk_to_long if source_format == 'tsv' else _sdmx_chunk_to_long
+
+    # Bytes counted in earlier parse stages; the reader of read_csv fills its first buffer
+    # when it is created, so those bytes go to the first stage
+    counted = 0
+    try:
+        with gzip.GzipFile(fileobj=reader) as stream:
+            chunks = pd.read_csv(stream, sep=separator, dtype=str, na_filter=False, chunksize=chunk_rows)
+
+            def parse_next():
+                chunk = next(chunks, None)
+                return None if chunk is None else convert(chunk, value_name, drop_missing)
+
+            while True:
+                if metrics is None:
+                    long = parse_next()
+                else:
+                    with metrics.stage("parse", dataset) as stage:
+                        long = parse_next()
+                        stage.rows = 0 if long is None else len(long)
+                        stage.bytes = reader.bytes_read - counted
+                    counted = reader.bytes_read
+                if long is None:
+                    break
+                yield long
+    finally:
+        reader.close()
@@ -0,0 +1,215 @@
+# pylint: disable=line-too-long
+"""
+Cached Eurostat code lists and label joins on read frames.
+
+The dimension columns of the tables hold Eurostat codes ('NACE_R2' codes like 'C10', 'age'
+codes like 'Y15-24'). CodeListStore keeps the code lists in a local SQLite file, keyed by
+dimension and language, and gives every code of a dimension a stable integer id (the same in
+all languages, new codes are appended on refresh).
+
+Code lists are only downloaded by fetch (e.g. once per dataset after its import). Attaching
+labels never goes to the network: attach_labels factorizes each dimension column once,
+looks up the labels of its distinct codes in the cache and remaps the category codes, so the
+cost is one dictionary lookup per distinct code instead of a string merge over all rows.
+
+The file lives in EUROSTAT_CACHE_DIR, which defaults to BASE_DIR/eurostat_cache.
+
+Example:
+    codelists = CodeListStore()
+    codelists.fetch("lfsa_egan", ["sex", "age", "citizen"])
+    frame = codelists.attach_labels(egan.read_frame(), lang='de')
+"""
+
+# Standard library imports
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from wifor_db.eurostat_toc import eurostat_cache_dir
+
+# Columns whose Eurostat dimension has another name
+DIMENSION_ALIASES = {'nuts_id': 'geo'}
+
+def dimension_of(column):
+    return DIMENSION_ALIASES.get(column, column).lower()
+
+def dataset_dimensions(table):
+    """Code columns of a table class, i.e. its string columns."""
+    return [name for name in table.__column_names__ if table.__table__.c[name].type.python_type is str]
+
+class CodeListStore:
+    """Eurostat code lists by dimension and language, cached in SQLite."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(eurostat_cache_dir(), "codelists.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Labels and ids read in this process, by (dimension, lang) and dimension
+        self._labels = {}
+        self._ids = {}
+        self._create_tables()
+
+    @contextmanager
+    def connect(self):
+        """Connection to the store, committed and closed on exit."""
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _create_tables(self):
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS codes (dimension TEXT, code TEXT, code_id INTEGER, "
+                               "PRIMARY KEY (dimension, code))")
+            connection.execute("CREATE TABLE IF NOT EXISTS labels (dimension TEXT, lang TEXT, code TEXT, label TEXT, "
+                               "PRIMARY KEY (dimension, lang, code))")
+            connection.execute("CREATE TABLE IF NOT EXISTS codelist_meta (dimension TEXT, lang TEXT, fetched_at TEXT, "
+                               "PRIMARY KEY (dimension, lang))")
+
+    def cached(self, lang=None):
+        """Dimensions with a cached code list, in one language or any."""
+        sql = "SELECT DISTINCT dimension FROM codelist_meta"
+        with self.connect() as connection:
+            rows = connection.execute(sql + " WHERE lang = ?", (lang,)).fetchall() if lang else connection.execute(sql).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def store(self, dimension, labels, lang='en'):
+        """
+        Replaces the cached code list of a dimension in one language.
+
+        Args:
+            dimension (str): Eurostat dimension, e.g. 'nace_r2'.
+            labels (dict): Label by code.
+            lang (str): Language of the labels.
+        """
+        dimension = dimension.lower()
+        with self.connect() as connection:
+            known = {row[0] for row in connection.execute("SELECT code FROM codes WHERE dimension = ?", (dimension,))}
+            next_id = connection.execute("SELECT COALESCE(MAX(code_id) + 1, 0) FROM codes WHERE dimension = ?", (dimension,)).fetchone()[0]
+            new_codes = [code for code in labels if code not in known]
+            connection.executemany("INSERT INTO codes VALUES (?, ?, ?)",
+                                   [(dimension, code, next_id + number) for number, code in enumerate(new_codes)])
+            connection.execute("DELETE FROM labels WHERE dimension = ? AND lang = ?", (dimension, lang))
+            connection.executemany("INSERT INTO labels VALUES (?, ?, ?, ?)",
+                                   [(dimension, lang, code, label) for code, label in labels.items()])
+            connection.execute("INSERT OR REPLACE INTO codelist_meta VALUES (?, ?, ?)",
+                               (dimension, lang, datetime.now(timezone.utc).isoformat()))
+        self._labels.pop((dimension, lang), None)
+        self._ids.pop(dimension, None)
+
+    def fetch(self, dataset, dimensions, lang='en', force=False):
+        """
+        Downloads the full code lists of dimensions of a dataset that are not cached yet.
+
+        Args:
+            dataset (str): Eurostat dataset code using the dimensions, e.g. 'lfsa_egan'.
+            dimensions (list): Dimension or column names, e.g. ['sex', 'age', 'nuts_id'].
+            lang (str): Language of the labels.
+            force (bool): Download cached code lists again.
+
+        Returns:
+            list: The downloaded dimensions.
+        """
+        # pylint: disable=import-outside-toplevel
+        import eurostat
+
+        cached = set(self.cached(lang))
+        fetched = []
+        for dimension in dict.fromkeys(dimension_of(column) for column in dimensions):
+            if dimension in cached and not force:
+                continue
+            self.store(dimension, dict(eurostat.get_dic(dataset, dimension, full=True, lang=lang)), lang)
+            fetched.append(dimension)
+        return fetched
+
+    def labels(self, dimension, lang='en'):
+        """Cached labels of a dimension as Series indexed by code."""
+        dimension = dimension_of(dimension)
+        if (dimension, lang) not in self._labels:
+            with self.connect() as connection:
+                frame = pd.read_sql_query("SELECT code, label FROM labels WHERE dimension = ? AND lang = ?",
+                                          connection, params=(dimension, lang))
+            if frame.empty:
+                raise KeyError(f"No cached code list for {dimension} ({lang}), fetch it with CodeListStore.fetch")
+            self._labels[(dimension, lang)] = frame.set_index('code')['label']
+        return self._labels[(dimension, lang)]
+
+    def code_ids(self, dimension):
+        """Integer id of every cached code of a dimension as Series indexed by code."""
+        dimension = dimension_of(dimension)
+        if dimension not in self._ids:
+            with self.connect() as connection:
+                frame = pd.read_sql_query("SELECT code, code_id FROM codes WHERE dimension = ?",
+                                          connection, params=(dimension,))
+            if frame.empty:
+                raise KeyError(f"No cached code list for {dimension}, fetch it with CodeListStore.fetch")
+            self._ids[dimension] = frame.set_index('code')['code_id']
+        return self._ids[dimension]
+
+    def encode(self, values, dimension):
+        """
+        Integer ids of a column of codes, -1 for codes not in the code list.
+
+        Args:
+            values (pandas.Series): Codes of the dimension.
+            dimension (str): Dimension or column name.
+
+        Returns:
+            numpy.ndarray: int64 ids, one per value.
+        """
+        positions, codes = pd.factorize(values)
+        ids = self.code_ids(dimension).reindex(codes).fillna(-1).to_numpy(dtype=np.int64)
+        # Missing values have position -1, which take would read from the end
+        return np.where(positions >= 0, ids[positions], -1)
+
+    def label_column(self, values, dimension, lang='en'):
+        """
+        Labels of a column of codes as categorical, unknown codes keep the code as label.
+
+        Args:
+            values (pandas.Series): Codes of the dimension.
+            dimension (str): Dimension or column name.
+            lang (str): Language of the labels.
+
+        Returns:
+            pandas.Categorical: Label per value.
+        """
+        positions, codes = pd.factorize(values)
+        code_labels = self.labels(dimension, lang).reindex(codes)
+        code_labels = code_labels.where(code_labels.notna(), pd.Series(codes, index=code_labels.index))
+        # Distinct codes can share a label, categories must be unique
+        label_positions, categories = pd.factorize(code_labels)
+        return pd.Categorical.from_codes(np.where(positions >= 0, label_positions[positions], -1), categories)
+
+    def attach_labels(self, frame, columns=None, lang='en', suffix='_label'):
+        """
+        Adds a label column next to dimension columns of a frame, from the cache only.
+
+        Args:
+            frame (pandas.DataFrame): Frame with code columns, e.g. from read_frame.
+            columns (list, optional): Columns to label. Defaults to the columns whose
+                dimension has a cached code list in lang.
+            lang (str): Language of the labels.
+            suffix (str): Suffix of the label columns.
+
+        Returns:
+            pandas.DataFrame: Copy of the frame with a categorical '<column><suffix>' per column.
+
+        Raises:
+            KeyError: If a requested column has no cached code list.
+        """
+        if columns is None:
+            cached = set(self.cached(lang))
+            columns = [column for column in frame.columns if dimension_of(str(column)) in cached]
+        labelled = frame.copy()
+        for column in columns:
+            labelled.insert(labelled.columns.get_loc(column) + 1, f"{column}{suffix}",
+                            self.label_column(frame[column], column, lang))
+        return labelled
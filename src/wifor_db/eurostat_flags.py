@@ -0,0 +1,88 @@
+# pylint: disable=line-too-long
+"""
+Eurostat observation flags stored as a small-integer bitmask.
+
+Eurostat marks observations with one or more letters, e.g. 'p' provisional or 'bu' break in
+time series and low reliability, see
+https://ec.europa.eu/eurostat/statistics-explained/index.php?title=Tutorial:Symbols_and_abbreviations
+Instead of keeping the letters as a string next to every value, each letter is one bit of
+the SmallInteger column 'flags'; 0 means no flag.
+
+Parsing works on the distinct flag strings only and maps the result back with the factorized
+codes, so it is vectorized and independent of the number of rows.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+# Bit of every Eurostat flag letter
+FLAG_BITS = {
+    'b': 1,       # break in time series
+    'c': 2,       # confidential
+    'd': 4,       # definition differs
+    'e': 8,       # estimated
+    'f': 16,      # forecast
+    'n': 32,      # not significant
+    'p': 64,      # provisional
+    'r': 128,     # revised
+    's': 256,     # Eurostat estimate
+    'u': 512,     # low reliability
+    'z': 1024,    # not applicable
+}
+
+# Value and flags of a cell of the Eurostat bulk TSV, e.g. '12.3 bp', ': c' or '7.1'
+_CELL_PATTERN = re.compile(r'^\s*(?P<value>[^\s]*)\s*(?P<flags>[a-z]*)\s*$')
+
+def flag_mask(flags):
+    """
+    Returns the bitmask of a set of flag letters.
+
+    Args:
+        flags (str or iterable): Flag letters, e.g. 'bu' or ['b', 'u'].
+
+    Returns:
+        int: Combined bits of the letters.
+
+    Raises:
+        ValueError: If a letter is not a Eurostat flag.
+    """
+    mask = 0
+    for letter in flags:
+        if letter not in FLAG_BITS:
+            raise ValueError(f"Unknown Eurostat flag: {letter}")
+        mask |= FLAG_BITS[letter]
+    return mask
+
+def flags_to_bitmask(flags):
+    """
+    Converts flag strings to their bitmask.
+
+    Args:
+        flags (pandas.Series): Flag strings, None or NaN for unflagged observations.
+
+    Returns:
+        numpy.ndarray: int16 bitmask per row.
+    """
+    codes, uniques = pd.factorize(flags, use_na_sentinel=True)
+    masks = np.array([sum(FLAG_BITS.get(letter, 0) for letter in set(str(unique).strip())) for unique in uniques] + [0],
+                     dtype=np.int16)
+    # The NA sentinel -1 picks the trailing 0
+    return masks[codes]
+
+def split_value_flags(cells):
+    """
+    Splits cells of the Eurostat bulk TSV into value and flags bitmask.
+
+    Args:
+        cells (pandas.Series): Raw cells like '12.3 bp', ': c' or '7.1'.
+
+    Returns:
+        tuple: float values (NaN for ':') and int16 bitmasks.
+    """
+    codes, uniques = pd.factorize(cells, use_na_sentinel=True)
+    parsed = pd.Series(uniques, dtype=object).str.extract(_CELL_PATTERN)
+    values = pd.to_numeric(parsed['value'].replace(':', np.nan), errors='coerce').to_numpy(dtype=np.float64)
+    values = np.append(values, np.nan)
+    masks = np.append(flags_to_bitmask(parsed['flags']), np.int16(0))
+    return values[codes], masks[codes]
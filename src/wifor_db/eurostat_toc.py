@@ -0,0 +1,178 @@
+# pylint: disable=line-too-long
+"""
+Cached and indexed Eurostat table of contents.
+
+eurostat.get_toc_df downloads the whole table of contents (some 10 000 datasets and tables)
+on every call, and eurostat.subset_toc_df scans the titles for a substring. TocStore keeps
+the TOC of one language in a local SQLite file with an FTS5 full-text index over the codes
+and titles, and downloads it again only when the stored copy is older than max_age_hours.
+
+search matches every word of the query as a prefix, ranks the hits with BM25 (a match in the
+code weighs more than one in the title) and returns the last update of the data and of the
+table structure, e.g. to decide which datasets to import again.
+
+The files live in EUROSTAT_CACHE_DIR, which defaults to BASE_DIR/eurostat_cache.
+
+Example:
+    toc = TocStore()
+    toc.search("employment nace")
+    toc.last_updates(["lfsa_egan", "lfsa_egan2"])
+"""
+
+# Standard library imports
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from wifor_db import _env_cache
+
+DEFAULT_MAX_AGE_HOURS = 24
+# Columns of eurostat.get_toc_df and their names in the store
+TOC_COLUMNS = {'code': 'code',
+               'title': 'title',
+               'type': 'type',
+               'last update of data': 'last_update',
+               'last table structure change': 'last_structure_change',
+               'data start': 'data_start',
+               'data end': 'data_end'}
+TIMESTAMP_COLUMNS = ['last_update', 'last_structure_change']
+# BM25 weights of the indexed columns code and title
+CODE_WEIGHT, TITLE_WEIGHT = 5.0, 1.0
+
+def eurostat_cache_dir():
+    return _env_cache.get('EUROSTAT_CACHE_DIR') or os.path.join(_env_cache['BASE_DIR'], 'eurostat_cache')
+
+def match_expression(query, match='all'):
+    """
+    FTS5 expression of a free-text query: every word as quoted prefix term, joined with AND
+    for match='all' or OR for match='any'. Operators and quotes in the query are ignored.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        raise ValueError(f"No search words in query: {query!r}")
+    return f" {'AND' if match == 'all' else 'OR'} ".join(f'"{word}"*' for word in words)
+
+class TocStore:
+    """Eurostat table of contents of one language, cached in SQLite with a full-text index."""
+
+    def __init__(self, lang='en', path=None, max_age_hours=DEFAULT_MAX_AGE_HOURS):
+        self.lang = lang
+        self.path = path or os.path.join(eurostat_cache_dir(), f"toc_{lang}.sqlite")
+        self.max_age = timedelta(hours=max_age_hours)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._create_tables()
+
+    @contextmanager
+    def connect(self):
+        """Connection to the store, committed and closed on exit."""
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _create_tables(self):
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS toc (code TEXT PRIMARY KEY, title TEXT, type TEXT, last_update TEXT, "
+                               "last_structure_change TEXT, data_start TEXT, data_end TEXT)")
+            # '_' belongs to the tokens, so dataset codes like lfsa_egan are indexed as one word
+            connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS toc_fts USING fts5(code, title, "
+                               "tokenize = \"unicode61 tokenchars '_'\", prefix = '2 3')")
+            connection.execute("CREATE TABLE IF NOT EXISTS toc_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def fetched_at(self):
+        """Time of the last download of the stored TOC, None if it was never downloaded."""
+        with self.connect() as connection:
+            row = connection.execute("SELECT value FROM toc_meta WHERE key = 'fetched_at'").fetchone()
+        return None if row is None else datetime.fromisoformat(row[0])
+
+    def is_stale(self):
+        fetched_at = self.fetched_at()
+        return fetched_at is None or datetime.now(timezone.utc) - fetched_at > self.max_age
+
+    def refresh(self, force=False, toc_df=None):
+        """
+        Replaces the stored TOC if it is stale, in one transaction so searches never see it half written.
+
+        Args:
+            force (bool): Download even if the stored TOC is current.
+            toc_df (pandas.DataFrame, optional): TOC in the format of eurostat.get_toc_df to
+                store instead of downloading it.
+
+        Returns:
+            bool: True if the TOC was replaced.
+        """
+        if toc_df is None:
+            if not (force or self.is_stale()):
+                return False
+            # pylint: disable=import-outside-toplevel
+            import eurostat
+            toc_df = eurostat.get_toc_df(lang=self.lang)
+
+        toc = toc_df.rename(columns=TOC_COLUMNS)[list(TOC_COLUMNS.values())].drop_duplicates('code')
+        rows = [tuple(None if pd.isna(value) else str(value) for value in row) for row in toc.itertuples(index=False)]
+        with self.connect() as connection:
+            connection.execute("DELETE FROM toc")
+            connection.execute("DELETE FROM toc_fts")
+            connection.executemany("INSERT INTO toc VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.execute("INSERT INTO toc_fts (code, title) SELECT code, title FROM toc")
+            connection.execute("INSERT OR REPLACE INTO toc_meta VALUES ('fetched_at', ?)", (datetime.now(timezone.utc).isoformat(),))
+        return True
+
+    def _read(self, sql, parameters=()):
+        with self.connect() as connection:
+            frame = pd.read_sql_query(sql, connection, params=parameters)
+        for column in TIMESTAMP_COLUMNS:
+            if column in frame.columns:
+                frame[column] = pd.to_datetime(frame[column], utc=True, errors='coerce')
+        return frame
+
+    def frame(self):
+        """The whole stored TOC, refreshed first if stale."""
+        self.refresh()
+        return self._read("SELECT * FROM toc ORDER BY code")
+
+    def search(self, query, limit=20, match='all', types=None):
+        """
+        Ranked full-text search over the codes and titles.
+
+        Args:
+            query (str): Words to search, e.g. "employment nace". Each word matches as prefix.
+            limit (int): Maximum number of hits.
+            match (str): 'all' for hits containing every word, 'any' for hits containing one.
+            types (list, optional): Entry types to return, e.g. ['dataset'].
+
+        Returns:
+            pandas.DataFrame: Hits, best first, with the TOC columns and the BM25 'score'
+            (lower is better).
+        """
+        self.refresh()
+        sql = (f"SELECT toc.*, bm25(toc_fts, {CODE_WEIGHT}, {TITLE_WEIGHT}) AS score "
+               "FROM toc_fts JOIN toc ON toc.code = toc_fts.code WHERE toc_fts MATCH ?")
+        parameters = [match_expression(query, match)]
+        if types:
+            sql += f" AND toc.type IN ({', '.join('?' * len(types))})"
+            parameters += list(types)
+        sql += " ORDER BY score LIMIT ?"
+        return self._read(sql, parameters + [limit])
+
+    def last_updates(self, codes):
+        """
+        Last update of the data of datasets, e.g. to decide which to import again.
+
+        Returns:
+            pandas.Series: Timestamp of the last data update by code, NaT for unknown codes.
+        """
+        self.refresh()
+        codes = list(codes)
+        if not codes:
+            return pd.Series([], dtype='datetime64[ns, UTC]', name='last_update')
+        frame = self._read(f"SELECT code, last_update FROM toc WHERE code IN ({', '.join('?' * len(codes))})", codes)
+        return frame.set_index('code')['last_update'].reindex(codes)
@@ -0,0 +1,61 @@
+# pylint: disable=line-too-long
+"""
+Load generations of the tables: a counter per table raised by every change of its rows.
+
+The LOAD_GENERATIONS table holds one row per table name. Everything that changes the rows or
+the schema of a table raises its counter in the same transaction as the change: add_data,
+backfill, evolve_table, compact_table, parallel_load, the foreign key update and the discarded
+chunks of a resumed import. Caches keyed by the generation (the ETags and response cache of
+the HTTP service, the stored results of the indicators) are so invalidated by updates as well
+as by inserts, and reading the key is a single primary key lookup.
+
+Example:
+    bump_generation(session, "LFSA_EGAN")
+    session.commit()
+    load_generation(session, egan)
+"""
+
+# Standard library imports
+from datetime import datetime
+
+# Third-party imports
+from sqlalchemy import MetaData, Table, Column, String, Integer, DateTime, select, update, insert
+
+GENERATION_TABLE = 'LOAD_GENERATIONS'
+
+generations = Table(GENERATION_TABLE, MetaData(),
+                    Column('table_name', String(255), primary_key=True),
+                    Column('generation', Integer, nullable=False),
+                    Column('changed_at', DateTime))
+
+def create_generation_table(engine):
+    """Creates the LOAD_GENERATIONS table if it does not exist."""
+    generations.create(engine, checkfirst=True)
+
+def bump_generation(connection, table_name):
+    """
+    Raises the generation of a table in the transaction of the connection, the caller commits.
+
+    Args:
+        connection: Session or connection bound to the database.
+        table_name (str): Name of the changed table.
+    """
+    now = datetime.now()
+    changed = connection.execute(update(generations).where(generations.c.table_name == table_name)
+                                 .values(generation=generations.c.generation + 1, changed_at=now)).rowcount
+    if not changed:
+        connection.execute(insert(generations).values(table_name=table_name, generation=1, changed_at=now))
+
+def load_generation(connection, cls):
+    """
+    Generation of the rows of a table, 0 for a table that was never changed since the counter exists.
+
+    Args:
+        connection: Session or connection bound to the database.
+        cls: Mapped table class created by open_table.
+
+    Returns:
+        int: The generation.
+    """
+    statement = select(generations.c.generation).where(generations.c.table_name == cls.__tablename__)
+    return connection.execute(statement).scalar() or 0
@@ -0,0 +1,149 @@
+# pylint: disable=line-too-long
+"""
+Checkpoints of the imports in data_import.py, so a failed import can be resumed.
+
+The IMPORT_RUN_STATE table records for every dataset each chunk written to its table, with
+the SHA-256 of the chunk's content, its row count and the highest id of the table before the
+chunk was written, and a final entry (chunk DATASET_DONE) once the dataset is complete,
+i.e. after its last chunk or, with load_chunks(..., complete=False), after the stages that
+follow the chunks (see mark_done).
+
+A chunk and its checkpoint are committed in the same transaction by add_data, so either both
+are stored or neither. When an import is resumed:
+    - completed datasets are skipped without downloading or parsing them,
+    - chunks whose checkpoint matches the content hash are parsed but not written again,
+    - from the first chunk without a matching checkpoint on, rows written by an earlier run
+      (ids above the start id of that chunk) are deleted before the chunk is written again.
+So writing a chunk is idempotent, and a rerun never duplicates rows.
+
+Example:
+    checkpoints = ImportCheckpoints(tc)
+    if not (resume and checkpoints.is_done("lfsa_egan")):
+        checkpoints.load_chunks(table, "lfsa_egan", stream_dataset("lfsa_egan", "employed"), resume)
+"""
+
+# Standard library imports
+import hashlib
+from datetime import datetime
+
+# Third-party imports
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, String, Integer, DateTime, select, delete, insert, func
+
+# Local application imports
+from wifor_db.generations import bump_generation
+
+STATE_TABLE = 'IMPORT_RUN_STATE'
+# Chunk number of the entry marking a complete dataset
+DATASET_DONE = -1
+
+def frame_hash(data):
+    """SHA-256 of the content of a frame, independent of its index."""
+    return hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()).hexdigest()
+
+class ImportCheckpoints:
+    """Run state of the imports, stored in the database the data is imported into."""
+
+    def __init__(self, connector):
+        self.connector = connector
+        self.session = connector.session
+        self.log = connector.log
+
+        self.state = Table(STATE_TABLE, MetaData(),
+                           Column('dataset', String(255), primary_key=True),
+                           Column('chunk', Integer, primary_key=True),
+                           Column('content_hash', String(64)),
+                           Column('rows', Integer),
+                           Column('start_id', Integer),
+                           Column('completed_at', DateTime))
+        self.state.create(connector.engine, checkfirst=True)
+
+    def is_done(self, dataset):
+        """True if the dataset was imported completely."""
+        return self.session.execute(select(self.state.c.dataset).where(
+            self.state.c.dataset == dataset, self.state.c.chunk == DATASET_DONE)).first() is not None
+
+    def chunk_hashes(self, dataset):
+        """Content hash and start id of every written chunk of a dataset, by chunk number."""
+        rows = self.session.execute(select(self.state.c.chunk, self.state.c.content_hash, self.state.c.start_id).where(
+            self.state.c.dataset == dataset, self.state.c.chunk != DATASET_DONE)).all()
+        return {chunk: (content_hash, start_id) for chunk, content_hash, start_id in rows}
+
+    def reset(self, dataset):
+        """Forgets all checkpoints of a dataset, e.g. before a full reload."""
+        self.session.execute(delete(self.state).where(self.state.c.dataset == dataset))
+        self.session.commit()
+
+    def discard_from(self, cls, dataset, chunk, start_id):
+        """Deletes the rows and checkpoints of chunk and all later chunks of an earlier run."""
+        if start_id is not None:
+            deleted = self.session.execute(delete(cls.__table__).where(cls.__table__.c.id > start_id)).rowcount
+            if deleted:
+                bump_generation(self.session, cls.__tablename__)
+            self.log.info("%s: deleted %s rows written after chunk %s by an earlier run", dataset, deleted, chunk)
+        self.session.execute(delete(self.state).where(self.state.c.dataset == dataset, self.state.c.chunk >= chunk))
+        self.session.commit()
+
+    def record_chunk(self, cls, dataset, chunk, content_hash, rows):
+        """Adds the checkpoint of a chunk to the session's transaction, committed by add_data."""
+        start_id = self.session.execute(select(func.max(cls.__table__.c.id))).scalar() or 0
+        self.session.execute(insert(self.state).values(dataset=dataset, chunk=chunk, content_hash=content_hash,
+                                                       rows=rows, start_id=start_id, completed_at=datetime.now()))
+
+    def mark_done(self, dataset, content_hash=None, rows=None):
+        """Marks a dataset as complete, with the rows of its chunks unless rows is given."""
+        if rows is None:
+            rows = self.session.execute(select(func.sum(self.state.c.rows)).where(
+                self.state.c.dataset == dataset, self.state.c.chunk != DATASET_DONE)).scalar()
+        self.session.execute(delete(self.state).where(self.state.c.dataset == dataset, self.state.c.chunk == DATASET_DONE))
+        self.session.execute(insert(self.state).values(dataset=dataset, chunk=DATASET_DONE, content_hash=content_hash,
+                                                       rows=rows, completed_at=datetime.now()))
+        self.session.commit()
+
+    def load_chunks(self, cls, dataset, chunks, resume=False, complete=True):
+        """
+        Writes the chunks of a dataset with add_data, each together with its checkpoint.
+
+        Args:
+            cls: Mapped table class created by open_table.
+            dataset (str): Name of the dataset in the run state.
+            chunks: Iterable of frames, e.g. from stream_dataset.
+            resume (bool): Skip the chunks already written by an earlier run. Without resume
+                the checkpoints of the dataset are reset and every chunk is written.
+            complete (bool): Mark the dataset as done after the last chunk. Pass False if
+                later stages belong to the import, and call mark_done after them.
+
+        Returns:
+            int: Number of rows written by this run.
+        """
+        if not resume:
+            self.reset(dataset)
+        stored = self.chunk_hashes(dataset)
+        verified = True
+        written = 0
+        total = 0
+        count = 0
+
+        for number, chunk in enumerate(chunks):
+            content_hash = frame_hash(chunk)
+            count = number + 1
+            total += len(chunk)
+            if verified and stored.get(number, (None, None))[0] == content_hash:
+                continue
+            if verified:
+                # First chunk to write: whatever an earlier run wrote from here on is replaced
+                verified = False
+                self.discard_from(cls, dataset, number, stored.get(number, (None, None))[1])
+                if number:
+                    self.log.info("%s: resuming at chunk %s", dataset, number)
+
+            self.record_chunk(cls, dataset, number, content_hash, len(chunk))
+            cls.add_data(chunk)
+            written += len(chunk)
+
+        if verified and count in stored:
+            # The source has fewer chunks than in the earlier run
+            self.discard_from(cls, dataset, count, stored[count][1])
+        if complete:
+            self.mark_done(dataset, rows=total)
+        return written
@@ -0,0 +1,202 @@
+# pylint: disable=line-too-long
+"""
+In-process instrumentation for the import pipeline.
+
+ImportMetrics collects wall time, row counts, bytes read and database round trips per
+stage (download, melt, to_dict, insert, versioning, commit, ...) and per dataset. Stages are
+timed with time.perf_counter and stored in plain dicts, so the overhead per stage is a
+few microseconds. Round trips are counted with a before_cursor_execute listener on the
+engine and attributed to the innermost open stage of the thread or asyncio task running the
+statement: the open stages are kept per context, so concurrent stages do not mix.
+
+At the end of a run the collected numbers can be written as a JSON summary and as a
+Prometheus textfile for the node exporter's textfile collector.
+
+Example:
+    metrics = ImportMetrics("nightly")
+    with metrics.stage("download", dataset="lfsa_egan") as stage:
+        data = eurostat.get_data_df("lfsa_egan", False)
+        stage.rows = len(data)
+    metrics.write_json("import_metrics.json")
+    metrics.write_prometheus("/var/lib/node_exporter/wifor_import.prom")
+"""
+
+# Standard library imports
+import os
+import json
+import time
+from datetime import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Third-party imports
+from sqlalchemy import event
+
+class StageRecord:
+    """Accumulated numbers for one (dataset, stage) pair."""
+
+    __slots__ = ('dataset', 'stage', 'seconds', 'calls', 'rows', 'bytes', 'round_trips')
+
+    def __init__(self, dataset, stage):
+        self.dataset = dataset
+        self.stage = stage
+        self.seconds = 0.0
+        self.calls = 0
+        self.rows = 0
+        self.bytes = 0
+        self.round_trips = 0
+
+    @property
+    def rows_per_second(self):
+        """Throughput of the stage, 0.0 when nothing was timed."""
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self):
+        """Returns the record as a JSON serialisable dict."""
+        return {'dataset': self.dataset,
+                'stage': self.stage,
+                'seconds': round(self.seconds, 6),
+                'calls': self.calls,
+                'rows': self.rows,
+                'rows_per_second': round(self.rows_per_second, 3),
+                'bytes': self.bytes,
+                'round_trips': self.round_trips}
+
+
+class _OpenStage:
+    """Handle yielded by ImportMetrics.stage, used to report rows and bytes of the stage."""
+
+    __slots__ = ('rows', 'bytes')
+
+    def __init__(self, rows, bytes_read):
+        self.rows = rows
+        self.bytes = bytes_read
+
+
+class ImportMetrics:
+    """Collects stage timings, row counts, bytes read and DB round trips of one import run."""
+
+    def __init__(self, run_name="import"):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.records = {}
+        self.round_trips = 0
+        # Open stages of the current thread or task, innermost last
+        self._active = ContextVar(f"import_metrics_{id(self)}", default=())
+        self._start = time.perf_counter()
+
+    def _record(self, dataset, stage):
+        key = (dataset, stage)
+        record = self.records.get(key)
+        if record is None:
+            record = self.records[key] = StageRecord(dataset, stage)
+        return record
+
+    @contextmanager
+    def stage(self, name, dataset=None, rows=0, bytes_read=0):
+        """
+        Times a stage. Rows and bytes can be passed up front or set on the yielded handle.
+
+        Args:
+            name (str): Stage name, e.g. 'download' or 'insert'.
+            dataset (str, optional): Dataset or table the stage works on.
+            rows (int, optional): Number of rows processed by the stage.
+            bytes_read (int, optional): Number of bytes read by the stage.
+
+        Yields:
+            _OpenStage: Handle whose rows and bytes attributes are added to the stage on exit.
+        """
+        record = self._record(dataset, name)
+        handle = _OpenStage(rows, bytes_read)
+        token = self._active.set(self._active.get() + (record,))
+        start = time.perf_counter()
+        try:
+            yield handle
+        finally:
+            record.seconds += time.perf_counter() - start
+            record.calls += 1
+            record.rows += int(handle.rows or 0)
+            record.bytes += int(handle.bytes or 0)
+            self._active.reset(token)
+
+    def count_round_trip(self, *_args):
+        """Counts one database round trip against the innermost open stage."""
+        self.round_trips += 1
+        active = self._active.get()
+        if active:
+            active[-1].round_trips += 1
+
+    def attach_engine(self, engine):
+        """
+        Counts every statement sent to the database through the engine as a round trip.
+        An executemany batch counts as a single round trip.
+        """
+        if not event.contains(engine, "before_cursor_execute", self.count_round_trip):
+            event.listen(engine, "before_cursor_execute", self.count_round_trip)
+
+    def detach_engine(self, engine):
+        """Stops counting round trips of the engine."""
+        if event.contains(engine, "before_cursor_execute", self.count_round_trip):
+            event.remove(engine, "before_cursor_execute", self.count_round_trip)
+
+#############################################################################################
+    def summary(self):
+        """
+        Returns the run summary.
+
+        Returns:
+            dict: Run metadata, total wall time, round trips and one entry per stage.
+        """
+        return {'run': self.run_name,
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'wall_seconds': round(time.perf_counter() - self._start, 6),
+                'round_trips': self.round_trips,
+                'stages': [record.to_dict() for record in self.records.values()]}
+
+    def write_json(self, path):
+        """Writes the run summary as JSON to path."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=4)
+
+    def to_prometheus(self):
+        """
+        Renders the collected numbers in the Prometheus text exposition format.
+
+        Returns:
+            str: Text for a node exporter textfile.
+        """
+        series = [
+            ('wifor_import_stage_seconds', 'gauge', 'Wall time spent in the stage.', 'seconds'),
+            ('wifor_import_stage_calls', 'gauge', 'Number of times the stage ran.', 'calls'),
+            ('wifor_import_stage_rows', 'gauge', 'Rows processed by the stage.', 'rows'),
+            ('wifor_import_stage_rows_per_second', 'gauge', 'Rows per second of the stage.', 'rows_per_second'),
+            ('wifor_import_stage_bytes', 'gauge', 'Bytes read by the stage.', 'bytes'),
+            ('wifor_import_stage_round_trips', 'gauge', 'Database round trips of the stage.', 'round_trips'),
+        ]
+        lines = []
+        for metric, metric_type, help_text, attribute in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for record in self.records.values():
+                labels = f'run="{self.run_name}",dataset="{record.dataset or ""}",stage="{record.stage}"'
+                lines.append(f"{metric}{{{labels}}} {getattr(record, attribute)}")
+
+        lines.append("# HELP wifor_import_round_trips Database round trips of the run.")
+        lines.append("# TYPE wifor_import_round_trips gauge")
+        lines.append(f'wifor_import_round_trips{{run="{self.run_name}"}} {self.round_trips}')
+        lines.append("# HELP wifor_import_last_run_timestamp_seconds Start of the run as unix time.")
+        lines.append("# TYPE wifor_import_last_run_timestamp_seconds gauge")
+        lines.append(f'wifor_import_last_run_timestamp_seconds{{run="{self.run_name}"}} {self.started_at.timestamp()}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes the Prometheus textfile. The file is written next to the target and moved
+        into place, so the node exporter never reads a half written file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
@@ -0,0 +1,230 @@
+# pylint: disable=line-too-long
+"""
+Derived indicators computed from the LFS tables.
+
+An indicator is declared in a JSON file in the indicators directory (INDICATOR_DIR, defaults
+to wifor_db/indicators), next to the table JSONs:
+
+    {
+        "name": "unemployment_rate",
+        "inputs": {
+            "unemployed": {"table": "lfsa_ugad", "filters": {"duration": "TOTAL"}},
+            "employed": {"table": "lfsa_egan", "filters": {"citizen": "TOTAL"}}
+        },
+        "formula": "unemployed / (unemployed + employed)",
+        "value_column": "rate"
+    }
+
+Every input is read with to_array and squeezed, so the formula works on LabelledArrays and
+is evaluated with NumPy in one pass: arrays align by dimension name and broadcast over the
+dimensions they do not share. Besides + - * / and numbers, formulas can call the functions
+in FUNCTIONS, e.g. share(employed, 'nace_r2'), growth(employed), sel(employed, sex='T') or
+location_quotient(employed, 'EU27_2020').
+
+The result is stored as table IND_<NAME> in long format. The DERIVED_INDICATORS table keeps
+a hash of the definition and the load generation of every input table (see generations,
+raised by every load, backfill or update of the table), so compute only evaluates an
+indicator again if its definition or one of its input tables changed.
+
+Example:
+    with TABLE_CONNECTOR() as tc:
+        engine = IndicatorEngine(tc)
+        engine.compute_all()
+        rates = engine.read("unemployment_rate")
+"""
+
+# Standard library imports
+import os
+import ast
+import json
+import hashlib
+import operator
+from datetime import datetime
+
+# Third-party imports
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, String, Integer, DateTime, Text, select
+
+# Local application imports
+from wifor_db import _env_cache
+from wifor_db.generations import load_generation
+
+REGISTRY_TABLE = 'DERIVED_INDICATORS'
+
+def location_quotient(array, reference, region='nuts_id', sector='nace_r2', total='TOTAL'):
+    """
+    Location quotient: share of a sector in a region relative to its share in a reference region.
+
+    Args:
+        array (LabelledArray): Values by region and sector, including the sector total.
+        reference (str): Reference region, e.g. 'EU27_2020'.
+        region (str): Region dimension.
+        sector (str): Sector dimension.
+        total (str): Label of the total over all sectors.
+
+    Returns:
+        LabelledArray: Quotients, above 1 where the sector is overrepresented in the region.
+    """
+    regional_share = array / array.sel(**{sector: total})
+    reference_share = array.sel(**{region: reference}) / array.sel(**{region: reference, sector: total})
+    return regional_share / reference_share
+
+# Functions available in formulas
+FUNCTIONS = {
+    'sel': lambda array, **labels: array.sel(**labels),
+    'sum': lambda array, dims=None: array.sum(dims),
+    'mean': lambda array, dims=None: array.mean(dims),
+    'share': lambda array, dims: array.share(dims),
+    'shift': lambda array, dim='year', periods=1: array.shift(dim, periods),
+    'growth': lambda array, dim='year', periods=1: array.growth(dim, periods),
+    'location_quotient': location_quotient,
+}
+
+OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+
+def evaluate_formula(formula, arrays):
+    """
+    Evaluates a formula over named arrays. Only arithmetic, constants and FUNCTIONS are allowed.
+
+    Args:
+        formula (str): Formula, e.g. 'unemployed / (unemployed + employed)'.
+        arrays (dict): Input name to LabelledArray.
+
+    Returns:
+        LabelledArray: The result.
+    """
+    def evaluate(node):
+        if isinstance(node, ast.Expression):
+            return evaluate(node.body)
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            return OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -evaluate(node.operand)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return node.value
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [evaluate(element) for element in node.elts]
+        if isinstance(node, ast.Name):
+            if node.id not in arrays:
+                raise ValueError(f"Unknown input in formula: {node.id}")
+            return arrays[node.id]
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            args = [evaluate(arg) for arg in node.args]
+            kwargs = {keyword.arg: evaluate(keyword.value) for keyword in node.keywords}
+            return FUNCTIONS[node.func.id](*args, **kwargs)
+        raise ValueError(f"Unsupported expression in formula: {ast.unparse(node)}")
+
+    return evaluate(ast.parse(formula, mode='eval'))
+
+def load_indicator(name, indicator_dir=None):
+    """Reads the JSON definition of an indicator."""
+    indicator_dir = indicator_dir or _env_cache.get('INDICATOR_DIR') or os.path.join(os.path.dirname(__file__), 'indicators')
+    with open(os.path.join(indicator_dir, f"{name}.json"), 'r', encoding="utf-8") as file:
+        return json.load(file)
+
+def list_indicators(indicator_dir=None):
+    """Names of all indicators in the indicators directory."""
+    indicator_dir = indicator_dir or _env_cache.get('INDICATOR_DIR') or os.path.join(os.path.dirname(__file__), 'indicators')
+    return sorted(file_name[:-5] for file_name in os.listdir(indicator_dir) if file_name.endswith('.json'))
+
+def definition_hash(definition):
+    """Hash of an indicator definition, independent of the key order of the JSON."""
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode("utf-8")).hexdigest()
+
+class IndicatorEngine:
+    """Evaluates indicator definitions on an open TABLE_CONNECTOR and caches the results as tables."""
+
+    def __init__(self, connector, indicator_dir=None):
+        self.connector = connector
+        self.indicator_dir = indicator_dir
+        self.log = connector.log
+        self.metrics = connector.metrics
+        self._tables = {}
+
+        self.registry = Table(REGISTRY_TABLE, MetaData(),
+                              Column('name', String(255), primary_key=True),
+                              Column('definition_hash', String(64)),
+                              Column('input_versions', Text),
+                              Column('rows', Integer),
+                              Column('computed_at', DateTime))
+        self.registry.create(connector.engine, checkfirst=True)
+
+    def table(self, name):
+        """Opens an input table once per engine, as a table class can only be mapped once per connector."""
+        if name not in self._tables:
+            self._tables[name] = self.connector.open_table(name)
+        return self._tables[name]
+
+    def input_versions(self, definition):
+        """
+        Load generation of every input table of an indicator, raised whenever the table changes.
+        """
+        return {table_name: load_generation(self.connector.session, self.table(table_name))
+                for table_name in sorted({source['table'] for source in definition['inputs'].values()})}
+
+    def is_current(self, name, definition=None, versions=None):
+        """True if the stored result of an indicator was computed from the current definition and inputs."""
+        definition = definition or load_indicator(name, self.indicator_dir)
+        versions = versions or self.input_versions(definition)
+        with self.connector.engine.connect() as connection:
+            stored = connection.execute(select(self.registry).where(self.registry.c.name == name)).mappings().first()
+        return (stored is not None
+                and stored['definition_hash'] == definition_hash(definition)
+                and json.loads(stored['input_versions']) == versions)
+
+    def evaluate(self, definition):
+        """Reads the inputs of an indicator and evaluates its formula."""
+        arrays = {}
+        for input_name, source in definition['inputs'].items():
+            arrays[input_name] = self.table(source['table']).to_array(
+                value_column=source.get('value_column'), filters=source.get('filters'),
+                exclude_flags=source.get('exclude_flags')).squeeze()
+        return evaluate_formula(definition['formula'], arrays)
+
+    def compute(self, name, force=False):
+        """
+        Computes an indicator and stores it, unless the stored result is current.
+
+        Args:
+            name (str): Name of the indicator JSON.
+            force (bool): Compute even if the stored result is current.
+
+        Returns:
+            bool: True if the indicator was computed, False if the stored result was reused.
+        """
+        definition = load_indicator(name, self.indicator_dir)
+        versions = self.input_versions(definition)
+        if not force and self.is_current(name, definition, versions):
+            self.log.info("indicator %s is current", name)
+            return False
+
+        value_column = definition.get('value_column', 'value')
+        with self.metrics.stage("derive", name) as stage:
+            data = self.evaluate(definition).to_frame(value_column)
+            stage.rows = len(data)
+
+        # Result and registry entry are replaced in one transaction
+        with self.metrics.stage("store", name, rows=len(data)):
+            with self.connector.engine.begin() as connection:
+                data.to_sql(f"IND_{name.upper()}", connection, if_exists='replace', index=False, chunksize=10000)
+                connection.execute(self.registry.delete().where(self.registry.c.name == name))
+                connection.execute(self.registry.insert().values(
+                    name=name, definition_hash=definition_hash(definition), input_versions=json.dumps(versions),
+                    rows=len(data), computed_at=datetime.now()))
+
+        self.log.info("indicator %s computed with %s rows", name, len(data))
+        return True
+
+    def compute_all(self, names=None, force=False):
+        """
+        Computes all (or the given) indicators whose stored result is outdated.
+
+        Returns:
+            dict: Indicator name to True if it was computed, False if it was current.
+        """
+        return {name: self.compute(name, force) for name in names or list_indicators(self.indicator_dir)}
+
+    def read(self, name):
+        """Reads the stored result of an indicator, computing it first if it is outdated."""
+        self.compute(name)
+        return pd.read_sql_table(f"IND_{name.upper()}", self.connector.engine)
@@ -0,0 +1,277 @@
+# pylint: disable=line-too-long
+"""
+Labelled N-dimensional arrays over the LFS tables.
+
+A LabelledArray is a NumPy array whose axes carry a dimension name and a code list, in the
+style of xarray. Arithmetic between two arrays aligns them by dimension name: shared
+dimensions are reduced to the labels present in both (inner join), dimensions present in
+only one array are broadcast. That allows computing e.g. unemployment rates from LFSA_UGAD
+and LFSA_EGAN without joins or Python loops:
+
+    with TABLE_CONNECTOR() as tc:
+        unemployed = tc.open_table("lfsa_ugad").to_array(filters={'duration': 'TOTAL'}).squeeze()
+        employed = tc.open_table("lfsa_egan").to_array(filters={'citizen': 'TOTAL'}).squeeze()
+    rate = unemployed / (unemployed + employed)
+    rate.sel(nuts_id='DE', sex='T').to_frame('rate')
+
+Arrays are built from long frames with from_frame, from tables with the to_array class
+method, and from the cube store with Cube.to_array.
+"""
+
+import operator
+import numpy as np
+import pandas as pd
+
+# Columns that are never dimensions of an array
+NON_DIMENSIONS = {'id', 'flags', 'version_number', 'effective_date', 'expiry_date'}
+
+def table_dimensions(table, value_column=None):
+    """
+    Splits the schema columns of a TABLE_CONNECTOR table into dimensions and value column.
+
+    Args:
+        table: Mapped table class returned by open_table.
+        value_column (str, optional): Value column. Defaults to the first float column.
+
+    Returns:
+        tuple: Dimension columns in schema order (list) and the value column (str).
+    """
+    float_columns = [name for name in table.__column_names__ if table.__table__.c[name].type.python_type is float]
+    value_column = value_column or float_columns[0]
+    dims = [name for name in table.__column_names__ if name not in float_columns and name not in NON_DIMENSIONS]
+    return dims, value_column
+
+def frame_positions(data, dims):
+    """
+    Factorizes the dimension columns of a long frame.
+
+    Args:
+        data (pandas.DataFrame): Long frame.
+        dims (list): Dimension columns.
+
+    Returns:
+        tuple: Sorted code list per dimension (dict) and the position arrays of the rows (list).
+            Datetime 'year' columns are reduced to the year as int.
+    """
+    coords = {}
+    positions = []
+    for dim in dims:
+        column = data[dim]
+        if dim == 'year' and pd.api.types.is_datetime64_any_dtype(column):
+            column = column.dt.year
+        categorical = pd.Categorical(column)
+        coords[dim] = [label.item() if hasattr(label, 'item') else label for label in categorical.categories]
+        positions.append(categorical.codes)
+    return coords, positions
+
+class _Positions(dict):
+    """Label to position along a dimension, with a readable error for unknown labels."""
+
+    def __init__(self, dim, labels):
+        super().__init__((label, position) for position, label in enumerate(labels))
+        self.dim = dim
+
+    def __missing__(self, label):
+        raise KeyError(f"{label!r} is not a label of dimension {self.dim}")
+
+class LabelledArray:
+    """NumPy array with named dimensions and a code list per dimension."""
+
+    __array_priority__ = 1000
+
+    def __init__(self, dims, coords, values):
+        values = np.asarray(values)
+        if values.ndim != len(dims):
+            raise ValueError(f"Got {len(dims)} dimensions for an array with {values.ndim} axes")
+        self.dims = list(dims)
+        self.coords = {dim: list(coords[dim]) for dim in self.dims}
+        self.values = values
+
+    @classmethod
+    def from_frame(cls, data, dims, value_column):
+        """
+        Builds a dense array from a long frame, NaN for missing combinations.
+
+        Args:
+            data (pandas.DataFrame): Long frame with the dimension columns and value_column.
+            dims (list): Dimension columns in array order.
+            value_column (str): Column holding the values.
+
+        Returns:
+            LabelledArray: The array.
+        """
+        coords, positions = frame_positions(data, dims)
+        values = np.full(tuple(len(coords[dim]) for dim in dims), np.nan)
+        values[tuple(positions)] = data[value_column].to_numpy(dtype=np.float64, na_value=np.nan)
+        return cls(dims, coords, values)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __repr__(self):
+        sizes = ', '.join(f"{dim}: {len(self.coords[dim])}" for dim in self.dims)
+        return f"<LabelledArray ({sizes})>"
+
+#############################################################################################
+    def sel(self, **labels):
+        """
+        Selects by labels. A single label drops the dimension, a list of labels or a slice of
+        labels (inclusive) keeps it.
+
+        Args:
+            **labels: Dimension name to a label, a list of labels or a slice of labels.
+
+        Returns:
+            LabelledArray: The selection.
+        """
+        values = self.values
+        dims = []
+        coords = {}
+        for dim in self.dims:
+            positions = _Positions(dim, self.coords[dim])
+            axis = len(dims)
+            if dim not in labels:
+                dims.append(dim)
+                coords[dim] = self.coords[dim]
+            elif isinstance(labels[dim], slice):
+                start = positions[labels[dim].start] if labels[dim].start is not None else None
+                stop = positions[labels[dim].stop] + 1 if labels[dim].stop is not None else None
+                values = values[(slice(None),) * axis + (slice(start, stop),)]
+                dims.append(dim)
+                coords[dim] = self.coords[dim][start:stop]
+            elif isinstance(labels[dim], (list, tuple, np.ndarray, pd.Index)):
+                selected = [positions[label] for label in labels[dim]]
+                values = np.take(values, selected, axis=axis)
+                dims.append(dim)
+                coords[dim] = list(labels[dim])
+            else:
+                values = np.take(values, positions[labels[dim]], axis=axis)
+        return LabelledArray(dims, coords, values)
+
+    def squeeze(self):
+        """Drops all dimensions with a single label, e.g. freq and unit."""
+        dims = [dim for dim in self.dims if len(self.coords[dim]) != 1]
+        values = self.values.reshape(tuple(len(self.coords[dim]) for dim in dims))
+        return LabelledArray(dims, self.coords, values)
+
+    def transpose(self, *dims):
+        """Reorders the dimensions."""
+        return LabelledArray(dims, self.coords, self.values.transpose([self.dims.index(dim) for dim in dims]))
+
+    def _reduce(self, function, dims, skipna=True):
+        dims = [dims] if isinstance(dims, str) else list(dims or self.dims)
+        axes = tuple(self.dims.index(dim) for dim in dims)
+        kept = [dim for dim in self.dims if dim not in dims]
+        values = function(self.values, axis=axes)
+        if skipna:
+            # All-missing cells stay missing instead of becoming 0
+            values = np.where(np.all(np.isnan(self.values), axis=axes), np.nan, values)
+        return LabelledArray(kept, self.coords, values)
+
+    def sum(self, dims=None, skipna=True):
+        """Sums over dims (all dimensions by default), ignoring missing cells."""
+        return self._reduce(np.nansum if skipna else np.sum, dims, skipna)
+
+    def mean(self, dims=None, skipna=True):
+        """Averages over dims (all dimensions by default), ignoring missing cells."""
+        with np.errstate(invalid='ignore'):
+            return self._reduce(np.nanmean if skipna else np.mean, dims, skipna)
+
+    def share(self, dims):
+        """Share of every cell in the total over dims, e.g. NACE shares within each region."""
+        return self / self.sum(dims)
+
+    def shift(self, dim, periods=1):
+        """
+        Moves the values along a numeric dimension by label, e.g. the previous year for
+        periods=1. Labels without a label periods before them become missing, so gaps in the
+        years are respected.
+        """
+        labels = np.asarray(self.coords[dim])
+        positions = {label: position for position, label in enumerate(self.coords[dim])}
+        source = np.array([positions.get(label - periods, -1) for label in labels.tolist()], dtype=np.intp)
+        axis = self.dims.index(dim)
+        values = np.take(self.values.astype(np.float64), np.where(source < 0, 0, source), axis=axis)
+        mask_shape = [1] * self.values.ndim
+        mask_shape[axis] = len(source)
+        values = np.where((source < 0).reshape(mask_shape), np.nan, values)
+        return LabelledArray(self.dims, self.coords, values)
+
+    def growth(self, dim='year', periods=1):
+        """Relative change to the value periods labels before, e.g. year-on-year growth."""
+        return self / self.shift(dim, periods) - 1
+
+    def to_frame(self, value_column='value', dropna=True):
+        """
+        Converts the array to a long frame.
+
+        Args:
+            value_column (str): Name of the value column.
+            dropna (bool): Leave out missing cells.
+
+        Returns:
+            pandas.DataFrame: One row per cell with the dimension labels.
+        """
+        index = pd.MultiIndex.from_product([self.coords[dim] for dim in self.dims], names=self.dims)
+        frame = pd.DataFrame({value_column: self.values.ravel()}, index=index)
+        if dropna:
+            frame = frame[frame[value_column].notna()]
+        return frame.reset_index()
+
+#############################################################################################
+    def _aligned(self, dims, coords):
+        """Values reduced to coords and expanded to dims, ready for NumPy broadcasting."""
+        values = self.values
+        for axis, dim in enumerate(self.dims):
+            if coords[dim] != self.coords[dim]:
+                positions = {label: position for position, label in enumerate(self.coords[dim])}
+                values = np.take(values, [positions[label] for label in coords[dim]], axis=axis)
+        values = values.transpose([self.dims.index(dim) for dim in dims if dim in self.dims])
+        shape = [len(coords[dim]) if dim in self.dims else 1 for dim in dims]
+        return values.reshape(shape)
+
+    def _binary(self, other, function):
+        if not isinstance(other, LabelledArray):
+            return LabelledArray(self.dims, self.coords, function(self.values, other))
+
+        dims = self.dims + [dim for dim in other.dims if dim not in self.dims]
+        coords = {}
+        for dim in dims:
+            if dim in self.coords and dim in other.coords:
+                other_labels = set(other.coords[dim])
+                coords[dim] = [label for label in self.coords[dim] if label in other_labels]
+            else:
+                coords[dim] = self.coords[dim] if dim in self.coords else other.coords[dim]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = function(self._aligned(dims, coords), other._aligned(dims, coords))
+        return LabelledArray(dims, coords, values)
+
+    def __add__(self, other):
+        return self._binary(other, operator.add)
+
+    def __sub__(self, other):
+        return self._binary(other, operator.sub)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul)
+
+    def __truediv__(self, other):
+        return self._binary(other, operator.truediv)
+
+    def __radd__(self, other):
+        return LabelledArray(self.dims, self.coords, other + self.values)
+
+    def __rsub__(self, other):
+        return LabelledArray(self.dims, self.coords, other - self.values)
+
+    def __rmul__(self, other):
+        return LabelledArray(self.dims, self.coords, other * self.values)
+
+    def __rtruediv__(self, other):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return LabelledArray(self.dims, self.coords, other / self.values)
+
+    def __neg__(self):
+        return LabelledArray(self.dims, self.coords, -self.values)
@@ -0,0 +1,163 @@
+# pylint: disable=line-too-long
+"""
+Compiles the table JSON schemas into a static, importable models module.
+
+open_table normally reads the JSON definition, resolves the column types by name and builds
+the class with type() every time a table is opened. compile_schemas does this work once and
+writes wifor_db/compiled_models.py, which holds one factory per table with a literal class
+body, plus the SHA-256 of every JSON source it was generated from. The hash also covers the
+code that generates and backs the classes (this module and sql_handler), so a module compiled
+by an older version of the package is not used after an upgrade.
+
+build_table_class uses the compiled factory when the module exists and the hash of the
+table's JSON file and the generating code still matches; otherwise it falls back to the
+dynamic path, so ad-hoc or edited schemas keep working without recompiling.
+
+Run for example with:
+poetry run wifor-db compile-schemas
+"""
+
+# Standard library imports
+import os
+import glob
+import json
+import hashlib
+import importlib
+from functools import lru_cache
+
+# Local application imports
+from wifor_db import _env_cache
+
+COMPILED_MODULE = 'wifor_db.compiled_models'
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compiled_models.py')
+# Modules whose code shapes the compiled classes
+GENERATOR_SOURCES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                     for name in ('model_compiler.py', 'sql_handler.py')]
+
+# Factories whose source hash was checked in this process, keyed by lower case table file name
+_checked_factories = {}
+
+@lru_cache(maxsize=None)
+def generator_hash():
+    """Returns the SHA-256 of the code generating the compiled classes."""
+    digest = hashlib.sha256()
+    for path in GENERATOR_SOURCES:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def source_hash(json_path):
+    """Returns the SHA-256 of a JSON schema file together with the generating code."""
+    digest = hashlib.sha256(generator_hash().encode())
+    with open(json_path, 'rb') as file:
+        digest.update(file.read())
+    return digest.hexdigest()
+
+def _render_class(connector, class_name, json_data):
+    """Renders the factory function of one table."""
+    table_name = json_data['table_name']
+    repr_string = connector.create_repr_string(connector, table_name, json_data['columns'])
+
+    lines = [f"def build_{class_name}(Base):",
+             f"    class {table_name}(Base):",
+             f"        __tablename__ = {table_name!r}",
+             f"        __table_args__ = table_args({table_name!r}, {json_data['identifier']!r})",
+             f"        __unique_identifier__ = {json_data['identifier']!r}",
+             f"        __column_names__ = {[column['name'] for column in json_data['columns']]!r}",
+             f"        __repr_string__ = {repr_string!r}",
+             "",
+             f"        id = id_column({table_name!r})"]
+
+    for column in json_data['columns']:
+        # Resolving the type here fails the compile for unknown types instead of the import
+        connector.parse_type(connector, column['type'])
+        server_default = str(column['default']) if 'default' in column else None
+        type_module = '' if column['type'].startswith('Geometry') else 'sqlalchemy.'
+        lines.append(f"        {column['name']} = Column({type_module}{column['type']}, index={column.get('index', False)!r}, server_default={server_default!r})")
+
+    lines += ["        version_number = Column(Integer, default=1)",
+              "        effective_date = Column(Date, default=datetime.now)",
+              "        expiry_date = Column(Date, default=None)",
+              "",
+              "        def __repr__(self):",
+              "            return self.__repr_string__.format(self=self)",
+              "",
+              f"    return {table_name}",
+              ""]
+    return "\n".join(lines)
+
+def compile_schemas(class_dir=None, output=DEFAULT_OUTPUT):
+    """
+    Writes the compiled models module for all JSON schemas in class_dir.
+
+    Args:
+        class_dir (str, optional): Directory of the table JSONs. Defaults to CLASS_DIR.
+        output (str): Path of the generated module.
+
+    Returns:
+        list: Names of the compiled tables.
+    """
+    # pylint: disable=import-outside-toplevel
+    from wifor_db.sql_handler import TABLE_CONNECTOR
+
+    class_dir = class_dir or _env_cache['CLASS_DIR']
+    connector = TABLE_CONNECTOR()
+
+    factories = []
+    hashes = {}
+    for json_path in sorted(glob.glob(os.path.join(class_dir, '*.json'))):
+        class_name = os.path.splitext(os.path.basename(json_path))[0].lower()
+        with open(json_path, 'r', encoding="utf-8") as file:
+            json_data = json.load(file)
+        factories.append(_render_class(connector, class_name, json_data))
+        hashes[class_name] = source_hash(json_path)
+        connector.log.info("compiled schema %s", json_path)
+
+    header = ['"""',
+              "Models compiled from the table JSON schemas by `wifor-db compile-schemas`.",
+              "Do not edit, rerun the compiler after changing a schema.",
+              '"""',
+              "# pylint: skip-file",
+              "from datetime import datetime",
+              "import sqlalchemy",
+              "from sqlalchemy import Column, Integer, Date",
+              "from wifor_db.spatial import Geometry",
+              "from wifor_db.sql_handler import id_column, table_args",
+              "",
+              f"SOURCE_HASHES = {json.dumps(hashes, indent=4)}",
+              ""]
+    registry = ["FACTORIES = {"] + [f"    {name!r}: build_{name}," for name in hashes] + ["}", ""]
+
+    with open(output, 'w', encoding="utf-8") as file:
+        file.write("\n".join(header) + "\n" + "\n".join(factories) + "\n" + "\n".join(registry))
+
+    return list(hashes)
+
+def compiled_model_factory(class_name):
+    """
+    Returns the compiled factory of a table if it is up to date with its JSON file.
+
+    Args:
+        class_name (str): Name passed to open_table.
+
+    Returns:
+        callable or None: Function building the mapped class on a declarative Base, or None
+        if there is no compiled module, no compiled model or the JSON changed since compiling.
+    """
+    key = class_name.lower()
+    if key in _checked_factories:
+        return _checked_factories[key]
+
+    factory = None
+    try:
+        compiled = importlib.import_module(COMPILED_MODULE)
+    except ImportError:
+        compiled = None
+
+    json_path = os.path.join(_env_cache['CLASS_DIR'], f"{class_name}.json")
+    if compiled is not None and key in compiled.FACTORIES and os.path.exists(json_path):
+        if compiled.SOURCE_HASHES[key] == source_hash(json_path):
+            factory = compiled.FACTORIES[key]
+
+    _checked_factories[key] = factory
+    return factory
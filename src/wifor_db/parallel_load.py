@@ -0,0 +1,155 @@
+# pylint: disable=line-too-long
+"""
+Partition-parallel loading of one large frame into a table.
+
+add_data converts and writes a frame on one connection and one core. parallel_load splits
+the frame by a partition key (e.g. 'cntr_code' or 'year') and hands the partitions round
+robin to a process pool. Every worker opens its own TABLE_CONNECTOR and converts and writes
+its partitions with add_data into its own staging target:
+    sqlite, duckdb:     a database file per worker in a temporary directory, as a file
+                        database takes one writer at a time.
+    postgresql, mysql:  a staging table <TABLE>__STAGE_<n> per worker in the same database.
+
+Once all workers are done, the staging targets are copied into the table with one
+INSERT ... SELECT each, all in a single transaction on the connector's session. Readers see
+the table either without or with the whole frame, never partially loaded, and a failing
+worker leaves the table untouched. The staging files and tables are removed afterwards.
+
+The rows get their ids from the table; version_number, effective_date and expiry_date are
+copied from the staging targets, where add_data set them as for a direct load.
+
+Example:
+    with TABLE_CONNECTOR() as tc:
+        table = tc.open_table("lfsa_egan")
+        table.init_table()
+        tc.parallel_load("lfsa_egan", data, partition_key="cntr_code", workers=4)
+"""
+
+# Standard library imports
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Third-party imports
+from sqlalchemy import text
+
+# Local application imports
+from wifor_db.spatial import sync_spatial_index
+from wifor_db.generations import bump_generation
+
+# Databases whose staging targets are separate files instead of tables
+FILE_DIALECTS = ('sqlite', 'duckdb')
+# SQLite attaches at most 10 databases to a connection
+MAX_WORKERS = 8
+
+def _load_partitions(class_name, db_url, table_name, frames):
+    """Worker: writes its partitions into its staging target and returns the number of rows."""
+    # pylint: disable=import-outside-toplevel
+    from wifor_db.sql_handler import TABLE_CONNECTOR
+
+    rows = 0
+    with TABLE_CONNECTOR(db_url=db_url) as tc:
+        stage = tc.open_table(class_name, table_name=table_name)
+        stage.init_table()
+        for frame in frames:
+            stage.add_data(frame)
+            rows += len(frame)
+    return rows
+
+def _quote(dialect_name, name):
+    return f"`{name}`" if dialect_name == 'mysql' else f'"{name}"'
+
+def _stage_targets(connector, table_name, workers, directory):
+    """Database URL and table name of the staging target of every worker."""
+    url = connector.engine.url
+    dialect_name = connector.engine.dialect.name
+    if dialect_name in FILE_DIALECTS:
+        return [(f"{url.drivername}:///{os.path.join(directory, f'stage_{number}.db')}", table_name)
+                for number in range(workers)]
+    return [(url.render_as_string(hide_password=False), f"{table_name}__STAGE_{number}") for number in range(workers)]
+
+def _copy_statements(dialect_name, table, stages):
+    """INSERT ... SELECT of every staging target into the table, with the schema the stages live in."""
+    columns = [column.name for column in table.columns if column.name != 'id']
+    column_list = ', '.join(_quote(dialect_name, column) for column in columns)
+    statements = []
+    for number, (_, stage_table) in enumerate(stages):
+        source = _quote(dialect_name, stage_table)
+        if dialect_name in FILE_DIALECTS:
+            source = f"stage_{number}.{source}"
+        statements.append(f"INSERT INTO {_quote(dialect_name, table.name)} ({column_list}) "
+                          f"SELECT {column_list} FROM {source} ORDER BY id")
+    return statements
+
+def partition_frame(data, partition_key, workers):
+    """Splits a frame by the values of partition_key and deals the partitions to the workers."""
+    assigned = [[] for _ in range(workers)]
+    # Largest partitions first, so the workers get similar numbers of rows
+    partitions = sorted((frame for _, frame in data.groupby(partition_key, sort=False, dropna=False)), key=len, reverse=True)
+    for number, frame in enumerate(partitions):
+        assigned[number % workers].append(frame)
+    return [frames for frames in assigned if frames]
+
+def parallel_load(connector, class_name, data, partition_key, workers=None):
+    """
+    Writes a frame into a table with one process per group of partitions.
+
+    Args:
+        connector (TABLE_CONNECTOR): Open connector of the target database.
+        class_name (str): Name of the table JSON, the table must exist (see init_table).
+        data (pandas.DataFrame): Frame with the schema columns.
+        partition_key (str or list): Column(s) the frame is split by.
+        workers (int, optional): Number of processes, defaults to the number of CPUs (at most 8).
+
+    Returns:
+        int: Number of rows written.
+    """
+    table_name = connector.load_class_json(connector, class_name)['table_name']
+    if table_name not in connector.Base.metadata.tables:
+        connector.open_table(class_name)
+    table = connector.Base.metadata.tables[table_name]
+    dialect_name = connector.engine.dialect.name
+
+    workers = min(workers or os.cpu_count() or 1, MAX_WORKERS)
+    partitions = partition_frame(data, partition_key, workers)
+    if not partitions:
+        return 0
+
+    directory = tempfile.mkdtemp(prefix=f"{table_name}_stage_")
+    stages = _stage_targets(connector, table_name, len(partitions), directory)
+    connector.session.commit()
+    try:
+        with connector.metrics.stage("parallel_stage", table_name, rows=len(data)):
+            with ProcessPoolExecutor(max_workers=len(partitions)) as executor:
+                rows = sum(executor.map(_load_partitions, [class_name] * len(stages),
+                                        [url for url, _ in stages], [name for _, name in stages], partitions))
+
+        with connector.metrics.stage("parallel_swap", table_name, rows=rows):
+            if dialect_name in FILE_DIALECTS:
+                # ATTACH is not allowed inside a transaction on SQLite
+                for number, (url, _) in enumerate(stages):
+                    path = url.split(':///', 1)[1]
+                    connector.session.execute(text(f"ATTACH DATABASE '{path}' AS stage_{number}"))
+            try:
+                for statement in _copy_statements(dialect_name, table, stages):
+                    connector.session.execute(text(statement))
+                bump_generation(connector.session, table_name)
+                connector.session.commit()
+            except Exception:
+                connector.session.rollback()
+                raise
+            finally:
+                if dialect_name in FILE_DIALECTS:
+                    for number in range(len(stages)):
+                        connector.session.execute(text(f"DETACH DATABASE stage_{number}"))
+                    connector.session.commit()
+        sync_spatial_index(connector.session, table)
+        connector.log.info("parallel load of %s: %s rows from %s workers", table_name, rows, len(stages))
+        return rows
+    finally:
+        if dialect_name not in FILE_DIALECTS:
+            with connector.engine.begin() as connection:
+                for _, stage_table in stages:
+                    connection.execute(text(f"DROP TABLE IF EXISTS {_quote(dialect_name, stage_table)}"))
+        shutil.rmtree(directory, ignore_errors=True)
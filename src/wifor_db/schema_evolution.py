@@ -0,0 +1,261 @@
+# pylint: disable=line-too-long
+"""
+Schema evolution for tables defined by the JSON schemas in wifor_db/tables.
+
+diff_schema compares the mapped class built from the JSON definition with the live table
+and returns the steps needed to bring the table up to date:
+    add_column:   a column of the JSON definition is missing in the table.
+    widen_type:   a column type got wider, e.g. String(255) -> String(512), Integer -> BigInteger,
+                  Integer -> Float, Numeric(5, 2) -> Numeric(8, 3) or Date -> DateTime. Number
+                  types are compared by the digits they hold, so BigInteger -> Float or
+                  Integer -> Numeric(5, 2) lose data and are no widening.
+    add_index:    a column marked with "index": true has no index yet, or a geometry column
+                  has no spatial index (see spatial).
+
+apply_schema_steps runs the generated ALTER TABLE / CREATE INDEX statements. Columns and
+types that are not in the JSON definition are never dropped, and a type change that would
+lose data raises a ValueError, since it needs a reload of the table.
+
+New columns are NULL for existing rows unless the JSON column has a "default", which is
+used as server default and so filled in by the ADD COLUMN itself. backfill_columns fills
+new columns from a frame, writing only the new columns of the matching rows.
+
+Example JSON column:
+    {"name": "flags", "type": "SmallInteger", "default": 0, "index": true}
+"""
+
+# Third-party imports
+import pandas as pd
+from sqlalchemy import inspect, select, update, bindparam, text
+from sqlalchemy import types as sqltypes
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+# Local application imports
+from wifor_db import duckdb_backend
+from wifor_db.spatial import Geometry, geometry_columns, has_spatial_index, spatial_index_statement
+from wifor_db.generations import bump_generation
+
+# Decimal digits of the integer types: all values fit into the first, every number of the
+# second number of digits fits into the type
+INTEGER_DIGITS = {sqltypes.SmallInteger: (5, 4), sqltypes.Integer: (10, 9), sqltypes.BigInteger: (19, 18)}
+# Decimal digits a float type holds exactly, single and double precision
+SINGLE_DIGITS, DOUBLE_DIGITS = 6, 15
+
+def _type_family(column_type):
+    """
+    Maps a type to its family and rank within the family. A larger rank holds every value
+    of a smaller rank of the same family. Numbers are compared by _number_holds instead.
+    """
+    if isinstance(column_type, sqltypes.Text):
+        return 'string', float('inf')
+    if isinstance(column_type, sqltypes.String):
+        return 'string', column_type.length or float('inf')
+    if isinstance(column_type, (sqltypes.Integer, sqltypes.Float, sqltypes.Numeric)):
+        return 'number', 0
+    if isinstance(column_type, sqltypes.DateTime):
+        return 'temporal', 2
+    if isinstance(column_type, sqltypes.Date):
+        return 'temporal', 1
+    return column_type._type_affinity.__name__, 0
+
+def _number_kind(column_type):
+    """
+    Describes a number type as ('integer', all digits, guaranteed digits), ('decimal',
+    precision, scale) with None for an unlimited precision, or ('float', exact digits).
+    """
+    if isinstance(column_type, sqltypes.Integer):
+        for integer_type in (sqltypes.BigInteger, sqltypes.SmallInteger, sqltypes.Integer):
+            if isinstance(column_type, integer_type):
+                return ('integer',) + INTEGER_DIGITS[integer_type]
+    if isinstance(column_type, sqltypes.Float):
+        single = isinstance(column_type, sqltypes.REAL) or (column_type.precision is not None and column_type.precision <= 24)
+        return 'float', SINGLE_DIGITS if single else DOUBLE_DIGITS
+    return 'decimal', column_type.precision, column_type.scale or 0
+
+def _number_holds(target, source):
+    """True if the number type target holds every value of the number type source."""
+    target_kind, source_kind = _number_kind(target), _number_kind(source)
+    if source_kind[0] == 'integer':
+        digits = source_kind[1]
+        if target_kind[0] == 'integer':
+            return target_kind[1] >= digits
+        if target_kind[0] == 'decimal':
+            return target_kind[1] is None or target_kind[1] - target_kind[2] >= digits
+        return target_kind[1] >= digits
+    if source_kind[0] == 'decimal':
+        precision, scale = source_kind[1], source_kind[2]
+        if precision is None:
+            return target_kind[0] == 'decimal' and target_kind[1] is None
+        if target_kind[0] == 'integer':
+            return scale == 0 and precision <= target_kind[2]
+        if target_kind[0] == 'decimal':
+            return target_kind[1] is None or (target_kind[2] >= scale and target_kind[1] - target_kind[2] >= precision - scale)
+        # Decimal fractions have no exact binary representation
+        return False
+    return target_kind[0] == 'float' and target_kind[1] >= source_kind[1]
+
+def compare_types(live_type, schema_type):
+    """
+    Compares the type of a live column with the type in the JSON definition.
+
+    Returns:
+        str: 'equal', 'widen' or 'incompatible'.
+    """
+    if isinstance(schema_type, Geometry):
+        # Without a PostGIS dialect geometry columns are reflected as NullType or BLOB
+        return 'equal' if isinstance(live_type, (Geometry, sqltypes.NullType, sqltypes.LargeBinary)) else 'incompatible'
+    live_family, live_rank = _type_family(live_type)
+    schema_family, schema_rank = _type_family(schema_type)
+    if live_family != schema_family:
+        return 'incompatible'
+    if live_family == 'number':
+        widens, narrows = _number_holds(schema_type, live_type), _number_holds(live_type, schema_type)
+        if widens:
+            return 'equal' if narrows else 'widen'
+        return 'incompatible'
+    if schema_rank == live_rank:
+        return 'equal'
+    return 'widen' if schema_rank > live_rank else 'incompatible'
+
+def _alter_type_statement(dialect, table_name, column):
+    """ALTER statement changing a column type, None where the dialect needs none."""
+    preparer = dialect.identifier_preparer
+    table = preparer.quote(table_name)
+    column_name = preparer.quote(column.name)
+    type_string = column.type.compile(dialect=dialect)
+
+    if dialect.name == 'postgresql':
+        return f"ALTER TABLE {table} ALTER COLUMN {column_name} TYPE {type_string}"
+    if dialect.name in ('mysql', 'mariadb'):
+        # MODIFY COLUMN replaces the whole definition, NOT NULL and DEFAULT are written again
+        return f"ALTER TABLE {table} MODIFY COLUMN {CreateColumn(column).compile(dialect=dialect)}"
+    if dialect.name == 'sqlite':
+        # SQLite does not enforce declared lengths and stores all integers alike
+        return None
+    return f"ALTER TABLE {table} ALTER COLUMN {column_name} TYPE {type_string}"
+
+def diff_schema(engine, cls):
+    """
+    Compares the JSON definition of a table with the live table.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine of the database holding the table.
+        cls: Mapped table class created by open_table.
+
+    Returns:
+        list: Steps as dicts with 'action', 'column' and 'statement' (None for no-op steps).
+
+    Raises:
+        ValueError: If a column type changed in a way that is not a widening.
+    """
+    table = cls.__table__
+    dialect = engine.dialect
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return []
+
+    if duckdb_backend.is_duckdb(engine):
+        # The JSON types are compared as DuckDB stores them, which has e.g. no string lengths
+        with engine.connect() as connection:
+            live_columns = duckdb_backend.live_columns(connection, table.name)
+            live_indexes = duckdb_backend.live_indexes(connection, table.name)
+            schema_types = {column.name: duckdb_backend.stored_type(connection, column.type) for column in table.columns}
+    else:
+        live_columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        live_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        schema_types = {column.name: column.type for column in table.columns}
+    preparer = dialect.identifier_preparer
+
+    steps = []
+    incompatible = []
+    for column in table.columns:
+        if column.name not in live_columns:
+            steps.append({'action': 'add_column',
+                          'column': column.name,
+                          'statement': f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}"})
+            continue
+
+        comparison = compare_types(live_columns[column.name]['type'], schema_types[column.name])
+        if comparison == 'widen':
+            steps.append({'action': 'widen_type',
+                          'column': column.name,
+                          'statement': _alter_type_statement(dialect, table.name, column)})
+        elif comparison == 'incompatible':
+            incompatible.append(f"{column.name}: {live_columns[column.name]['type']} -> {column.type}")
+
+    if incompatible:
+        raise ValueError(f"Schema of {table.name} changed in a way that needs a reload: {', '.join(incompatible)}")
+
+    for index in table.indexes:
+        if index.name not in live_indexes:
+            steps.append({'action': 'add_index',
+                          'column': ', '.join(column.name for column in index.columns),
+                          'statement': str(CreateIndex(index).compile(dialect=dialect))})
+
+    for column in geometry_columns(table):
+        if column.name not in live_columns or not has_spatial_index(engine, table.name, column.name):
+            steps.append({'action': 'add_index',
+                          'column': column.name,
+                          'statement': spatial_index_statement(dialect.name, table.name, column.name)})
+
+    return steps
+
+def apply_schema_steps(engine, steps, log=None):
+    """
+    Runs the statements of diff_schema in one transaction.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine of the database holding the table.
+        steps (list): Steps returned by diff_schema.
+        log (logging.Logger, optional): Logger for the applied statements.
+    """
+    with engine.begin() as connection:
+        for step in steps:
+            if step['statement'] is None:
+                if log:
+                    log.info("skip %s of %s, not needed on %s", step['action'], step['column'], engine.dialect.name)
+                continue
+            if log:
+                log.info("apply schema step: %s", step['statement'])
+            connection.execute(text(step['statement']))
+
+def backfill_columns(session, cls, data, columns, keys=None, chunk_size=10000):
+    """
+    Writes the values of new columns into the existing, current rows of a table.
+    Rows are matched on the key columns, only the given columns are updated.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session bound to the database.
+        cls: Mapped table class created by open_table.
+        data (pandas.DataFrame): Frame holding the key columns and the new columns.
+        columns (list): Columns to backfill.
+        keys (list, optional): Columns identifying a row. Defaults to the non-float schema
+            columns present in data, without the backfilled columns.
+        chunk_size (int): Rows per UPDATE batch.
+
+    Returns:
+        int: Number of updated rows.
+    """
+    table = cls.__table__
+    if keys is None:
+        keys = [name for name in cls.__column_names__
+                if name in data.columns and name not in columns
+                and not isinstance(table.c[name].type, (sqltypes.Float, sqltypes.Numeric))]
+
+    # Ids of the current rows with their keys, matched against the frame in pandas
+    result = session.execute(select(table.c.id, *[table.c[key] for key in keys]).where(table.c.expiry_date.is_(None)))
+    existing = pd.DataFrame(result.all(), columns=['id'] + keys)
+    matched = existing.merge(data[keys + list(columns)].drop_duplicates(subset=keys), on=keys, how='inner')
+
+    statement = (update(table)
+                 .where(table.c.id == bindparam('_id'))
+                 .values({name: bindparam(f"_{name}") for name in columns}))
+    payload = matched[['id'] + list(columns)].rename(columns={'id': '_id', **{name: f"_{name}" for name in columns}})
+    records = payload.astype(object).where(payload.notna(), None).to_dict(orient='records')
+
+    for start in range(0, len(records), chunk_size):
+        session.execute(statement, records[start:start + chunk_size])
+    if records:
+        bump_generation(session, table.name)
+    session.commit()
+    return len(records)
@@ -0,0 +1,449 @@
+# pylint: disable=line-too-long
+"""
+Read-only HTTP service over the wifor_platform database.
+
+Serves the tables of the JSON definitions, group-by aggregates and choropleth exports to
+local tools, so they do not have to open their own connections. Started with:
+
+    poetry run wifor-serve --port 8765
+
+Endpoints (GET and HEAD only):
+    /tables                           Table names and their columns.
+    /tables/<name>                    Current rows, ordered by id, one page per request.
+    /tables/<name>/aggregate          Values aggregated by dimensions, e.g.
+                                      ?group_by=nuts_id,year&value=employed&agg=sum
+    /geo/<name>?level=2               GeoJSON of the table joined onto the NUTS geometries (see geo_data.geo_export).
+
+Query parameters:
+    columns=a,b          Columns to return, defaults to all schema columns without geometries.
+    <column>=<value>     Filter, repeated parameters filter on any of the values.
+    exclude_flags=uc     Leave out rows with these Eurostat flags.
+    after=<id>, limit=n  Keyset pagination: rows with an id above after, at most limit of them.
+                         The next page is announced in the Link and X-Next-After headers.
+    format=ndjson|arrow  Newline-delimited JSON (default) or an Arrow IPC stream (needs pyarrow).
+
+Responses are written with chunked transfer encoding in batches of BATCH_ROWS rows, so large
+pages are never held in memory as a whole. Every response carries an ETag built from the load
+generation of the table (see generations.load_generation) and the request: clients and proxies
+revalidate with If-None-Match and get a 304 without any rows being read while the table is
+unchanged. Recently served bodies up to RESPONSE_CACHE_BYTES are kept by ETag and replayed
+without serializing the rows again.
+"""
+
+# Standard library imports
+import os
+import glob
+import json
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# Third-party imports
+import pandas as pd
+from sqlalchemy import func, inspect
+
+# Local application imports
+from wifor_db import _env_cache, open_log, close_log
+from wifor_db.sql_handler import TABLE_CONNECTOR, build_frame_query
+from wifor_db.generations import load_generation
+from wifor_db.spatial import geometry_columns
+from geo_data.geo_export import geometry_set, join_geometries, iter_geojson, values_frame
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+DEFAULT_PAGE_SIZE = 10000
+MAX_PAGE_SIZE = 100000
+BATCH_ROWS = 5000
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+
+RESERVED_PARAMETERS = {'columns', 'after', 'limit', 'format', 'exclude_flags', 'group_by', 'value', 'agg',
+                       'level', 'crs', 'simplify'}
+AGGREGATES = {'sum': func.sum, 'mean': func.avg, 'min': func.min, 'max': func.max, 'count': func.count}
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+class RequestError(Exception):
+    """Error with the HTTP status returned to the client."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ResponseCache:
+    """Serialized response bodies by ETag, least recently used bodies are dropped first."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag):
+        with self._lock:
+            if etag not in self._bodies:
+                return None
+            self._bodies.move_to_end(etag)
+            return self._bodies[etag]
+
+    def put(self, etag, headers, chunks):
+        size = sum(len(chunk) for chunk in chunks)
+        with self._lock:
+            if size > self.max_bytes or etag in self._bodies:
+                return
+            self._bodies[etag] = (headers, chunks)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, dropped) = self._bodies.popitem(last=False)
+                self.size -= sum(len(chunk) for chunk in dropped)
+
+class _ChunkSink:
+    """File-like target of the Arrow stream writer that collects the written bytes."""
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        if len(batch):
+            yield (batch.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n').encode('utf-8')
+
+def _arrow_chunks(batches, columns):
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    for batch in batches:
+        if writer is None:
+            schema = pa.Schema.from_pandas(batch, preserve_index=False)
+            writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+        writer.write_batch(pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False))
+        yield sink.drain()
+    if writer is None:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), pa.Schema.from_pandas(pd.DataFrame(columns=columns), preserve_index=False))
+    writer.close()
+    yield sink.drain()
+
+class ReadService:
+    """
+    Table classes, load generations and queries behind the HTTP handler, shared by all threads.
+
+    The connector only maps the table classes. Its session is not thread-safe, so every
+    query runs on a connection of its own from the engine's pool, never on the session.
+    """
+
+    def __init__(self, db_url=None):
+        self.log = open_log("SERVER_LOG")
+        # Database of CURRENT_DB unless another URL is given
+        self.connector = TABLE_CONNECTOR(db_url=db_url).__enter__()
+        self.engine = self.connector.engine
+        self.cache = ResponseCache()
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.connector.__exit__(None, None, None)
+        close_log(self.log)
+
+    @staticmethod
+    def table_names():
+        return sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(_env_cache['CLASS_DIR'], '*.json')))
+
+    def table(self, name):
+        """Mapped class of a table, opened once, as a table class can only be mapped once per connector."""
+        if name not in self.table_names():
+            raise RequestError(404, f"Unknown table: {name}")
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = self.connector.open_table(name)
+        return self._tables[name]
+
+    def generation(self, cls):
+        if not inspect(self.engine).has_table(cls.__tablename__):
+            raise RequestError(404, f"Table {cls.__tablename__} is not loaded")
+        with self.engine.connect() as connection:
+            return load_generation(connection, cls)
+
+    def read(self, statement):
+        """Rows of a statement as one frame, on a connection of its own."""
+        with self.engine.connect() as connection:
+            result = connection.execute(statement)
+            return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+    def stream(self, statement, batch_rows=BATCH_ROWS):
+        """Yields the rows of a statement as frames of batch_rows rows, on a connection of its own."""
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(statement)
+            columns = list(result.keys())
+            for rows in result.partitions(batch_rows):
+                yield pd.DataFrame(rows, columns=columns)
+
+def _columns(cls, parameters):
+    """Requested columns, validated against the schema."""
+    available = ['id'] + [name for name in cls.__column_names__ if name not in {column.name for column in geometry_columns(cls.__table__)}]
+    if 'columns' not in parameters:
+        return available
+    columns = [column for value in parameters['columns'] for column in value.split(',') if column]
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise RequestError(400, f"Unknown columns: {unknown}")
+    return columns
+
+def _convert(value, python_type):
+    """Query parameter value as python_type. Date columns also take a plain year, e.g. year=2023."""
+    if python_type in (date, datetime):
+        value = f"{value}-01-01" if value.isdigit() and len(value) == 4 else value
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+def _filters(cls, parameters):
+    """Filters of the non-reserved query parameters, converted to the column types."""
+    filters = {}
+    for name, values in parameters.items():
+        if name in RESERVED_PARAMETERS:
+            continue
+        if name not in cls.__table__.c:
+            raise RequestError(400, f"Unknown filter column: {name}")
+        python_type = cls.__table__.c[name].type.python_type
+        try:
+            converted = [_convert(value, python_type) for value in values]
+        except (ValueError, TypeError) as error:
+            raise RequestError(400, f"Invalid value for {name}: {error}") from error
+        filters[name] = converted if len(converted) > 1 else converted[0]
+    return filters
+
+def _output_format(parameters):
+    """Requested output format, checked before the headers go out."""
+    output = parameters.get('format', ['ndjson'])[0]
+    if output not in CONTENT_TYPES:
+        raise RequestError(400, f"Unsupported format: {output}")
+    if output == 'arrow' and pa is None:
+        raise RequestError(406, "format=arrow needs pyarrow")
+    return output
+
+def _integer(parameters, name, default):
+    try:
+        return int(parameters[name][0]) if name in parameters else default
+    except ValueError as error:
+        raise RequestError(400, f"{name} must be an integer") from error
+
+class ReadHandler(BaseHTTPRequestHandler):
+    """Handles one request; the ReadService is set on the server."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "wifor-serve"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        self.server.service.log.info("%s - " + format, self.address_string(), *args)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.handle_read(send_body=True)
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        self.handle_read(send_body=False)
+
+    def handle_read(self, send_body):
+        service = self.server.service
+        url = urlsplit(self.path)
+        parameters = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            if parts == ['tables']:
+                body = json.dumps({name: service.table(name).__column_names__ for name in service.table_names()}).encode('utf-8')
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if not self.send_not_modified(etag):
+                    self.send_body(etag, {'Content-Type': 'application/json'}, lambda: [body], send_body)
+            elif (len(parts) == 2 and parts[0] in ('tables', 'geo')) or (len(parts) == 3 and parts[0] == 'tables' and parts[2] == 'aggregate'):
+                cls = service.table(parts[1])
+                route = parts[-1] if len(parts) == 3 else parts[0]
+                # Generation and request identify the response, checked before any rows are read
+                key = json.dumps([route, parts[1], service.generation(cls), sorted(parameters.items())])
+                etag = '"' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '"'
+                if self.send_not_modified(etag):
+                    return
+                # A cached body is replayed with its headers, without building the response again
+                cached = service.cache.get(etag)
+                if cached is not None:
+                    headers, body = cached
+                    self.send_body(etag, headers, lambda: body, send_body, cache=False)
+                    return
+                build = getattr(self, f"build_{route}")
+                content_type, headers, chunks = build(service, cls, parameters)
+                self.send_body(etag, {'Content-Type': content_type, **headers}, chunks, send_body)
+            else:
+                raise RequestError(404, f"Unknown path: {url.path}")
+        except RequestError as error:
+            self.send_error_body(error.status, str(error))
+        except Exception as error:  # pylint: disable=broad-except
+            service.log.exception("request %s failed", self.path)
+            self.send_error_body(500, str(error))
+
+    def build_tables(self, service, cls, parameters):
+        """Page of current rows, after the id given in after."""
+        columns = _columns(cls, parameters)
+        after = _integer(parameters, 'after', 0)
+        limit = min(_integer(parameters, 'limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+        if limit < 1 or after < 0:
+            raise RequestError(400, "limit must be positive and after must not be negative")
+        output = _output_format(parameters)
+
+        # id is needed to announce the next page, it is dropped again if not requested
+        statement = build_frame_query(cls, list(dict.fromkeys(['id'] + columns)), _filters(cls, parameters),
+                                      parameters.get('exclude_flags', [None])[0])
+        statement = statement.where(cls.id > after).order_by(cls.id).limit(limit)
+
+        def batches():
+            for batch in service.stream(statement):
+                yield batch[columns]
+
+        def chunks():
+            return _arrow_chunks(batches(), columns) if output == 'arrow' else _ndjson_chunks(batches())
+
+        # Headers go out before the rows, so the last id of a full page is looked up on the id index first
+        last_statement = build_frame_query(cls, ['id'], _filters(cls, parameters), parameters.get('exclude_flags', [None])[0])
+        last_statement = last_statement.where(cls.id > after).order_by(cls.id).offset(limit - 1).limit(1)
+        with service.engine.connect() as connection:
+            last_id = connection.execute(last_statement).scalar()
+        headers = {}
+        if last_id is not None:
+            query = {name: values for name, values in parameters.items() if name != 'after'}
+            query['after'] = [str(last_id)]
+            headers = {'X-Next-After': str(last_id), 'Link': f'<{urlsplit(self.path).path}?{urlencode(query, doseq=True)}>; rel="next"'}
+        return CONTENT_TYPES[output], headers, chunks
+
+    def build_aggregate(self, service, cls, parameters):
+        """Group-by aggregate of a value column over the current rows."""
+        if 'group_by' not in parameters or 'value' not in parameters:
+            raise RequestError(400, "aggregate needs group_by and value")
+        group_by = [column for value in parameters['group_by'] for column in value.split(',') if column]
+        value = parameters['value'][0]
+        agg = parameters.get('agg', ['sum'])[0]
+        output = _output_format(parameters)
+        unknown = [column for column in group_by + [value] if column not in cls.__column_names__]
+        if unknown:
+            raise RequestError(400, f"Unknown columns: {unknown}")
+        if agg not in AGGREGATES:
+            raise RequestError(400, f"Unsupported aggregate: {agg}, expected one of {sorted(AGGREGATES)}")
+
+        group_columns = [getattr(cls, column) for column in group_by]
+        statement = build_frame_query(cls, group_by, _filters(cls, parameters), parameters.get('exclude_flags', [None])[0])
+        statement = statement.add_columns(AGGREGATES[agg](getattr(cls, value)).label(value)).group_by(*group_columns).order_by(*group_columns)
+        columns = group_by + [value]
+
+        def chunks():
+            batches = service.stream(statement)
+            return _arrow_chunks(batches, columns) if output == 'arrow' else _ndjson_chunks(batches)
+        return CONTENT_TYPES[output], {}, chunks
+
+    def build_geo(self, service, cls, parameters):  # pylint: disable=unused-argument
+        """GeoJSON of the current rows joined onto the region geometries of a NUTS level."""
+        level = _integer(parameters, 'level', None)
+        if level not in (0, 1, 2, 3):
+            raise RequestError(400, "geo needs level=0..3")
+        crs = _integer(parameters, 'crs', 4326)
+        simplify = float(parameters['simplify'][0]) if 'simplify' in parameters else None
+        columns = [column for column in _columns(cls, parameters) if column != 'id']
+
+        # Geometries and values are joined before the headers go out, so missing files end as an error response
+        geometries = geometry_set(level, crs, simplify)
+        statement = build_frame_query(cls, list(dict.fromkeys(['nuts_id'] + columns)), _filters(cls, parameters))
+        data, positions = join_geometries(values_frame(service.read(statement), columns), geometries)
+
+        def chunks():
+            return (part.encode('utf-8') for part in iter_geojson(data, geometries, positions))
+        return 'application/geo+json', {}, chunks
+
+    def send_not_modified(self, etag):
+        """Sends a 304 if If-None-Match holds the ETag, before any rows are read."""
+        if etag not in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return True
+
+    def send_body(self, etag, headers, chunks, send_body, cache=True):
+        """Sends the streamed chunks, bodies up to the cache size are kept by ETag unless cache is False."""
+        response_cache = self.server.service.cache
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if not send_body:
+            # A HEAD response has no body, not even the last chunk
+            return
+
+        written, size = ([], 0) if cache else (None, 0)
+        try:
+            for chunk in chunks():
+                if not chunk:
+                    continue
+                self.wfile.write(f"{len(chunk):X}\r\n".encode('ascii') + chunk + b"\r\n")
+                if written is not None:
+                    written.append(chunk)
+                    size += len(chunk)
+                    written = written if size <= response_cache.max_bytes else None
+        except Exception:  # pylint: disable=broad-except
+            # The 200 is out, so the only way to signal the error is a body without its last chunk
+            self.server.service.log.exception("request %s failed while streaming", self.path)
+            self.close_connection = True
+            return
+        # The body is complete, it is cached before the last chunk lets the client go on
+        if written is not None:
+            response_cache.put(etag, headers, written)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def send_error_body(self, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        # A HEAD response announces the length of the error body without sending it
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+def serve(host='127.0.0.1', port=8765):
+    """Runs the read service until interrupted."""
+    server = ThreadingHTTPServer((host, port), ReadHandler)
+    server.service = ReadService()
+    server.service.log.info("serving on %s:%s", host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+def main(argv=None):
+    """Command line entry point of wifor-serve."""
+    parser = argparse.ArgumentParser(prog="wifor-serve", description="Read-only HTTP service over the wifor_platform database.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# pylint: disable=line-too-long
+"""
+Geometry columns for the tables defined by the JSON schemas.
+
+A column with "type": "Geometry(<srid>)" stores geometries in the table:
+    PostgreSQL:  PostGIS geometry column with SRID and a GIST index. Values are written as hex
+                 EWKB, which PostGIS parses on insert, and come back as hex EWKB.
+    SQLite:      WKB blob column, with an R*Tree virtual table rtree_<table>_<column> holding
+                 the bounding box of every row. The R*Tree module is part of SQLite itself, so
+                 no SpatiaLite extension has to be loadable.
+
+add_data converts the geometry column of a GeoDataFrame to WKB in one vectorized call before
+the bulk insert. read_geo returns a GeoDataFrame and can filter by bounding box or by a
+spatial predicate against a geometry: on PostgreSQL the filter runs in SQL on the GIST index,
+on SQLite the R*Tree preselects the rows whose bounding box matches and the exact predicate
+is evaluated with shapely on those rows only.
+
+Example JSON column:
+    {"name": "geometry", "type": "Geometry(4326)"}
+
+Example read:
+    regions = tc.open_table("REGIONS")
+    bavaria = regions.read_geo(filters={'levl_code': 3}, geometry=bavaria_polygon, predicate='within')
+"""
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from sqlalchemy import event, func, select, text, inspect
+from sqlalchemy.types import UserDefinedType
+from sqlalchemy.ext.compiler import compiles
+
+PREDICATES = ('intersects', 'within', 'contains')
+
+class Geometry(UserDefinedType):
+    """Geometry column type, PostGIS geometry on PostgreSQL and a WKB blob on SQLite."""
+
+    cache_ok = True
+
+    def __init__(self, srid=4326):
+        self.srid = srid
+
+    @property
+    def python_type(self):
+        return bytes
+
+    def get_col_spec(self, **kw):
+        return f"geometry(Geometry,{self.srid})"
+
+    def bind_processor(self, dialect):
+        postgres = dialect.name == 'postgresql'
+        srid = self.srid
+
+        def process(value):
+            # Values converted in bulk by to_wkb_frame pass through unchanged
+            if value is None or isinstance(value, (bytes, str)):
+                return value
+            if postgres:
+                return shapely.to_wkb(shapely.set_srid(value, srid), hex=True, include_srid=True)
+            return shapely.to_wkb(value)
+        return process
+
+@compiles(Geometry, 'sqlite')
+@compiles(Geometry, 'duckdb')
+def _compile_blob_geometry(type_, compiler, **kw):  # pylint: disable=unused-argument
+    return "BLOB"
+
+def geometry_columns(table):
+    """Geometry columns of a table."""
+    return [column for column in table.columns if isinstance(column.type, Geometry)]
+
+def rtree_name(table_name, column_name):
+    return f"rtree_{table_name}_{column_name}".lower()
+
+def spatial_index_statement(dialect_name, table_name, column_name):
+    """DDL of the spatial index of a geometry column, None where the dialect has none."""
+    if dialect_name == 'postgresql':
+        return f'CREATE INDEX IF NOT EXISTS "ix_{table_name}_{column_name}_gist" ON "{table_name}" USING GIST ("{column_name}")'
+    if dialect_name == 'sqlite':
+        return f'CREATE VIRTUAL TABLE IF NOT EXISTS "{rtree_name(table_name, column_name)}" USING rtree(id, minx, maxx, miny, maxy)'
+    return None
+
+def attach_spatial_indexes(table):
+    """Creates the spatial indexes of the geometry columns together with the table."""
+    for column in geometry_columns(table):
+        def create_index(target, connection, column_name=column.name, **kw):  # pylint: disable=unused-argument
+            statement = spatial_index_statement(connection.dialect.name, target.name, column_name)
+            if statement is not None:
+                connection.execute(text(statement))
+        event.listen(table, 'after_create', create_index)
+
+def has_spatial_index(engine, table_name, column_name):
+    """True if the spatial index of a geometry column exists."""
+    inspector = inspect(engine)
+    if engine.dialect.name == 'postgresql':
+        return f"ix_{table_name}_{column_name}_gist" in {index['name'] for index in inspector.get_indexes(table_name)}
+    if engine.dialect.name == 'sqlite':
+        return inspector.has_table(rtree_name(table_name, column_name))
+    return True
+
+def to_wkb_frame(data, table, dialect_name):
+    """
+    Converts the geometry columns of a frame to WKB (hex EWKB on PostgreSQL) in one call per column.
+
+    Args:
+        data (pandas.DataFrame): Frame with the schema columns, geometry columns hold shapely geometries.
+        table (sqlalchemy.Table): Table of the frame.
+        dialect_name (str): Name of the database dialect.
+
+    Returns:
+        pandas.DataFrame: Plain frame with the geometry columns as WKB.
+    """
+    frame = pd.DataFrame({name: np.asarray(data[name]) if isinstance(data[name], gpd.GeoSeries) else data[name]
+                          for name in data.columns}, index=data.index)
+    for column in geometry_columns(table):
+        if column.name not in frame.columns:
+            continue
+        geometries = np.asarray(data[column.name], dtype=object)
+        if dialect_name == 'postgresql':
+            wkb = shapely.to_wkb(shapely.set_srid(geometries, column.type.srid), hex=True, include_srid=True)
+        else:
+            wkb = shapely.to_wkb(geometries)
+        frame[column.name] = wkb
+    return frame
+
+def sync_spatial_index(session, table):
+    """
+    Brings the R*Tree tables of a SQLite table up to date: adds the bounding boxes of rows
+    that are not indexed yet and removes the entries of deleted rows. No-op on other databases.
+    """
+    if session.get_bind().dialect.name != 'sqlite':
+        return
+    for column in geometry_columns(table):
+        rtree = rtree_name(table.name, column.name)
+        rows = session.execute(text(f'SELECT id, "{column.name}" FROM "{table.name}" '
+                                    f'WHERE "{column.name}" IS NOT NULL AND id NOT IN (SELECT id FROM "{rtree}")')).all()
+        if rows:
+            ids = np.array([row[0] for row in rows])
+            bounds = shapely.bounds(shapely.from_wkb([row[1] for row in rows]))
+            records = pd.DataFrame({'id': ids, 'minx': bounds[:, 0], 'maxx': bounds[:, 2],
+                                    'miny': bounds[:, 1], 'maxy': bounds[:, 3]}).to_dict(orient='records')
+            session.execute(text(f'INSERT INTO "{rtree}" (id, minx, maxx, miny, maxy) VALUES (:id, :minx, :maxx, :miny, :maxy)'), records)
+        session.execute(text(f'DELETE FROM "{rtree}" WHERE id NOT IN (SELECT id FROM "{table.name}")'))
+    session.commit()
+
+def read_geo_frame(session, cls, statement, bbox=None, geometry=None, predicate='intersects', geometry_column=None):
+    """
+    Reads a select statement on a table with a geometry column as GeoDataFrame.
+
+    Args:
+        session (sqlalchemy.orm.Session): Session bound to the database.
+        cls: Mapped table class created by open_table.
+        statement (sqlalchemy.Select): Select of the table's columns, e.g. from build_frame_query.
+        bbox (tuple, optional): (minx, miny, maxx, maxy) in the SRID of the column.
+        geometry (shapely.Geometry, optional): Geometry in the SRID of the column the rows are tested against.
+        predicate (str): 'intersects', 'within' or 'contains', applied as predicate(row, geometry).
+        geometry_column (str, optional): Geometry column, defaults to the first one.
+
+    Returns:
+        geopandas.GeoDataFrame: The rows with the column as active geometry.
+    """
+    if predicate not in PREDICATES:
+        raise ValueError(f"Unsupported predicate: {predicate}, expected one of {PREDICATES}")
+    columns = geometry_columns(cls.__table__)
+    if not columns:
+        raise ValueError(f"{cls.__tablename__} has no geometry column")
+    column = cls.__table__.c[geometry_column] if geometry_column else columns[0]
+    if column.name not in statement.selected_columns:
+        statement = statement.add_columns(column)
+
+    if geometry is not None and bbox is None:
+        bbox = geometry.bounds
+    postgres = session.get_bind().dialect.name == 'postgresql'
+
+    if postgres and geometry is not None:
+        # ST_Intersects and friends use the GIST index by themselves
+        other = func.ST_GeomFromWKB(shapely.to_wkb(geometry), column.type.srid)
+        statement = statement.where(getattr(func, f"ST_{predicate.capitalize()}")(column, other))
+    elif postgres and bbox is not None:
+        statement = statement.where(column.op('&&')(func.ST_MakeEnvelope(*bbox, column.type.srid)))
+    elif bbox is not None and session.get_bind().dialect.name == 'sqlite':
+        minx, miny, maxx, maxy = bbox
+        rtree = rtree_name(cls.__tablename__, column.name)
+        matches = select(text("id")).select_from(text(f'"{rtree}"')).where(
+            text("minx <= :maxx AND maxx >= :minx AND miny <= :maxy AND maxy >= :miny").bindparams(
+                minx=minx, miny=miny, maxx=maxx, maxy=maxy))
+        statement = statement.where(cls.id.in_(matches))
+
+    result = session.execute(statement)
+    data = pd.DataFrame(result.all(), columns=list(result.keys()))
+    geometries = shapely.from_wkb(data.pop(column.name).to_numpy())
+    frame = gpd.GeoDataFrame(data, geometry=geometries, crs=f"EPSG:{column.type.srid}")
+
+    if geometry is not None and not postgres:
+        frame = frame[getattr(shapely, predicate)(frame.geometry.to_numpy(), geometry)].reset_index(drop=True)
+    return frame.rename_geometry(column.name) if column.name != 'geometry' else frame
@@ -6,14 +6,49 @@ import traceback
 from collections import defaultdict
 
 # Third-party imports
+import pandas as pd
 import sqlalchemy
-from sqlalchemy import create_engine, inspect, Column, Integer, Date, event, ForeignKey
+from sqlalchemy import create_engine, inspect, select, or_, Column, Integer, Date, Index, Sequence, event, ForeignKey
 from sqlalchemy.orm import relationship, backref, sessionmaker
 from sqlalchemy.orm import Session as _Session
 from sqlalchemy.ext.declarative import declarative_base
 
 # Local application imports
 from wifor_db import _env_cache, open_log, close_log
+from wifor_db.import_metrics import ImportMetrics
+from wifor_db.schema_evolution import diff_schema, apply_schema_steps, backfill_columns
+from wifor_db.model_compiler import compiled_model_factory
+from wifor_db.eurostat_flags import flag_mask
+from wifor_db.labelled_array import LabelledArray, table_dimensions
+from wifor_db import spatial
+from wifor_db import duckdb_backend
+from wifor_db import archive
+from wifor_db.bulk_load import bulk_load_mode
+from wifor_db.parallel_load import parallel_load
+from wifor_db.generations import create_generation_table, bump_generation
+
+def get_db_url_from_env():
+    """
+    Builds the database URL for the database selected with CURRENT_DB.
+
+    Returns:
+        str: SQLAlchemy database URL.
+
+    Raises:
+        ValueError: If CURRENT_DB names an unsupported database.
+    """
+    current_db = _env_cache['CURRENT_DB']
+    if current_db == 'sqlite':
+        db_url = _env_cache['SQLITE_DB_PATH']
+    elif current_db == 'mysql':
+        db_url = f"mysql+pymysql://{_env_cache['MYSQL_DB_USER']}:{_env_cache['MYSQL_DB_PASSWORD']}@{_env_cache['MYSQL_DB_HOST']}/{_env_cache['MYSQL_DB_NAME']}"
+    elif current_db == 'duckdb':
+        db_url = _env_cache['DUCKDB_DB_PATH']
+    elif current_db == 'postgres':
+        db_url = f"postgresql://{_env_cache['POSTGRES_DB_USER']}:{_env_cache['POSTGRES_DB_PASSWORD']}@{_env_cache['POSTGRES_DB_HOST']}:{_env_cache['POSTGRES_DB_PORT']}/{_env_cache['POSTGRES_DB_NAME']}"
+    else:
+        raise ValueError(f"Unsupported database type: {current_db}")
+    return db_url
 
 #############################################################################################
 def update_child_with_foreign_key(session, parent_class, child_class, identifier):
@@ -44,25 +79,95 @@ def update_child_with_foreign_key(session, parent_class, child_class, identifier
     # Perform bulk update
     if update_data:
         session.bulk_update_mappings(child_class, update_data)
+        bump_generation(session, child_table_name)
         session.commit()
 
 # Dynamically add the method to the SQLAlchemy Session class
 _Session.update_child_with_foreign_key = update_child_with_foreign_key
 
+#############################################################################################
+def build_frame_query(cls, columns=None, filters=None, exclude_flags=None, as_of=None):
+    """
+    Builds the select statement behind read_frame for a table class.
+
+    Args:
+        cls: Mapped table class created by open_table.
+        columns (list, optional): Column names to return. Defaults to __column_names__.
+        filters (dict, optional): Column name to value, or to a list of values for an IN filter.
+        exclude_flags (str, optional): Eurostat flag letters, e.g. 'uc'. Rows carrying any of
+            them in their flags bitmask are left out.
+        as_of (datetime.date, optional): Select the row versions valid on this date instead
+            of the current ones.
+
+    Returns:
+        sqlalchemy.sql.Select: Statement selecting the current (not expired) rows, or the rows
+        valid on as_of.
+    """
+    columns = columns or cls.__column_names__
+    statement = select(*[getattr(cls, column) for column in columns])
+
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            statement = statement.where(getattr(cls, column).in_(list(value)))
+        else:
+            statement = statement.where(getattr(cls, column) == value)
+
+    if exclude_flags:
+        statement = statement.where(cls.flags.op('&')(flag_mask(exclude_flags)) == 0)
+
+    if as_of is not None:
+        return statement.where(*as_of_condition(cls, as_of))
+    return statement.where(cls.expiry_date.is_(None))
+
+def as_of_condition(cls, as_of):
+    """
+    Conditions selecting the row versions valid on a date.
+
+    A version is valid from its effective_date up to and including its expiry_date, which
+    update_entries sets to the day before the next version became effective.
+    """
+    if isinstance(as_of, datetime):
+        as_of = as_of.date()
+    return (cls.effective_date <= as_of, or_(cls.expiry_date.is_(None), cls.expiry_date >= as_of))
+
+def id_column(table_name):
+    """
+    Primary key column of the tables. DuckDB has no autoincrement, there the ids come from
+    a sequence per table.
+    """
+    if _env_cache['CURRENT_DB'] == 'duckdb':
+        sequence = Sequence(f"{table_name.lower()}_id_seq")
+        return Column(Integer, sequence, server_default=sequence.next_value(), primary_key=True, nullable=False)
+    return Column(Integer, primary_key=True, autoincrement=True, nullable=False)
+
+def table_args(table_name, identifier):
+    """
+    __table_args__ of the tables, with the index on (identifier, effective_date, expiry_date)
+    that turns as-of reads and history lookups into range scans.
+    """
+    return (Index(f"ix_{table_name}_as_of", identifier, 'effective_date', 'expiry_date'),
+            {'extend_existing': True})
+
 #############################################################################################
 ##################################Class Definition###########################################
 #############################################################################################
 
 class TABLE_CONNECTOR:
-    def __init__(self):
+    def __init__(self, metrics=None, db_url=None):
         self.log = open_log("CONNECTOR_LOG")
+        # Database of CURRENT_DB unless another URL is given, e.g. the staging files of parallel_load
+        self.db_url = db_url
         self.Base = declarative_base()
         self.engine = None
         self.session = None
+        # Stage timings and round trips; pass a shared ImportMetrics to collect a whole run
+        self.metrics = metrics if metrics is not None else ImportMetrics("CONNECTOR")
 
     def __enter__(self):
         self.log.info("OPEN CONNECTOR LOG")
-        self.engine = self.create_engine_from_env()
+        self.engine = create_engine(self.db_url) if self.db_url else self.create_engine_from_env()
+        self.metrics.attach_engine(self.engine)
+        create_generation_table(self.engine)
         self.session = self.create_session(self.engine)
         self.register_before_flush_event(self.session)
         self.log.info("session created")
@@ -73,22 +178,23 @@ class TABLE_CONNECTOR:
         if self.session:
             self.session.close()
             self.log.info("session closed")
+        if self.engine:
+            self.metrics.detach_engine(self.engine)
         if self.log:
             self.log.info("CLOSE CONNECTOR LOG")
             close_log(self.log)
 
+    def bulk_load_mode(self, tables=None):
+        """Context manager relaxing indexes, constraints and durability for full loads, see bulk_load."""
+        return bulk_load_mode(self, tables)
+
+    def parallel_load(self, class_name, data, partition_key, workers=None):
+        """Writes a frame partitioned over a process pool and swaps it in with one commit, see parallel_load."""
+        return parallel_load(self, class_name, data, partition_key, workers)
+
     @staticmethod
     def create_engine_from_env():
-        current_db = _env_cache['CURRENT_DB']
-        if current_db == 'sqlite':
-            db_url = _env_cache['SQLITE_DB_PATH']
-        elif current_db == 'mysql':
-            db_url = f"mysql+pymysql://{_env_cache['MYSQL_DB_USER']}:{_env_cache['MYSQL_DB_PASSWORD']}@{_env_cache['MYSQL_DB_HOST']}/{_env_cache['MYSQL_DB_NAME']}"
-        elif current_db == 'postgres':
-            db_url = f"postgresql://{_env_cache['POSTGRES_DB_USER']}:{_env_cache['POSTGRES_DB_PASSWORD']}@{_env_cache['POSTGRES_DB_HOST']}:{_env_cache['POSTGRES_DB_PORT']}/{_env_cache['POSTGRES_DB_NAME']}"
-        else:
-            raise ValueError(f"Unsupported database type: {current_db}")
-        return create_engine(db_url)
+        return create_engine(get_db_url_from_env())
     
     @staticmethod
     def create_session(engine = create_engine_from_env()):
@@ -108,15 +214,16 @@ class TABLE_CONNECTOR:
 
     @staticmethod
     def parse_type(self, type_str):
+        # Geometry comes from wifor_db.spatial, all other types from sqlalchemy
         if '(' in type_str:
             base_type, params = type_str.split('(')
             param = int(params.rstrip(')'))
-            return getattr(sqlalchemy, base_type)(param)
-        return getattr(sqlalchemy, type_str)
+            return getattr(spatial if base_type == 'Geometry' else sqlalchemy, base_type)(param)
+        return getattr(spatial if type_str == 'Geometry' else sqlalchemy, type_str)
     
     @staticmethod
     def create_repr_string(self, name, columns):
-        self.log.info("""create repr string from
+        self.log.debug("""create repr string from
                       name: %s
                       columns: %s""", name, columns)
         repr_parts = [f"{column['name']}='{{self.{column['name']}}}'" if 'String' in column['type'] else f"{column['name']}={{self.{column['name']}}}" for column in columns]
@@ -126,25 +233,26 @@ class TABLE_CONNECTOR:
     @staticmethod
     def create_class_schema(self, json_data):
         attrs = {'__tablename__': json_data['table_name'],
-                 '__table_args__': {'extend_existing': True},
+                 '__table_args__': table_args(json_data['table_name'], json_data['identifier']),
                  '__unique_identifier__': json_data['identifier'],
                  '__column_names__': [column['name'] for column in json_data["columns"]],
-                 'id': Column(Integer, primary_key=True, autoincrement=True, nullable=False)}
+                 'id': id_column(json_data['table_name'])}
         
         # Add dynamic __repr__ method
         repr_string = self.create_repr_string(self, attrs["__tablename__"], json_data['columns'])
         attrs['__repr__'] = lambda self: repr_string.format(self=self)
 
         for col in json_data['columns']:
-            self.log.info("""parse type for %s: %s""",col, col['type'])
+            self.log.debug("""parse type for %s: %s""",col, col['type'])
             column_type = self.parse_type(self, col['type'])
-            attrs[col['name']] = Column(column_type)
+            server_default = str(col['default']) if 'default' in col else None
+            attrs[col['name']] = Column(column_type, index=col.get('index', False), server_default=server_default)
 
         attrs['version_number'] = Column(Integer, default=1)
         attrs['effective_date'] = Column(Date, default=datetime.now)
         attrs['expiry_date'] = Column(Date, default=None)
 
-        self.log.info("""
+        self.log.debug("""
                       Class schema created:
                        %s""", attrs)
         return attrs
@@ -152,7 +260,7 @@ class TABLE_CONNECTOR:
 #############################################################################################
     def update_entries(self, previous_entry, new_entry):
         """Update the expiry_date of the old entry and version number of new entry."""
-        self.log.info("Update previous entry: %s and new entry: %s", previous_entry, new_entry)
+        self.log.debug("Update previous entry: %s and new entry: %s", previous_entry, new_entry)
         previous_entry.expiry_date = datetime.now() - timedelta(days=1)
         new_entry.version_number = previous_entry.version_number + 1
 
@@ -214,34 +322,156 @@ class TABLE_CONNECTOR:
 
             for cls, new_entries in new_entries_by_class.items():
                 # Bulk check and process entries for each class
-                self.process_new_entries_for_class(session, cls, new_entries)
+                with self.metrics.stage("versioning", cls.__tablename__, rows=len(new_entries)):
+                    self.process_new_entries_for_class(session, cls, new_entries)
 
 #############################################################################################
 
     def add_class_methods(self, cls):
         session = self.session
+        metrics = self.metrics
+        log = self.log
 
         @classmethod
-        def init_table(cls):
+        def init_table(cls, evolve=False):
             engine = session.get_bind()
             if not inspect(engine).has_table(cls.__tablename__):
                 cls.metadata.create_all(engine)
+            elif evolve:
+                cls.evolve_table()
 
         cls.init_table = init_table
 
         @classmethod
-        def add_data(cls, data):
-            filtered_data = data[cls.__column_names__]
+        def schema_diff(cls):
+            return diff_schema(session.get_bind(), cls)
 
-            session.bulk_insert_mappings(cls, filtered_data.to_dict(orient='records'))
-            session.commit()
+        cls.schema_diff = schema_diff
+
+        @classmethod
+        def evolve_table(cls):
+            steps = diff_schema(session.get_bind(), cls)
+            apply_schema_steps(session.get_bind(), steps, log)
+            if any(step['statement'] is not None for step in steps):
+                bump_generation(session, cls.__tablename__)
+                session.commit()
+            return steps
+
+        cls.evolve_table = evolve_table
+
+        @classmethod
+        def backfill(cls, data, columns, keys=None):
+            if spatial.geometry_columns(cls.__table__):
+                data = spatial.to_wkb_frame(data, cls.__table__, session.get_bind().dialect.name)
+            updated = backfill_columns(session, cls, data, columns, keys)
+            spatial.sync_spatial_index(session, cls.__table__)
+            return updated
+
+        cls.backfill = backfill
+
+        @classmethod
+        def add_data(cls, data):
+            table_name = cls.__tablename__
+            has_geometry = bool(spatial.geometry_columns(cls.__table__))
+            use_duckdb = duckdb_backend.is_duckdb(session)
+            with metrics.stage("to_dict", table_name, rows=len(data)):
+                frame = data[cls.__column_names__]
+                if has_geometry:
+                    frame = spatial.to_wkb_frame(frame, cls.__table__, session.get_bind().dialect.name)
+                # DuckDB takes the frame as Arrow table in one INSERT ... SELECT instead of records
+                records = None if use_duckdb else frame.to_dict(orient='records')
+
+            with metrics.stage("insert", table_name, rows=len(frame)):
+                if use_duckdb:
+                    duckdb_backend.insert_frame(session, cls, frame)
+                else:
+                    session.bulk_insert_mappings(cls, records)
+                bump_generation(session, table_name)
+            with metrics.stage("commit", table_name):
+                session.commit()
+            if has_geometry:
+                with metrics.stage("spatial_index", table_name):
+                    spatial.sync_spatial_index(session, cls.__table__)
 
         cls.add_data = add_data
 
-    def open_table(self, class_name):
-        json_data = self.load_class_json(self, class_name)
-        class_attrs = self.create_class_schema(self, json_data)
-        dynamic_class = type(json_data['table_name'], (self.Base,), class_attrs)
+        @classmethod
+        def read_frame(cls, columns=None, filters=None, exclude_flags=None, as_of=None):
+            # Versions valid on as_of may have been moved to the archive by compact_table
+            archived = None if as_of is None else archive.read_archived(cls, as_of, filters, exclude_flags)
+            columns = columns or cls.__column_names__
+            query_columns = columns if archived is None else list(dict.fromkeys(['id'] + list(columns)))
+
+            statement = build_frame_query(cls, query_columns, filters, exclude_flags, as_of)
+            if duckdb_backend.is_duckdb(session):
+                frame = duckdb_backend.read_frame(session, statement)
+            else:
+                result = session.execute(statement)
+                frame = pd.DataFrame(result.all(), columns=list(result.keys()))
+            return frame if archived is None else archive.merge_archived(frame, archived, columns)
+
+        cls.read_frame = read_frame
+
+        @classmethod
+        def history(cls, key, columns=None, include_archived=True):
+            # All versions of the rows of one identifier value (or a list of them), oldest first,
+            # including the versions compact_table moved to the archive
+            columns = list(columns or cls.__column_names__) + ['version_number', 'effective_date', 'expiry_date']
+            identifier = getattr(cls, cls.__unique_identifier__)
+            keys = list(key) if isinstance(key, (list, tuple, set)) else [key]
+            archived = archive.read_archived_history(cls, keys) if include_archived else None
+            order = [cls.__unique_identifier__, 'effective_date', 'version_number', 'id']
+            statement = (select(*[getattr(cls, column) for column in dict.fromkeys(columns + order)])
+                         .where(identifier.in_(keys))
+                         .order_by(*[getattr(cls, column) for column in order]))
+            if duckdb_backend.is_duckdb(session):
+                frame = duckdb_backend.read_frame(session, statement)
+            else:
+                result = session.execute(statement)
+                frame = pd.DataFrame(result.all(), columns=list(result.keys()))
+            if archived is not None:
+                frame = archive.merge_archived(frame, archived, frame.columns)
+                frame = frame.sort_values(order, kind='stable')
+            return frame[columns].reset_index(drop=True)
+
+        cls.history = history
+
+        @classmethod
+        def to_array(cls, value_column=None, dims=None, filters=None, exclude_flags=None):
+            # Dimensions default to the non-float schema columns, see labelled_array
+            schema_dims, value_column = table_dimensions(cls, value_column)
+            dims = dims or schema_dims
+            data = cls.read_frame(columns=dims + [value_column], filters=filters, exclude_flags=exclude_flags)
+            return LabelledArray.from_frame(data, dims, value_column)
+
+        cls.to_array = to_array
+
+        @classmethod
+        def read_geo(cls, columns=None, filters=None, bbox=None, geometry=None, predicate='intersects', geometry_column=None):
+            statement = build_frame_query(cls, columns, filters)
+            return spatial.read_geo_frame(session, cls, statement, bbox, geometry, predicate, geometry_column)
+
+        cls.read_geo = read_geo
+
+    def build_table_class(self, class_name, table_name=None):
+        # Compiled models skip the JSON parsing, see model_compiler
+        factory = None if table_name else compiled_model_factory(class_name)
+        if factory is not None:
+            table_class = factory(self.Base)
+        else:
+            json_data = self.load_class_json(self, class_name)
+            if table_name:
+                # Same schema under another name, e.g. staging tables and views
+                json_data = dict(json_data, table_name=table_name)
+            class_attrs = self.create_class_schema(self, json_data)
+            table_class = type(json_data['table_name'], (self.Base,), class_attrs)
+
+        # GIST index or R*Tree of geometry columns, created together with the table
+        spatial.attach_spatial_indexes(table_class.__table__)
+        return table_class
+
+    def open_table(self, class_name, table_name=None):
+        dynamic_class = self.build_table_class(class_name, table_name)
 
         self.add_class_methods(dynamic_class)
 
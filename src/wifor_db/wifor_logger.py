@@ -1,14 +1,191 @@
 # pylint: disable=line-too-long
 """
 Wifor logger
+
+Loggers opened with open_log hand their records to a queue. A single QueueListener thread
+takes them off the queue, renders them and writes them to one size-rotated file per logger
+name, so a log call on the hot path only appends to an in-memory queue.
+
+Configuration is read from _env_cache:
+    LOG_LEVEL:            default level of all loggers (default INFO).
+    LOG_LEVEL_<NAME>:     level of a single logger, e.g. LOG_LEVEL_CONNECTOR_LOG=DEBUG.
+    LOG_FORMAT:           'json' for one JSON object per line (default) or 'text'.
+    LOG_MAX_BYTES:        size at which a log file is rotated (default 10 MB).
+    LOG_BACKUP_COUNT:     number of rotated files kept (default 5).
+
+Records below the configured level are dropped by the logger before anything is formatted,
+so debug detail costs a level check when it is disabled. Records above it are queued with
+their arguments and formatted on the writer thread.
 """
 import os
+import json
+import queue
+import atexit
 import logging
+import threading
+from multiprocessing import util as multiprocessing_util
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from wifor_db import _env_cache
 
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Shared queue and writer thread of all loggers of the process
+_log_queue = None
+_listener = None
+_listener_lock = threading.Lock()
+# Raised whenever the writer thread goes away, so the handlers know to follow the new one
+_generation = 0
+
+class JsonFormatter(logging.Formatter):
+    """Renders a record as a single line JSON object. Runs on the writer thread."""
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record),
+                 'logger': record.name,
+                 'level': record.levelname,
+                 'message': record.getMessage(),
+                 'module': record.module,
+                 'line': record.lineno,
+                 'thread': record.threadName}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+# Argument types that cannot change after the log call, so they are formatted on the writer thread
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that hands the record to the writer thread unformatted. Message merging,
+    timestamps, JSON rendering and file I/O all run on the writer thread.
+
+    The handler follows the writer thread of the current process: after a fork, or after
+    shutdown_logging, it registers its route with the new writer thread on the next record.
+    """
+
+    def __init__(self, name, log_path):
+        listener = _get_listener()
+        super().__init__(listener.queue)
+        self.route = (name, log_path)
+        self.generation = _generation
+        listener.handlers[0].add_route(name, log_path)
+
+    def prepare(self, record):
+        args = record.args
+        values = args.values() if isinstance(args, dict) else (args or ())
+        # Mutable arguments could change before the writer thread formats them, so only those messages are merged now
+        if not (isinstance(record.msg, str) and all(isinstance(value, IMMUTABLE_ARGS) for value in values)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.generation != _generation:
+            listener = _get_listener()
+            listener.handlers[0].add_route(*self.route)
+            self.queue = listener.queue
+            self.generation = _generation
+        self.queue.put_nowait(record)
+
+class _FileRouter(logging.Handler):
+    """Writer-side handler that sends each record to the rotating file of its logger."""
+
+    def __init__(self):
+        super().__init__()
+        self.file_handlers = {}
+
+    def add_route(self, name, log_path):
+        """Registers the log file of a logger, creating its rotating file handler once."""
+        if name in self.file_handlers:
+            return
+        file_handler = RotatingFileHandler(log_path,
+                                           maxBytes=int(_env_cache.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+                                           backupCount=int(_env_cache.get('LOG_BACKUP_COUNT', 5)),
+                                           encoding="utf-8",
+                                           delay=True)
+        if _env_cache.get('LOG_FORMAT', 'json').lower() == 'text':
+            file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        else:
+            file_handler.setFormatter(JsonFormatter())
+        self.file_handlers[name] = file_handler
+
+    def emit(self, record):
+        file_handler = self.file_handlers.get(record.name)
+        if file_handler is not None:
+            file_handler.handle(record)
+
+    def close(self):
+        for file_handler in self.file_handlers.values():
+            file_handler.close()
+        self.file_handlers.clear()
+        super().close()
+
+def _get_listener():
+    """Starts the shared writer thread on first use and returns it."""
+    # pylint: disable=global-statement
+    global _log_queue, _listener
+    with _listener_lock:
+        if _listener is None:
+            _log_queue = queue.SimpleQueue()
+            _listener = QueueListener(_log_queue, _FileRouter())
+            _listener.start()
+            # Pool workers leave with os._exit, which skips atexit but runs the multiprocessing finalizers
+            multiprocessing_util.Finalize(None, shutdown_logging, exitpriority=0)
+        return _listener
+
+def shutdown_logging():
+    """
+    Writes all queued records and stops the writer thread. Called at interpreter exit;
+    a later open_log starts a new writer thread.
+    """
+    # pylint: disable=global-statement
+    global _log_queue, _listener, _generation
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _log_queue = None
+        _listener = None
+        _generation += 1
+
+def _reset_after_fork():
+    """
+    Forked children do not inherit the writer thread. The handlers copied from the parent
+    start a writer thread of the child's own with their next record.
+    """
+    # pylint: disable=global-statement
+    global _log_queue, _listener, _listener_lock, _generation
+    _log_queue = None
+    _listener = None
+    _listener_lock = threading.Lock()
+    _generation += 1
+
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_log_level(class_name):
+    """
+    Looks up the level of a logger in _env_cache.
+
+    Args:
+        class_name (str): name of the logger.
+
+    Returns:
+        int: LOG_LEVEL_<class_name> if set, else LOG_LEVEL, else logging.INFO.
+    """
+    level_name = _env_cache.get(f"LOG_LEVEL_{class_name.upper()}", _env_cache.get('LOG_LEVEL', 'INFO'))
+    level = logging.getLevelName(str(level_name).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level for {class_name}: {level_name}")
+    return level
+
 def open_log(class_name):
     """
-    Sets up a logger that writes to a file named after the class. 
+    Sets up a logger that writes to a file named after the class.
     The log file is stored in a 'log_files' directory.
 
     Args:
@@ -25,20 +202,18 @@ def open_log(class_name):
     log_path = os.path.join(log_dir, class_name + ".log")
 
     logger = logging.getLogger(class_name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(get_log_level(class_name))
 
     # Check if the logger already has handlers to avoid duplicate logs
     if not logger.handlers:
-        file_handler = logging.FileHandler(log_path)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        logger.addHandler(LazyQueueHandler(class_name, log_path))
 
     return logger
 
 def close_log(logger):
     """
     Closes the logger by removing and closing all its handlers and logs a message before closing.
+    The log file itself stays open on the writer thread until shutdown_logging.
 
     Args:
         logger (logging.Logger): The logger to be closed.
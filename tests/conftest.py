@@ -0,0 +1,61 @@
+"""
+Shared setup of the tests: the environment wifor_db reads on import and fresh SQLite
+databases per test.
+"""
+
+# Standard library imports
+import os
+import sys
+import tempfile
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# wifor_db loads its environment on import, so it has to be set before the first test module
+_TEST_DIR = tempfile.mkdtemp(prefix="wifor_tests_")
+os.environ.setdefault('CLASS_DICT', os.path.join('src', 'wifor_db', 'tables'))
+os.environ.setdefault('LOG_DICT', os.path.join(_TEST_DIR, 'logs'))
+os.environ.setdefault('CURRENT_DB', 'sqlite')
+os.environ.setdefault('SQLITE_DB_PATH', f"sqlite:///{os.path.join(_TEST_DIR, 'wifor.db')}")
+
+# pylint: disable=wrong-import-position
+from wifor_db import _env_cache
+from wifor_db.sql_handler import TABLE_CONNECTOR
+
+EGAN_COLUMNS = ['freq', 'unit', 'sex', 'age', 'citizen', 'nuts_id', 'year', 'employed', 'flags']
+
+def egan_frame(regions=('AT1', 'DE1', 'DE2'), years=range(2018, 2021), offset=0.0):
+    """Small LFSA_EGAN frame with one row per sex, region and year."""
+    frame = pd.MultiIndex.from_product([['F', 'M'], list(regions), [str(year) for year in years]],
+                                       names=['sex', 'nuts_id', 'year']).to_frame(index=False)
+    frame = frame.assign(freq='A', unit='THS_PER', age='Y15-64', citizen='TOTAL')
+    frame['year'] = pd.to_datetime(frame['year'], format='%Y')
+    frame['employed'] = np.arange(len(frame), dtype=np.float64) + offset
+    frame['flags'] = np.int16(0)
+    return frame[EGAN_COLUMNS]
+
+@pytest.fixture(name="make_egan_frame")
+def fixture_make_egan_frame():
+    return egan_frame
+
+@pytest.fixture(name="db_url")
+def fixture_db_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'wifor.db'}"
+
+@pytest.fixture(name="connector")
+def fixture_connector(db_url):
+    with TABLE_CONNECTOR(db_url=db_url) as tc:
+        yield tc
+
+@pytest.fixture(name="archive_dir")
+def fixture_archive_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'archive'
+    monkeypatch.setitem(_env_cache, 'ARCHIVE_DIR', str(directory))
+    return directory
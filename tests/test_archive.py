@@ -0,0 +1,82 @@
+"""Compaction of expired row versions and as-of reads across table and archive."""
+
+# Standard library imports
+from datetime import date
+
+# Third-party imports
+import pandas as pd
+import pytest
+from sqlalchemy import update
+
+# Local application imports
+from wifor_db.archive import compact_table, read_archived
+
+AS_OF = date(2019, 6, 1)
+
+@pytest.fixture(name="egan")
+def fixture_egan(connector, make_egan_frame):
+    """LFSA_EGAN with a current version of every row and an old version of the DE1 rows."""
+    table = connector.open_table("lfsa_egan")
+    table.init_table()
+    old = make_egan_frame(regions=('DE1',), offset=100.0)
+    table.add_data(old)
+    connector.session.execute(update(table.__table__).values(effective_date=date(2019, 1, 1), expiry_date=date(2020, 1, 1)))
+    connector.session.commit()
+    table.add_data(make_egan_frame())
+    return table
+
+def _sorted(frame):
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+def test_compaction_keeps_as_of_reads(connector, egan, archive_dir):
+    before = _sorted(egan.read_frame(as_of=AS_OF))
+    history_before = egan.history("DE1")
+    assert sorted(before['employed']) == sorted(100.0 + value for value in range(6))
+
+    archived = compact_table(connector, egan, retention_days=30)
+
+    assert archived == len(before)
+    assert len(egan.read_frame(as_of=AS_OF, columns=['nuts_id'])) == len(before)
+    pd.testing.assert_frame_equal(_sorted(egan.read_frame(as_of=AS_OF)), before)
+    pd.testing.assert_frame_equal(egan.history("DE1"), history_before)
+    assert len(egan.history("DE1", include_archived=False)) == len(history_before) - archived
+    assert list((archive_dir / "LFSA_EGAN").glob("expiry_year=2020/*.parquet"))
+
+@pytest.mark.usefixtures("archive_dir")
+def test_compaction_moves_only_expired_rows(connector, egan):
+    current = _sorted(egan.read_frame())
+
+    compact_table(connector, egan, retention_days=30)
+
+    pd.testing.assert_frame_equal(_sorted(egan.read_frame()), current)
+    # A second run finds nothing left to archive
+    assert compact_table(connector, egan, retention_days=30) == 0
+
+@pytest.mark.usefixtures("archive_dir")
+def test_read_archived_filters_and_skips_older_partitions(connector, egan):
+    compact_table(connector, egan, retention_days=30)
+
+    archived = read_archived(egan, AS_OF, filters={'sex': 'F'})
+    assert set(archived['sex']) == {'F'}
+    assert len(archived) == 3
+    # The partition of 2020 holds no versions valid after 2020
+    assert read_archived(egan, date(2021, 1, 1)) is None
+
+@pytest.mark.usefixtures("archive_dir")
+def test_read_archived_loads_only_matching_rows(connector, egan, monkeypatch):
+    compact_table(connector, egan, retention_days=30)
+    loaded = []
+    read_parquet = pd.read_parquet
+
+    def counting_read_parquet(path, **kwargs):
+        frame = read_parquet(path, **kwargs)
+        loaded.append(len(frame))
+        return frame
+    monkeypatch.setattr(pd, 'read_parquet', counting_read_parquet)
+
+    archived = read_archived(egan, AS_OF, filters={'sex': ['F'], 'year': pd.Timestamp('2019-01-01')})
+
+    assert archived[['sex', 'nuts_id']].values.tolist() == [['F', 'DE1']]
+    assert sum(loaded) == 1
+    # Nothing is valid on a date before the first version
+    assert read_archived(egan, date(2018, 6, 1)).empty
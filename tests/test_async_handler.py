@@ -0,0 +1,35 @@
+"""AsyncTableConnector: loads and concurrent reads over the async drivers."""
+
+# Standard library imports
+import asyncio
+
+# Third-party imports
+import pytest
+
+# Local application imports
+from wifor_db.async_handler import AsyncTableConnector, get_async_db_url_from_env
+
+pytest.importorskip("aiosqlite")
+
+def test_sync_urls_get_the_async_driver(db_url):
+    assert get_async_db_url_from_env(db_url).drivername == 'sqlite+aiosqlite'
+    assert get_async_db_url_from_env("postgresql+psycopg2://user@host/wifor").drivername == 'postgresql+asyncpg'
+
+def test_load_and_gather_frames(db_url, make_egan_frame):
+    async def run():
+        async with AsyncTableConnector(db_url=db_url) as tc:
+            egan = tc.open_table("lfsa_egan")
+            await egan.init_table()
+            await egan.add_data(make_egan_frame())
+            return await tc.gather_frames({'de': (egan, {'nuts_id': ['DE1', 'DE2']}),
+                                           'at': (egan, {'nuts_id': 'AT1'}, ['nuts_id', 'employed'])})
+
+    frames = asyncio.run(run())
+
+    assert set(frames['de']['nuts_id']) == {'DE1', 'DE2'}
+    assert len(frames['de']) == 12
+    assert frames['at'].columns.tolist() == ['nuts_id', 'employed']
+
+def test_synchronous_load_paths_are_not_offered():
+    assert not hasattr(AsyncTableConnector, 'bulk_load_mode')
+    assert not hasattr(AsyncTableConnector, 'parallel_load')
@@ -0,0 +1,49 @@
+"""Bulk-load mode: relaxed settings during the load, everything restored afterwards."""
+
+# Third-party imports
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.exc import StatementError
+
+@pytest.fixture(name="egan")
+def fixture_egan(connector):
+    table = connector.open_table("lfsa_egan")
+    table.init_table()
+    return table
+
+def _indexes(connector):
+    return {index['name'] for index in inspect(connector.engine).get_indexes("LFSA_EGAN")}
+
+def _pragmas(connector):
+    with connector.engine.connect() as connection:
+        return (connection.exec_driver_sql("PRAGMA synchronous").scalar(),
+                connection.exec_driver_sql("PRAGMA journal_mode").scalar())
+
+def test_mode_drops_and_rebuilds_indexes(connector, egan, make_egan_frame):
+    indexes, pragmas = _indexes(connector), _pragmas(connector)
+    assert "ix_LFSA_EGAN_as_of" in indexes
+
+    with connector.bulk_load_mode(tables=[egan]):
+        assert _indexes(connector) == set()
+        assert _pragmas(connector)[0] == 0
+        egan.add_data(make_egan_frame())
+
+    assert _indexes(connector) == indexes
+    assert _pragmas(connector) == pragmas
+    assert len(egan.read_frame()) == len(make_egan_frame())
+
+def test_failed_load_restores_indexes_and_settings(connector, egan, make_egan_frame):
+    indexes, pragmas = _indexes(connector), _pragmas(connector)
+    frame = make_egan_frame()
+    # SQLite only takes datetime objects for DateTime columns
+    frame['year'] = 'not a date'
+
+    with pytest.raises(StatementError):
+        with connector.bulk_load_mode(tables=[egan]):
+            egan.add_data(frame)
+
+    assert _indexes(connector) == indexes
+    assert _pragmas(connector) == pragmas
+    # The session is usable again
+    egan.add_data(make_egan_frame())
+    assert len(egan.read_frame()) == len(make_egan_frame())
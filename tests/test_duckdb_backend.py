@@ -0,0 +1,59 @@
+"""TABLE_CONNECTOR on CURRENT_DB=duckdb: loads, as-of reads and schema evolution."""
+
+# Standard library imports
+from datetime import date
+
+# Third-party imports
+import pytest
+from sqlalchemy import update, text
+
+# Local application imports
+from wifor_db import _env_cache
+from wifor_db.sql_handler import TABLE_CONNECTOR
+
+pytest.importorskip("duckdb_engine")
+
+@pytest.fixture(name="duck")
+def fixture_duck(tmp_path, monkeypatch):
+    # The id columns take a sequence instead of autoincrement on DuckDB
+    monkeypatch.setitem(_env_cache, 'CURRENT_DB', 'duckdb')
+    with TABLE_CONNECTOR(db_url=f"duckdb:///{tmp_path / 'wifor.duckdb'}") as tc:
+        yield tc
+
+@pytest.fixture(name="egan")
+def fixture_egan(duck, make_egan_frame):
+    table = duck.open_table("lfsa_egan")
+    table.init_table()
+    table.add_data(make_egan_frame(regions=('DE1',), offset=100.0))
+    duck.session.execute(update(table.__table__).values(effective_date=date(2019, 1, 1), expiry_date=date(2020, 1, 1)))
+    duck.session.commit()
+    table.add_data(make_egan_frame())
+    return table
+
+def test_reads_current_and_as_of_rows(egan, make_egan_frame):
+    current = egan.read_frame()
+    assert len(current) == len(make_egan_frame())
+    assert sorted(current['employed']) == sorted(make_egan_frame()['employed'])
+
+    old = egan.read_frame(as_of=date(2019, 6, 30))
+    assert set(old['nuts_id']) == {'DE1'}
+    assert old['employed'].min() == 100.0
+
+def test_created_table_has_no_schema_steps(egan):
+    # VARCHAR has no length in DuckDB, String(255) is no widening of the live column
+    assert egan.schema_diff() == []
+    egan.init_table(evolve=True)
+
+def test_evolve_adds_missing_column_and_index(duck, egan):
+    # DuckDB only drops a column without indexes on the columns after it, the dropped index counts until committed
+    with duck.engine.begin() as connection:
+        connection.execute(text('DROP INDEX "ix_LFSA_EGAN_as_of"'))
+    with duck.engine.begin() as connection:
+        connection.execute(text('ALTER TABLE "LFSA_EGAN" DROP COLUMN flags'))
+
+    steps = [(step['action'], step['column']) for step in egan.schema_diff()]
+    assert steps == [('add_column', 'flags'), ('add_index', 'nuts_id, effective_date, expiry_date')]
+    egan.init_table(evolve=True)
+
+    assert egan.schema_diff() == []
+    assert set(egan.read_frame()['flags']) == {0}
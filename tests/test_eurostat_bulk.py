@@ -0,0 +1,74 @@
+"""Streaming the Eurostat bulk TSV and SDMX-CSV files into long chunks."""
+
+# Standard library imports
+import os
+import gzip
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local application imports
+from wifor_db.eurostat_bulk import stream_dataset
+from wifor_db.eurostat_flags import flag_mask
+from wifor_db.import_metrics import ImportMetrics
+
+TSV = ("freq,unit,sex,geo\\TIME_PERIOD\t2019 \t2020 \n"
+       "A,THS_PER,F,AT1\t1.5 p\t: c\n"
+       "A,THS_PER,F,DE1\t2.0 \t2.5 bu\n"
+       "A,THS_PER,M,DE1\t:\t3.5\n")
+
+SDMX_CSV = ("DATAFLOW,LAST UPDATE,freq,unit,sex,geo,TIME_PERIOD,OBS_VALUE,OBS_FLAG\n"
+            "ESTAT:LFSA_EGAN(1.0),01/01/24 23:00:00,A,THS_PER,F,AT1,2019,1.5,p\n"
+            "ESTAT:LFSA_EGAN(1.0),01/01/24 23:00:00,A,THS_PER,F,AT1,2020,,c\n"
+            "ESTAT:LFSA_EGAN(1.0),01/01/24 23:00:00,A,THS_PER,F,DE1,2019,2.0,\n"
+            "ESTAT:LFSA_EGAN(1.0),01/01/24 23:00:00,A,THS_PER,M,DE1,2019,,\n")
+
+def _write_gzip(path, content):
+    with gzip.open(path, 'wt', encoding="utf-8") as file:
+        file.write(content)
+    return str(path)
+
+def _sorted(frame):
+    return frame.sort_values(['sex', 'nuts_id', 'year']).reset_index(drop=True)
+
+def test_tsv_chunks_are_long_with_values_and_flags(tmp_path):
+    path = _write_gzip(tmp_path / "lfsa_egan.tsv.gz", TSV)
+
+    chunks = list(stream_dataset(path=path, value_name='employed', chunk_rows=2))
+
+    # Two bulk rows per chunk, each expanded to one row per year
+    assert [len(chunk) for chunk in chunks] == [4, 2]
+    long = _sorted(pd.concat(chunks, ignore_index=True))
+    assert long.columns.tolist() == ['freq', 'unit', 'sex', 'nuts_id', 'year', 'employed', 'flags']
+    assert long['nuts_id'].tolist() == ['AT1', 'AT1', 'DE1', 'DE1', 'DE1', 'DE1']
+    assert long['year'].dt.year.tolist() == [2019, 2020, 2019, 2020, 2019, 2020]
+    np.testing.assert_array_equal(long['employed'], [1.5, np.nan, 2.0, 2.5, np.nan, 3.5])
+    assert long['flags'].tolist() == [flag_mask('p'), flag_mask('c'), 0, flag_mask('bu'), 0, 0]
+
+def test_sdmx_csv_matches_tsv(tmp_path):
+    tsv = pd.concat(stream_dataset(path=_write_gzip(tmp_path / "egan.tsv.gz", TSV), value_name='employed',
+                                   drop_missing=True), ignore_index=True)
+    sdmx = pd.concat(stream_dataset(path=_write_gzip(tmp_path / "egan.csv.gz", SDMX_CSV), value_name='employed',
+                                    source_format='sdmx-csv', drop_missing=True), ignore_index=True)
+
+    # The SDMX-CSV file has no 2020 row of DE1, drop_missing drops the empty cells of both
+    expected = _sorted(tsv[tsv['year'].dt.year.eq(2019) | tsv['nuts_id'].eq('AT1')])
+    pd.testing.assert_frame_equal(_sorted(sdmx)[expected.columns], expected, check_dtype=False)
+    assert len(sdmx) == 3
+
+def test_parse_stage_counts_rows_and_bytes(tmp_path):
+    path = _write_gzip(tmp_path / "lfsa_egan.tsv.gz", TSV)
+    metrics = ImportMetrics("test")
+
+    rows = sum(len(chunk) for chunk in stream_dataset(path=path, chunk_rows=1, metrics=metrics))
+
+    record = metrics.records[(path, 'parse')]
+    assert record.rows == rows == 6
+    # Every compressed byte is counted, also those read before the first chunk
+    assert record.bytes == os.path.getsize(path)
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError, match="xml"):
+        next(stream_dataset("lfsa_egan", source_format='xml'))
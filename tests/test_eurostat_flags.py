@@ -0,0 +1,42 @@
+"""Eurostat observation flags as bitmask column."""
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+import pytest
+
+# Local application imports
+from wifor_db.eurostat_flags import FLAG_BITS, flag_mask, flags_to_bitmask, split_value_flags
+
+def test_flag_mask_combines_letters():
+    assert flag_mask('') == 0
+    assert flag_mask('bu') == FLAG_BITS['b'] | FLAG_BITS['u']
+    assert flag_mask(['p', 'p']) == FLAG_BITS['p']
+    with pytest.raises(ValueError, match="x"):
+        flag_mask('px')
+
+def test_flags_to_bitmask():
+    flags = pd.Series(['bu', None, 'p', '', np.nan, 'ub', 'z'])
+
+    bitmask = flags_to_bitmask(flags)
+
+    assert bitmask.dtype == np.int16
+    assert bitmask.tolist() == [flag_mask('bu'), 0, flag_mask('p'), 0, 0, flag_mask('bu'), flag_mask('z')]
+
+def test_split_value_flags_parses_bulk_cells():
+    values, masks = split_value_flags(pd.Series(['12.3 bp', ': c', '7.1', ':', ' 0.5 e ', None]))
+
+    np.testing.assert_array_equal(values, [12.3, np.nan, 7.1, np.nan, 0.5, np.nan])
+    assert masks.tolist() == [flag_mask('bp'), flag_mask('c'), 0, 0, flag_mask('e'), 0]
+
+def test_read_frame_excludes_flagged_rows(connector, make_egan_frame):
+    egan = connector.open_table("lfsa_egan")
+    egan.init_table()
+    frame = make_egan_frame()
+    frame['flags'] = flags_to_bitmask(pd.Series(['u', 'p', 'bu', None, 'c', 'e'] * (len(frame) // 6)))
+    egan.add_data(frame)
+
+    kept = egan.read_frame(exclude_flags='uc')
+
+    assert len(kept) == len(frame) // 6 * 3
+    assert not (kept['flags'] & flag_mask('uc')).any()
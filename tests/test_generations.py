@@ -0,0 +1,56 @@
+"""Load generations raised by every change of a table."""
+
+# Standard library imports
+from datetime import date
+
+# Third-party imports
+import pytest
+from sqlalchemy import update
+
+# Local application imports
+from wifor_db.archive import compact_table
+from wifor_db.generations import load_generation
+
+@pytest.fixture(name="egan")
+def fixture_egan(connector):
+    table = connector.open_table("lfsa_egan")
+    table.init_table()
+    return table
+
+def _generation(connector, table):
+    with connector.engine.connect() as connection:
+        return load_generation(connection, table)
+
+def test_new_table_has_generation_zero(connector, egan):
+    assert _generation(connector, egan) == 0
+
+def test_add_data_and_backfill_raise_the_generation(connector, egan, make_egan_frame):
+    frame = make_egan_frame()
+    egan.add_data(frame)
+    loaded = _generation(connector, egan)
+    assert loaded == 1
+
+    # An update changes neither row count nor ids, the generation still moves on
+    frame['flags'] = 4
+    assert egan.backfill(frame, ['flags']) == len(frame)
+    assert _generation(connector, egan) == loaded + 1
+
+    # Nothing to write, nothing changed
+    assert egan.backfill(frame.iloc[:0], ['flags']) == 0
+    assert _generation(connector, egan) == loaded + 1
+
+@pytest.mark.usefixtures("archive_dir")
+def test_compaction_raises_the_generation(connector, egan, make_egan_frame):
+    egan.add_data(make_egan_frame())
+    connector.session.execute(update(egan.__table__).values(effective_date=date(2019, 1, 1), expiry_date=date(2020, 1, 1)))
+    connector.session.commit()
+    before = _generation(connector, egan)
+
+    compact_table(connector, egan, retention_days=30)
+
+    assert _generation(connector, egan) == before + 1
+
+def test_parallel_load_raises_the_generation(connector, egan, make_egan_frame):
+    connector.parallel_load("lfsa_egan", make_egan_frame(), partition_key='sex', workers=2)
+
+    assert _generation(connector, egan) == 1
@@ -0,0 +1,79 @@
+"""Resuming imports from the checkpoints of ImportCheckpoints."""
+
+# Third-party imports
+import pytest
+
+# Local application imports
+from wifor_db.import_checkpoints import ImportCheckpoints
+
+def _chunks(frame, size):
+    return [frame.iloc[start:start + size].reset_index(drop=True) for start in range(0, len(frame), size)]
+
+def _failing(chunks, fail_at):
+    """Yields the chunks up to fail_at and then fails like an interrupted download."""
+    for number, chunk in enumerate(chunks):
+        if number == fail_at:
+            raise ConnectionError("download interrupted")
+        yield chunk
+
+def _stored(table):
+    return table.read_frame(columns=['id', 'nuts_id', 'year', 'employed']).sort_values('id').reset_index(drop=True)
+
+@pytest.fixture(name="egan")
+def fixture_egan(connector):
+    table = connector.open_table("lfsa_egan")
+    table.init_table()
+    return table
+
+def test_resume_after_failed_chunk_writes_every_row_once(connector, egan, make_egan_frame):
+    chunks = _chunks(make_egan_frame(), 4)
+    checkpoints = ImportCheckpoints(connector)
+
+    with pytest.raises(ConnectionError):
+        checkpoints.load_chunks(egan, "lfsa_egan", _failing(chunks, 2))
+    assert not checkpoints.is_done("lfsa_egan")
+    before = _stored(egan)
+    assert len(before) == 8
+
+    written = checkpoints.load_chunks(egan, "lfsa_egan", chunks, resume=True)
+
+    after = _stored(egan)
+    assert written == sum(len(chunk) for chunk in chunks[2:])
+    assert len(after) == sum(len(chunk) for chunk in chunks)
+    assert not after.duplicated(['nuts_id', 'year', 'employed']).any()
+    # The chunks of the first run are kept, not written again
+    assert after['id'].iloc[:8].tolist() == before['id'].tolist()
+    assert checkpoints.is_done("lfsa_egan")
+
+def test_resume_rewrites_from_the_first_changed_chunk(connector, egan, make_egan_frame):
+    checkpoints = ImportCheckpoints(connector)
+    checkpoints.load_chunks(egan, "lfsa_egan", _chunks(make_egan_frame(), 4))
+
+    revised = make_egan_frame()
+    revised.loc[5, 'employed'] = -1.0
+    written = checkpoints.load_chunks(egan, "lfsa_egan", _chunks(revised, 4), resume=True)
+
+    after = _stored(egan)
+    assert written == len(revised) - 4
+    assert len(after) == len(revised)
+    assert sorted(after['employed']) == sorted(revised['employed'])
+
+def test_resume_skips_complete_dataset(connector, egan, make_egan_frame):
+    chunks = _chunks(make_egan_frame(), 4)
+    checkpoints = ImportCheckpoints(connector)
+    checkpoints.load_chunks(egan, "lfsa_egan", chunks)
+
+    assert checkpoints.load_chunks(egan, "lfsa_egan", chunks, resume=True) == 0
+    assert len(_stored(egan)) == sum(len(chunk) for chunk in chunks)
+
+def test_incomplete_dataset_is_done_only_after_mark_done(connector, egan, make_egan_frame):
+    frame = make_egan_frame()
+    checkpoints = ImportCheckpoints(connector)
+
+    checkpoints.load_chunks(egan, "lfsa_egan", _chunks(frame, 4), complete=False)
+    assert not checkpoints.is_done("lfsa_egan")
+
+    checkpoints.mark_done("lfsa_egan")
+    assert checkpoints.is_done("lfsa_egan")
+    done = connector.session.execute(checkpoints.state.select().where(checkpoints.state.c.chunk == -1)).one()
+    assert done.rows == len(frame)
@@ -0,0 +1,54 @@
+"""Partition-parallel loading with an all-or-nothing swap into the table."""
+
+# Third-party imports
+import pytest
+from sqlalchemy.exc import StatementError
+
+# Local application imports
+from wifor_db.parallel_load import partition_frame
+
+@pytest.fixture(name="egan")
+def fixture_egan(connector):
+    table = connector.open_table("lfsa_egan")
+    table.init_table()
+    return table
+
+def _stored(table):
+    return table.read_frame(columns=['sex', 'nuts_id', 'year', 'employed'])
+
+def test_partitions_are_dealt_whole_and_balanced(make_egan_frame):
+    frame = make_egan_frame(regions=('AT1', 'DE1', 'DE2', 'DE3'))
+
+    partitions = partition_frame(frame, 'nuts_id', 3)
+
+    assert len(partitions) == 3
+    assert sum(len(part) for frames in partitions for part in frames) == len(frame)
+    for frames in partitions:
+        for part in frames:
+            assert part['nuts_id'].nunique() == 1
+    # More workers than partitions leaves no worker without rows
+    assert len(partition_frame(frame, 'sex', 8)) == 2
+
+def test_parallel_load_writes_every_row(connector, egan, make_egan_frame):
+    frame = make_egan_frame(regions=('AT1', 'DE1', 'DE2', 'DE3'))
+
+    rows = connector.parallel_load("lfsa_egan", frame, partition_key='nuts_id', workers=2)
+
+    stored = _stored(egan)
+    assert rows == len(frame)
+    assert len(stored) == len(frame)
+    assert sorted(stored['employed']) == sorted(frame['employed'])
+    assert egan.history("DE1")['version_number'].eq(1).all()
+
+def test_failing_worker_leaves_table_untouched(connector, egan, make_egan_frame):
+    egan.add_data(make_egan_frame(regions=('AT1',)))
+    before = _stored(egan)
+    frame = make_egan_frame(regions=('DE1', 'DE2'))
+    # SQLite only takes datetime objects for DateTime columns, so the worker writing DE2 fails
+    frame['year'] = frame['year'].astype(object)
+    frame.loc[frame['nuts_id'] == 'DE2', 'year'] = 'not a date'
+
+    with pytest.raises(StatementError):
+        connector.parallel_load("lfsa_egan", frame, partition_key='nuts_id', workers=2)
+
+    assert _stored(egan).equals(before)
@@ -0,0 +1,85 @@
+"""Diffing live tables against their JSON schema and evolving them in place."""
+
+# Third-party imports
+import pytest
+from sqlalchemy import MetaData, Table, Column, Integer, SmallInteger, inspect, text
+from sqlalchemy import types as sqltypes
+from sqlalchemy.dialects import mysql, postgresql
+
+# Local application imports
+from wifor_db.schema_evolution import compare_types, _alter_type_statement
+
+def _create_legacy_table(connector, employed_type='INTEGER', year_type='DATETIME'):
+    """LFSA_EGAN as created by an older schema: no flags, narrower types, one row."""
+    with connector.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE "LFSA_EGAN" (id INTEGER PRIMARY KEY, freq VARCHAR(255), unit VARCHAR(255), sex VARCHAR(255), '
+            f'age VARCHAR(255), citizen VARCHAR(255), nuts_id VARCHAR(100), year {year_type}, employed {employed_type}, '
+            'version_number INTEGER, effective_date DATE, expiry_date DATE)'))
+        connection.execute(text(
+            'INSERT INTO "LFSA_EGAN" (freq, unit, sex, age, citizen, nuts_id, year, employed, version_number, effective_date) '
+            "VALUES ('A', 'THS_PER', 'F', 'Y15-64', 'TOTAL', 'DE1', '2020-01-01 00:00:00.000000', 10, 1, '2024-01-01')"))
+
+@pytest.mark.parametrize("live_type, schema_type, expected", [
+    (sqltypes.String(100), sqltypes.String(255), 'widen'),
+    (sqltypes.String(255), sqltypes.String(100), 'incompatible'),
+    (sqltypes.Integer(), sqltypes.BigInteger(), 'widen'),
+    (sqltypes.Integer(), sqltypes.Float(), 'widen'),
+    (sqltypes.Date(), sqltypes.DateTime(), 'widen'),
+    (sqltypes.Float(), sqltypes.DateTime(), 'incompatible'),
+    (sqltypes.SmallInteger(), sqltypes.SmallInteger(), 'equal'),
+    (sqltypes.FLOAT(), sqltypes.Float(), 'equal'),
+    (sqltypes.BigInteger(), sqltypes.Float(), 'incompatible'),
+    (sqltypes.Integer(), sqltypes.REAL(), 'incompatible'),
+    (sqltypes.Integer(), sqltypes.Numeric(5, 2), 'incompatible'),
+    (sqltypes.Integer(), sqltypes.Numeric(12, 2), 'widen'),
+    (sqltypes.Numeric(5, 2), sqltypes.Numeric(8, 3), 'widen'),
+    (sqltypes.Numeric(8, 3), sqltypes.Numeric(8, 4), 'incompatible'),
+    (sqltypes.Numeric(5, 0), sqltypes.Integer(), 'widen'),
+    (sqltypes.Numeric(5, 2), sqltypes.Float(), 'incompatible'),
+    (sqltypes.Float(), sqltypes.Numeric(20, 5), 'incompatible'),
+    (sqltypes.Boolean(), sqltypes.LargeBinary(), 'incompatible'),
+    (sqltypes.JSON(), sqltypes.Boolean(), 'incompatible'),
+    (sqltypes.BOOLEAN(), sqltypes.Boolean(), 'equal'),
+])
+def test_compare_types(live_type, schema_type, expected):
+    assert compare_types(live_type, schema_type) == expected
+
+def test_schema_diff_lists_missing_columns_wider_types_and_indexes(connector):
+    _create_legacy_table(connector)
+    egan = connector.open_table("lfsa_egan")
+
+    steps = {(step['action'], step['column']) for step in egan.schema_diff()}
+
+    assert ('add_column', 'flags') in steps
+    assert ('widen_type', 'nuts_id') in steps
+    assert ('widen_type', 'employed') in steps
+    assert any(action == 'add_index' for action, _ in steps)
+
+def test_evolve_table_adds_columns_with_their_default(connector):
+    _create_legacy_table(connector)
+    egan = connector.open_table("lfsa_egan")
+
+    egan.init_table(evolve=True)
+
+    assert 'flags' in {column['name'] for column in inspect(connector.engine).get_columns("LFSA_EGAN")}
+    # SQLite keeps the declared types, the widenings stay as steps without statement
+    assert all(step['action'] == 'widen_type' and step['statement'] is None for step in egan.schema_diff())
+    stored = egan.read_frame(columns=['nuts_id', 'employed', 'flags'])
+    assert stored.to_dict(orient='records') == [{'nuts_id': 'DE1', 'employed': 10.0, 'flags': 0}]
+
+def test_incompatible_type_change_raises(connector):
+    _create_legacy_table(connector, year_type='FLOAT')
+    egan = connector.open_table("lfsa_egan")
+
+    with pytest.raises(ValueError, match="year"):
+        egan.schema_diff()
+
+def test_mysql_type_change_keeps_not_null_and_default():
+    table = Table("LFSA_EGAN", MetaData(), Column('flags', SmallInteger, nullable=False, server_default='0'))
+
+    statement = _alter_type_statement(mysql.dialect(), table.name, table.c.flags)
+
+    assert statement == "ALTER TABLE `LFSA_EGAN` MODIFY COLUMN flags SMALLINT NOT NULL DEFAULT '0'"
+    assert (_alter_type_statement(postgresql.dialect(), table.name, Column('flags', Integer))
+            == 'ALTER TABLE "LFSA_EGAN" ALTER COLUMN flags TYPE INTEGER')
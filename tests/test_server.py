@@ -0,0 +1,105 @@
+"""Read-only HTTP service: ETags, HEAD, keyset paging and the response cache."""
+
+# Standard library imports
+import json
+import threading
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer
+
+# Third-party imports
+import pytest
+
+# Local application imports
+from wifor_db.server import ReadHandler, ReadService
+
+@pytest.fixture(name="egan")
+def fixture_egan(connector, make_egan_frame):
+    table = connector.open_table("lfsa_egan")
+    table.init_table()
+    table.add_data(make_egan_frame())
+    return table
+
+@pytest.fixture(name="server")
+def fixture_server(db_url, egan):  # pylint: disable=unused-argument
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReadHandler)
+    server.service = ReadService(db_url=db_url)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+    thread.join()
+
+def _request(server, path, method='GET', headers=None):
+    connection = HTTPConnection(*server.server_address, timeout=10)
+    try:
+        connection.request(method, path, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+def _rows(body):
+    return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+def test_if_none_match_returns_not_modified(server):
+    status, headers, body = _request(server, "/tables/lfsa_egan")
+    assert status == 200 and len(_rows(body)) == 18
+
+    status, _, body = _request(server, "/tables/lfsa_egan", headers={'If-None-Match': headers['ETag']})
+
+    assert status == 304
+    assert body == b''
+
+def test_head_has_headers_but_no_body(server):
+    _, get_headers, _ = _request(server, "/tables/lfsa_egan?limit=5")
+
+    status, headers, body = _request(server, "/tables/lfsa_egan?limit=5", method='HEAD')
+    assert status == 200
+    assert body == b''
+    assert headers['ETag'] == get_headers['ETag']
+    assert headers['Link'] == get_headers['Link']
+
+    # Errors of a HEAD request have no body either
+    status, headers, body = _request(server, "/tables/unknown", method='HEAD')
+    assert status == 404
+    assert body == b''
+
+def test_keyset_pages_follow_the_link_header(server):
+    ids, path = [], "/tables/lfsa_egan?columns=nuts_id&limit=7"
+    while path:
+        status, headers, body = _request(server, path)
+        assert status == 200
+        rows = _rows(body)
+        ids.extend(row['nuts_id'] for row in rows)
+        path = headers['Link'][1:headers['Link'].index('>')] if 'Link' in headers else None
+        if path:
+            # id is only read for the next page, not returned
+            assert 'id' not in rows[0] and 'columns=nuts_id' in path
+
+    assert len(ids) == 18
+    status, headers, body = _request(server, "/tables/lfsa_egan?columns=id&after=12")
+    assert [row['id'] for row in _rows(body)] == list(range(13, 19))
+    assert 'Link' not in headers
+
+def test_load_invalidates_etag_and_cached_body(server, egan, make_egan_frame):
+    _, headers, body = _request(server, "/tables/lfsa_egan?columns=nuts_id,employed")
+    assert server.service.cache.get(headers['ETag']) is not None
+
+    egan.backfill(make_egan_frame(offset=100.0), ['employed'])
+
+    status, new_headers, new_body = _request(server, "/tables/lfsa_egan?columns=nuts_id,employed",
+                                             headers={'If-None-Match': headers['ETag']})
+    assert status == 200
+    assert new_headers['ETag'] != headers['ETag']
+    assert min(row['employed'] for row in _rows(new_body)) == 100.0
+    assert new_body != body
+
+@pytest.mark.parametrize("query", ["limit=-1", "limit=0", "limit=ten", "after=-5", "format=xml"])
+def test_bad_paging_parameters_are_rejected(server, query):
+    status, headers, body = _request(server, f"/tables/lfsa_egan?{query}")
+
+    assert status == 400
+    assert headers['Content-Type'] == 'application/json'
+    assert 'error' in json.loads(body)